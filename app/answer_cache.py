@@ -0,0 +1,152 @@
+from collections import OrderedDict
+from typing import Iterable, List, Optional
+from utils import log_message
+import hashlib
+import numpy as np
+import time
+
+def history_digest(messages: Iterable[dict] = (), summary: str = "") -> str:
+    """
+    Digest of the conversation that goes into the prompt besides the question
+    and context, "" without any - only answers to the same history match.
+    """
+    if not messages and not summary:
+        return ""
+    digest = hashlib.sha256(summary.encode("utf-8"))
+    for message in messages:
+        digest.update(f"\x00{message['role']}\x00{message['content']}".encode("utf-8"))
+    return digest.hexdigest()
+
+class _CacheEntry:
+    __slots__ = ("vector", "context_key", "sources", "answer", "generation_seconds", "created_at")
+
+    def __init__(self, vector, context_key, sources, answer, generation_seconds):
+        self.vector = vector
+        self.context_key = context_key
+        self.sources = sources
+        self.answer = answer
+        self.generation_seconds = generation_seconds
+        self.created_at = time.monotonic()
+
+class SemanticAnswerCache:
+    """
+    Answers keyed by query embedding, scoped by the retrieved chunk IDs and
+    the conversation history.
+
+    A cached answer is only reused when the new query's embedding is at least
+    `threshold` cosine-similar to the cached one AND retrieval returned exactly
+    the same chunks AND the history in the prompt (see history_digest) is the
+    same, so the whole prompt apart from the question is identical. Follow-ups
+    in different conversations never share answers. Entries are
+    evicted least-recently-used beyond `max_entries` and expire after `ttl_seconds`.
+    """
+    def __init__(self, threshold: float = 0.95, max_entries: int = 1024, ttl_seconds: float = 3600):
+        self.threshold = threshold
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()   # entry id -> _CacheEntry, least recently used first
+        self._by_context = {}           # context key -> set of entry ids
+        self._next_id = 0
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+    @staticmethod
+    def context_key(chunk_ids: Iterable, history: str = "") -> tuple:
+        return history, tuple(sorted(str(chunk_id) for chunk_id in chunk_ids))
+
+    def lookup(self, query_vector: List[float], chunk_ids: Iterable, history: str = "") -> Optional[str]:
+        candidates = self._by_context.get(self.context_key(chunk_ids, history))
+        if not candidates:
+            self.misses += 1
+            return None
+
+        now = time.monotonic()
+        for entry_id in [e for e in candidates if now - self._entries[e].created_at > self.ttl_seconds]:
+            self._remove(entry_id)
+
+        live = [e for e in candidates if e in self._entries]
+        if not live:
+            self.misses += 1
+            return None
+
+        query = self._normalize(query_vector)
+        matrix = np.stack([self._entries[e].vector for e in live])
+        similarities = matrix @ query
+        best = int(np.argmax(similarities))
+
+        if similarities[best] < self.threshold:
+            self.misses += 1
+            return None
+
+        entry_id = live[best]
+        entry = self._entries[entry_id]
+        self._entries.move_to_end(entry_id)
+        self.hits += 1
+        self.saved_seconds += entry.generation_seconds
+        log_message(
+            f"Answer cache hit (similarity={similarities[best]:.3f}, "
+            f"saved ~{entry.generation_seconds * 1000:.0f}ms)"
+        )
+        return entry.answer
+
+    def store(self, query_vector: List[float], chunk_ids: Iterable, sources: Iterable[str],
+              answer: str, generation_seconds: float, history: str = ""):
+        key = self.context_key(chunk_ids, history)
+        entry_id = self._next_id
+        self._next_id += 1
+
+        self._entries[entry_id] = _CacheEntry(
+            self._normalize(query_vector), key, frozenset(sources), answer, generation_seconds
+        )
+        self._by_context.setdefault(key, set()).add(entry_id)
+
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def invalidate_sources(self, sources: Iterable[str]) -> int:
+        """
+        Drop answers built from chunks of the given sources, plus answers that
+        had no context at all - new documents may now be able to answer them.
+        """
+        sources = set(sources)
+        stale = [
+            entry_id for entry_id, entry in self._entries.items()
+            if not entry.context_key[1] or entry.sources & sources
+        ]
+        for entry_id in stale:
+            self._remove(entry_id)
+
+        if stale:
+            log_message(f"Answer cache: invalidated {len(stale)} entries")
+        return len(stale)
+
+    def clear(self):
+        self._entries.clear()
+        self._by_context.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "latency_saved_ms": round(self.saved_seconds * 1000, 1)
+        }
+
+    def _remove(self, entry_id):
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        ids = self._by_context.get(entry.context_key)
+        if ids is not None:
+            ids.discard(entry_id)
+            if not ids:
+                del self._by_context[entry.context_key]
+
+    @staticmethod
+    def _normalize(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
@@ -1,6 +1,7 @@
 import streamlit as st
 import requests
 import os
+import time
 from utils import log_message
 
 # Initialize session state
@@ -13,7 +14,7 @@ st.title("RAG Demo with Nomic Embeddings & llama3.1")
 API_URL = "http://127.0.0.1:8000"
 INGEST_URL = f"{API_URL}/ingest"
 QA_URL = f"{API_URL}/qa"
-STATUS_URL = f"{API_URL}/status"
+STATUS_URL = f"{API_URL}/ingest"   # GET {STATUS_URL}/{job_id}
 
 if st.session_state.log_messages:
     with st.expander("View Logs"):
@@ -39,9 +40,27 @@ if st.button("Ingest Documents"):
             
             # Call FastAPI ingest endpoint
             response = requests.post(INGEST_URL, files=files, data=data)
-            if response.status_code == 200:
-                result = response.json()
-                st.success(result.get("message", "Documents ingested successfully!"))
+            if response.status_code in (200, 202):
+                job_id = response.json()["job_id"]
+                progress = st.progress(0.0, text="Queued...")
+
+                # Poll the job until it finishes
+                while True:
+                    status = requests.get(f"{STATUS_URL}/{job_id}").json()
+                    total = status.get("chunks_total") or 0
+                    done = status.get("chunks_inserted", 0)
+                    fraction = min(done / total, 1.0) if total else 0.0
+                    progress.progress(fraction, text=f"{status['stage'].capitalize()}... ({done}/{total} chunks)")
+
+                    if status["status"] in ("completed", "failed", "cancelled"):
+                        break
+                    time.sleep(1)
+
+                if status["status"] == "completed":
+                    result = status.get("result") or {}
+                    st.success(result.get("message", "Documents ingested successfully!"))
+                else:
+                    st.error(f"Ingestion {status['status']}: {'; '.join(status.get('errors', []))}")
             else:
                 st.error(f"Error: {response.status_code} - {response.text}")
         except Exception as e:
@@ -1,28 +1,145 @@
-import requests
-from jose import jwt
+"""
+Clerk JWT verification.
+
+The JWKS is fetched asynchronously (never at import), cached for
+JWKS_TTL_SECONDS and refetched early when a token names an unknown `kid`
+(key rotation), at most once per JWKS_MIN_REFRESH_SECONDS. Tokens that
+verified are remembered until their `exp`, so repeat requests with the same
+token skip the JWT parsing and RSA signature check.
+"""
+from collections import OrderedDict
+from jose import jwk, jwt, JWTError
 from fastapi import Request, HTTPException
+from utils import log_message
+from config import (
+    CLERK_ISSUER, CLERK_JWKS_URL, JWKS_TTL_SECONDS, JWKS_MIN_REFRESH_SECONDS, AUTH_TOKEN_CACHE_MAX_ENTRIES
+)
+import aiohttp
+import asyncio
+import hashlib
+import time
+
+class JWKSCache:
+    def __init__(self, url: str, ttl_seconds: float = 3600, min_refresh_seconds: float = 30):
+        self.url = url
+        self.ttl_seconds = ttl_seconds
+        self.min_refresh_seconds = min_refresh_seconds
+        self._keys = {}             # kid -> constructed jose key, parsed once per fetch
+        self._fetched_at = None
+        self._lock = None
+        self._session = None
+
+    async def get_key(self, kid: str):
+        now = time.monotonic()
+        stale = self._fetched_at is None or now - self._fetched_at > self.ttl_seconds
+        # Unknown kid: the signing key may have rotated, but don't let bogus kids hammer Clerk
+        rotated = kid not in self._keys and (
+            self._fetched_at is None or now - self._fetched_at > self.min_refresh_seconds
+        )
+        if stale or rotated:
+            try:
+                await self.refresh()
+            except Exception as e:
+                if not self._keys:
+                    raise
+                log_message(f"JWKS refresh failed, keeping the cached keys: {e}")
+        return self._keys.get(kid)
+
+    async def refresh(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        fetched_at = self._fetched_at
+        async with self._lock:
+            if self._fetched_at != fetched_at:
+                return      # another request refreshed while we waited
+
+            if self._session is None:
+                self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10))
+            async with self._session.get(self.url) as response:
+                response.raise_for_status()
+                jwks = await response.json()
+
+            self._keys = {
+                key["kid"]: jwk.construct(key, key.get("alg", "RS256"))
+                for key in jwks.get("keys", []) if "kid" in key
+            }
+            self._fetched_at = time.monotonic()
+            log_message(f"JWKS refreshed ({len(self._keys)} keys)")
 
-CLERK_ISSUER = "https://darling-beagle-63.clerk.accounts.dev"
-CLERK_JWKS_URL = f"{CLERK_ISSUER}/.well-known/jwks.json"
+    def warm_up(self):
+        """Fetch the keys in the background, called at startup"""
+        async def fetch():
+            try:
+                await self.refresh()
+            except Exception as e:
+                log_message(f"JWKS prefetch failed, will retry on the first request: {e}")
+        return asyncio.create_task(fetch())
 
-jwks = requests.get(CLERK_JWKS_URL).json()
+    async def close(self):
+        if self._session:
+            await self._session.close()
+            self._session = None
 
-def get_current_user(request: Request):
+class VerifiedTokenCache:
+    """Subject of already verified tokens until they expire, least recently used evicted first"""
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max(1, max_entries)
+        self._entries = OrderedDict()   # sha256(token) -> (sub, exp)
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        # Hashed so raw bearer tokens aren't kept around in memory
+        return hashlib.sha256(token.encode("utf-8")).digest()
+
+    def get(self, token: str):
+        key = self._key(token)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        sub, exp = entry
+        if exp is not None and exp <= time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return sub
+
+    def put(self, token: str, sub: str, exp):
+        self._entries[self._key(token)] = (sub, exp)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+jwks_cache = JWKSCache(CLERK_JWKS_URL, JWKS_TTL_SECONDS, JWKS_MIN_REFRESH_SECONDS)
+token_cache = VerifiedTokenCache(AUTH_TOKEN_CACHE_MAX_ENTRIES)
+
+async def get_current_user(request: Request):
     auth = request.headers.get("Authorization")
     if not auth:
         raise HTTPException(status_code=401, detail="Missing token")
 
     token = auth.replace("Bearer ", "")
 
-    header = jwt.get_unverified_header(token)
-    key = next(k for k in jwks["keys"] if k["kid"] == header["kid"])
+    user_id = token_cache.get(token)
+    if user_id is not None:
+        return user_id
+
+    try:
+        header = jwt.get_unverified_header(token)
+        key = await jwks_cache.get_key(header.get("kid"))
+        if key is None:
+            raise HTTPException(status_code=401, detail="Unknown signing key")
 
-    payload = jwt.decode(
-        token,
-        key,
-        algorithms=["RS256"],
-        audience="authenticated",
-        issuer=CLERK_ISSUER
-    )
+        payload = jwt.decode(
+            token,
+            key,
+            algorithms=["RS256"],
+            audience="authenticated",
+            issuer=CLERK_ISSUER
+        )
+    except JWTError as e:
+        raise HTTPException(status_code=401, detail=f"Invalid token: {e}")
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        log_message(f"Could not fetch JWKS: {e}")
+        raise HTTPException(status_code=503, detail="Signing keys unavailable")
 
+    token_cache.put(token, payload["sub"], payload.get("exp"))
     return payload["sub"]  # ✅ Clerk user ID
@@ -0,0 +1,75 @@
+"""
+Embedding throughput benchmark against a local fake Ollama server.
+
+    python bench_embeddings.py --chunks 1500 --batch-sizes 1,16,32,64 --concurrency 1,4,8
+
+batch_size=1 / concurrency=1 is the old one-request-per-chunk serial loop.
+"""
+from embeddings import NomicEmbeddings
+from fake_ollama import FakeOllama, start_fake_ollama
+import argparse
+import asyncio
+import json
+import time
+
+def make_chunks(n, length):
+    base = "Whoever, intending to take dishonestly any movable property out of the possession of any person "
+    return [(f"[{i}] " + base * (length // len(base) + 1))[:length] for i in range(n)]
+
+async def run(args):
+    fake = FakeOllama(args.dimension, args.latency_ms, args.per_item_ms, args.parallel)
+    runner, base_url = await start_fake_ollama(fake)
+    chunks = make_chunks(args.chunks, args.chunk_length)
+    results = []
+
+    try:
+        for batch_size in args.batch_sizes:
+            for concurrency in args.concurrency:
+                embeddings = NomicEmbeddings(
+                    base_url=base_url, batch_size=batch_size, max_concurrency=concurrency
+                )
+                fake.requests = 0
+                start = time.perf_counter()
+                vectors = await embeddings.aembed_documents(chunks)
+                elapsed = time.perf_counter() - start
+                await embeddings.close()
+
+                assert len(vectors) == len(chunks)
+                results.append({
+                    "batch_size": batch_size,
+                    "concurrency": concurrency,
+                    "seconds": round(elapsed, 3),
+                    "chunks_per_sec": round(len(chunks) / elapsed, 1),
+                    "requests": fake.requests
+                })
+    finally:
+        await runner.cleanup()
+
+    baseline = results[0]["seconds"]
+    print(f"\n{args.chunks} chunks, {args.latency_ms}ms/request + {args.per_item_ms}ms/item, server parallel={args.parallel}")
+    print(f"{'batch':>6} {'conc':>5} {'requests':>9} {'seconds':>9} {'chunks/s':>10} {'speedup':>8}")
+    for r in results:
+        print(
+            f"{r['batch_size']:>6} {r['concurrency']:>5} {r['requests']:>9} "
+            f"{r['seconds']:>9.3f} {r['chunks_per_sec']:>10.1f} {baseline / r['seconds']:>7.1f}x"
+        )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+
+def int_list(value):
+    return [int(v) for v in value.split(",")]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark NomicEmbeddings throughput")
+    parser.add_argument("--chunks", type=int, default=1500)
+    parser.add_argument("--chunk-length", type=int, default=1000)
+    parser.add_argument("--batch-sizes", type=int_list, default=[1, 16, 32, 64])
+    parser.add_argument("--concurrency", type=int_list, default=[1, 4, 8])
+    parser.add_argument("--dimension", type=int, default=768)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--per-item-ms", type=float, default=1.0)
+    parser.add_argument("--parallel", type=int, default=4)
+    parser.add_argument("--json", help="Write results to this JSON file")
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,136 @@
+"""
+History endpoint latency vs history size.
+
+    MONGODB_URI=mongodb://localhost:27017 python bench_history.py --sizes 100,1000,10000,100000
+
+Seeds one conversation per size into a scratch database (MONGODB_DB,
+default "bench_history", dropped afterwards unless --keep), creates the
+indexes and times, per size:
+
+    page        newest page of /messages (keyset, projected)
+    deep page   a page from the middle, reached through its cursor
+    unbounded   the old query - every message, full documents
+
+A keyset page is one index range scan, so its latency should stay flat
+while the unbounded read grows with the history. Needs a real Mongo for
+meaningful numbers (mongomock has no indexes).
+"""
+import os
+
+os.environ.setdefault("MONGODB_DB", "bench_history")
+
+from datetime import datetime, timedelta
+from bson import ObjectId
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import db
+import memory
+from pagination import encode_cursor, decode_cursor
+
+USER = "bench_user"
+
+async def seed(conversation_id, size, batch=5000):
+    start = datetime.utcnow() - timedelta(seconds=size)
+    for offset in range(0, size, batch):
+        await db.chat_memory_collection.insert_many([
+            {
+                "_id": ObjectId(),
+                "user_id": USER,
+                "conversation_id": conversation_id,
+                "role": "user" if i % 2 == 0 else "assistant",
+                "content": f"message {i} " + "lorem ipsum dolor sit amet " * 20,
+                "created_at": start + timedelta(seconds=i)
+            }
+            for i in range(offset, min(offset + batch, size))
+        ])
+
+async def timed(fn, runs):
+    times, result = [], None
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = await fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times), result
+
+def response_bytes(messages):
+    return len(json.dumps([{"role": m["role"], "content": m["content"]} for m in messages]))
+
+async def plan_stage(conversation_id):
+    """Winning plan's input stage of the page query, to check the index is used"""
+    try:
+        cursor = db.chat_memory_collection.find(
+            {"user_id": USER, "conversation_id": conversation_id}
+        ).sort([("created_at", -1), ("_id", -1)]).limit(100)
+        plan = (await cursor.explain())["queryPlanner"]["winningPlan"]
+        while "inputStage" in plan:
+            plan = plan["inputStage"]
+        return plan.get("stage", "?")
+    except Exception:
+        return "n/a"
+
+async def main(args):
+    if db.MONGO_DB == "chatdb":
+        raise SystemExit("Refusing to seed and drop the application database, set MONGODB_DB to a scratch one")
+    await db.ensure_indexes()
+    print(f"\n{'messages':>9} {'page ms':>8} {'deep ms':>8} {'unbounded ms':>13} {'page KB':>8} {'unbounded KB':>13} {'plan':>7}")
+    results = []
+    try:
+        for size in args.sizes:
+            conversation_id = f"bench-{size}"
+            await seed(conversation_id, size)
+
+            page_ms, (page, next_after) = await timed(
+                lambda: memory.list_messages(USER, conversation_id, limit=args.limit), args.runs
+            )
+
+            # Walk halfway back through the cursors, then time that page
+            cursor = None
+            for _ in range(max(0, size // args.limit // 2)):
+                _, after = await memory.list_messages(USER, conversation_id, limit=args.limit, cursor=cursor)
+                if after is None:
+                    break
+                cursor = decode_cursor(encode_cursor(after))
+            deep_ms, _ = await timed(
+                lambda: memory.list_messages(USER, conversation_id, limit=args.limit, cursor=cursor), args.runs
+            )
+
+            unbounded_ms, everything = await timed(
+                lambda: db.chat_memory_collection.find(
+                    {"user_id": USER, "conversation_id": conversation_id}
+                ).sort("created_at", 1).to_list(length=None),
+                max(1, args.runs // 5)
+            )
+
+            result = {
+                "messages": size,
+                "page_ms": round(page_ms, 2),
+                "deep_page_ms": round(deep_ms, 2),
+                "unbounded_ms": round(unbounded_ms, 2),
+                "page_kb": round(response_bytes(page) / 1024, 1),
+                "unbounded_kb": round(response_bytes(everything) / 1024, 1),
+                "plan": await plan_stage(conversation_id)
+            }
+            results.append(result)
+            print(
+                f"{size:>9} {result['page_ms']:>8.2f} {result['deep_page_ms']:>8.2f} {result['unbounded_ms']:>13.2f} "
+                f"{result['page_kb']:>8.1f} {result['unbounded_kb']:>13.1f} {result['plan']:>7}"
+            )
+    finally:
+        if not args.keep:
+            await db.client.drop_database(db.MONGO_DB)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=lambda v: [int(x) for x in v.split(",")], default=[100, 1000, 10000, 100000])
+    parser.add_argument("--limit", type=int, default=100, help="page size")
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--keep", action="store_true", help="don't drop the scratch database")
+    parser.add_argument("--json", help="also write the results to this file")
+    asyncio.run(main(parser.parse_args()))
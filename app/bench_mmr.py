@@ -0,0 +1,133 @@
+"""
+Cost and effect of the MMR / rerank selection stage.
+
+    python bench_mmr.py --candidates 20,50,100 --k 3
+    python bench_mmr.py --live --queries eval_queries.jsonl --k 3
+
+Offline (default): synthetic candidate sets where every "page" appears as
+several near-duplicate chunks. Reports the time per mmr() call and how many
+distinct pages end up in the final k with plain top-k vs MMR. With
+--reranker MODEL the cross-encoder's time per candidate set is measured too.
+
+--live runs retrieval against the ingested corpus (Ollama + vector store)
+with the selection stage off and on, and compares recall / MRR against the
+labelled queries, the distinct sources and packed context tokens per
+answer, and the retrieval latency.
+"""
+from rerank import mmr, normalize_scores, CrossEncoderReranker
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import numpy as np
+
+def synthetic_candidates(rng, n, dimension, duplicates):
+    """n candidates from n / duplicates pages, relevance decreasing by page with near-duplicates adjacent"""
+    pages = max(1, n // duplicates)
+    centers = rng.standard_normal((pages, dimension)).astype(np.float32)
+    page_of = np.repeat(np.arange(pages), duplicates)[:n]
+    vectors = centers[page_of] + 0.05 * rng.standard_normal((n, dimension)).astype(np.float32)
+    relevance = np.sort(rng.random(n))[::-1] * 0.2 + (1 - page_of / pages) * 0.8
+    return vectors, relevance, page_of
+
+def offline(args):
+    rng = np.random.default_rng(0)
+    reranker = CrossEncoderReranker(args.reranker) if args.reranker else None
+    print(f"\n{'candidates':>10} {'mmr us':>9} {'pages top-k':>12} {'pages mmr':>10}" + (f" {'rerank ms':>10}" if reranker else ""))
+
+    for n in args.candidates:
+        times, topk_pages, mmr_pages = [], [], []
+        for _ in range(args.runs):
+            vectors, relevance, page_of = synthetic_candidates(rng, n, args.dimension, args.duplicates)
+            start = time.perf_counter()
+            picked = mmr(normalize_scores(relevance), vectors, args.k, args.lambda_mult)
+            times.append(time.perf_counter() - start)
+            topk_pages.append(len(set(page_of[np.argsort(-relevance)[:args.k]])))
+            mmr_pages.append(len(set(page_of[picked])))
+
+        line = (
+            f"{n:>10} {statistics.median(times) * 1e6:>9.0f} "
+            f"{statistics.mean(topk_pages):>12.2f} {statistics.mean(mmr_pages):>10.2f}"
+        )
+        if reranker:
+            texts = [f"candidate passage number {i} about section {i % 7} of the code" for i in range(n)]
+            reranker.score("warm up", texts[:1])
+            start = time.perf_counter()
+            reranker.score("punishment for theft", texts)
+            line += f" {(time.perf_counter() - start) * 1000:>10.1f}"
+        print(line)
+
+def first_relevant_rank(docs, relevant):
+    needles = [r.lower() for r in relevant]
+    for rank, doc in enumerate(docs, start=1):
+        if any(needle in doc.page_content.lower() for needle in needles):
+            return rank
+    return None
+
+async def live(args):
+    from rag_chain import CustomRAGChain
+    from embeddings import NomicEmbeddings
+    from llm import OllamaLLM
+    from prompt_template import PROMPT
+    from rerank import load_reranker
+    from context_packer import pack_context, count_tokens
+
+    chain = CustomRAGChain(NomicEmbeddings(), OllamaLLM(), PROMPT, reranker=load_reranker(args.reranker))
+    with open(args.queries) as f:
+        queries = [json.loads(line) for line in f if line.strip()]
+
+    print(f"\n{len(queries)} labelled queries, k={args.k}")
+    print(f"{'selection':>10} {'recall':>7} {'mrr':>6} {'sources':>8} {'ctx tok':>8} {'p50 ms':>8} {'p95 ms':>8}")
+    results = []
+    for diversify in (False, True):
+        hits, reciprocal_ranks, sources, tokens, latencies = 0, [], [], [], []
+        for item in queries:
+            timings = {}
+            _, docs = await chain._aretrieve(item["query"], k=args.k, timings=timings, diversify=diversify)
+            latencies.append(timings.get("retrieval_ms", 0.0))
+            sources.append(len({d.metadata.get("source") for d in docs}))
+            # After overlap merging, i.e. what the prompt actually pays for
+            tokens.append(count_tokens(pack_context(docs, 10 ** 6)[0]))
+            rank = first_relevant_rank(docs, item["relevant"])
+            hits += bool(rank)
+            reciprocal_ranks.append(1 / rank if rank else 0.0)
+
+        latencies.sort()
+        result = {
+            "selection": "mmr" if diversify else "top-k",
+            "recall": round(hits / len(queries), 3),
+            "mrr": round(statistics.mean(reciprocal_ranks), 3),
+            "distinct_sources": round(statistics.mean(sources), 2),
+            "context_tokens": round(statistics.mean(tokens)),
+            "p50_ms": round(latencies[len(latencies) // 2], 1),
+            "p95_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 1)
+        }
+        results.append(result)
+        print(
+            f"{result['selection']:>10} {result['recall']:>7.3f} {result['mrr']:>6.3f} {result['distinct_sources']:>8.2f} "
+            f"{result['context_tokens']:>8} {result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f}"
+        )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    await chain.embeddings.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--candidates", type=lambda v: [int(x) for x in v.split(",")], default=[20, 50, 100])
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--dimension", type=int, default=768)
+    parser.add_argument("--duplicates", type=int, default=3, help="near-duplicate chunks per synthetic page")
+    parser.add_argument("--lambda-mult", type=float, default=0.7)
+    parser.add_argument("--runs", type=int, default=200)
+    parser.add_argument("--reranker", help="sentence-transformers cross-encoder to time / use")
+    parser.add_argument("--live", action="store_true")
+    parser.add_argument("--queries", default="eval_queries.jsonl")
+    parser.add_argument("--json", help="write the --live results to this file")
+    args = parser.parse_args()
+    if args.live:
+        asyncio.run(live(args))
+    else:
+        offline(args)
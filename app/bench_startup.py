@@ -0,0 +1,96 @@
+"""
+Import-time breakdown of the API server.
+
+    python bench_startup.py --runs 3 --top 20
+
+Imports the module (default: server) in a fresh interpreter with
+`python -X importtime` and reports the wall time, the self time summed per
+top-level package, and the slowest individual imports by cumulative time.
+Reported numbers are the median over --runs. Server startup no longer
+touches Ollama, Milvus or Mongo (that happens in the warm-up), so this is
+all it costs to get to listening.
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+_LINE_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+def import_once(module):
+    """Returns (wall seconds, [(module, self_us, cumulative_us, depth)])"""
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=APP_DIR,
+        capture_output=True,
+        text=True
+    )
+    wall = time.perf_counter() - start
+    if result.returncode != 0:
+        raise SystemExit(f"import {module} failed:\n{result.stderr[-2000:]}")
+
+    entries = []
+    for line in result.stderr.splitlines():
+        match = _LINE_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            entries.append((name, int(self_us), int(cumulative_us), len(indent) // 2))
+    return wall, entries
+
+def main(args):
+    walls, by_package, by_module = [], {}, {}
+    for _ in range(args.runs):
+        wall, entries = import_once(args.module)
+        walls.append(wall)
+
+        packages = {}
+        for name, self_us, cumulative_us, depth in entries:
+            top = name.split(".")[0]
+            packages[top] = packages.get(top, 0) + self_us
+            by_module.setdefault(name, []).append(cumulative_us)
+        for top, total in packages.items():
+            by_package.setdefault(top, []).append(total)
+
+    package_ms = sorted(
+        ((name, statistics.median(values) / 1000) for name, values in by_package.items()),
+        key=lambda item: item[1], reverse=True
+    )
+    module_ms = sorted(
+        ((name, statistics.median(values) / 1000) for name, values in by_module.items()),
+        key=lambda item: item[1], reverse=True
+    )
+    wall_ms = statistics.median(walls) * 1000
+
+    print(f"\nimport {args.module}: {wall_ms:.0f}ms wall (median of {args.runs}, includes interpreter start)")
+    print(f"\n{'package':>28} {'self ms':>9} {'share':>7}")
+    total_ms = sum(ms for _, ms in package_ms) or 1.0
+    for name, ms in package_ms[:args.top]:
+        print(f"{name:>28} {ms:>9.1f} {ms / total_ms * 100:>6.1f}%")
+
+    print(f"\n{'module':>40} {'cumulative ms':>14}")
+    for name, ms in module_ms[:args.top]:
+        print(f"{name:>40} {ms:>14.1f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({
+                "module": args.module,
+                "runs": args.runs,
+                "wall_ms": round(wall_ms, 1),
+                "packages_self_ms": {name: round(ms, 2) for name, ms in package_ms},
+                "modules_cumulative_ms": {name: round(ms, 2) for name, ms in module_ms[:200]}
+            }, f, indent=2)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="server")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--json", help="also write the results to this file")
+    main(parser.parse_args())
@@ -0,0 +1,429 @@
+"""
+End-to-end benchmark of the API with local stand-ins for every service.
+
+    python benchmark.py --users 8 --questions 5 --ingest-docs 6
+
+Starts server.py (uvicorn, separate process) against
+  - fake_ollama.FakeOllama for embeddings and generations (token rate, prefill
+    and per-request latency are configurable),
+  - the in-process FAISS vector store in a temp directory,
+  - mongomock instead of MongoDB,
+  - a local JWKS endpoint, so requests carry real RS256 tokens.
+The fake Ollama also serves the HTML pages that get ingested by URL.
+
+Runs an ingestion workload (POST /ingest, polled until done) and then a
+concurrent QA workload (/qa/stream or /qa), and reports throughput,
+p50/p95/p99 latency and the per-stage timings the server returns. Results
+are written to bench_results/<time>-<commit>.json; pass --compare with an
+earlier file to see the change per metric.
+"""
+from fake_ollama import FakeOllama, start_fake_ollama
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwk, jwt
+from aiohttp import web
+import aiohttp
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(APP_DIR, "bench_results")
+KEY_ID = "bench"
+
+TOPICS = ("arrest", "bail", "search", "summons", "warrant", "inquiry", "evidence", "appeal", "custody", "trial")
+
+# ---- fixtures served next to the fake Ollama API ----
+
+class Fixtures:
+    """RSA key + JWKS for auth and a generated corpus of HTML pages"""
+    def __init__(self, docs, sections_per_doc, seed):
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        self.private_pem = key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption()
+        ).decode()
+        public_pem = key.public_key().public_bytes(
+            serialization.Encoding.PEM,
+            serialization.PublicFormat.SubjectPublicKeyInfo
+        ).decode()
+        self.jwks = {"keys": [{**jwk.construct(public_pem, "RS256").to_dict(), "kid": KEY_ID, "use": "sig"}]}
+        self.docs = docs
+        self.sections_per_doc = sections_per_doc
+        self.seed = seed
+        self.issuer = None
+
+    def token(self, user_id):
+        now = int(time.time())
+        claims = {"sub": user_id, "aud": "authenticated", "iss": self.issuer, "iat": now, "exp": now + 3600}
+        return jwt.encode(claims, self.private_pem, algorithm="RS256", headers={"kid": KEY_ID})
+
+    def page(self, doc_id):
+        rng = random.Random(self.seed * 1000 + doc_id)
+        sections = []
+        for n in range(self.sections_per_doc):
+            number = doc_id * self.sections_per_doc + n + 1
+            topic = rng.choice(TOPICS)
+            words = " ".join(rng.choice(TOPICS + ("court", "officer", "person", "order", "shall")) for _ in range(150))
+            sections.append(f"<h2>Section {number}: {topic}</h2><p>Section {number} deals with {topic}. {words}.</p>")
+        return f"<html><head><title>Code part {doc_id}</title></head><body>{''.join(sections)}</body></html>"
+
+    def question(self, rng):
+        number = rng.randrange(self.docs * self.sections_per_doc) + 1
+        return f"What does section {number} say about {rng.choice(TOPICS)}?"
+
+    def add_routes(self, app):
+        async def jwks_handler(request):
+            return web.json_response(self.jwks)
+
+        async def page_handler(request):
+            return web.Response(text=self.page(int(request.match_info["doc_id"])), content_type="text/html")
+
+        app.router.add_get("/.well-known/jwks.json", jwks_handler)
+        app.router.add_get("/corpus/{doc_id}.html", page_handler)
+
+# ---- server process ----
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_server(port, env, log_path):
+    log_file = open(log_path, "w")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=APP_DIR,
+        env={**os.environ, **env},
+        stdout=log_file,
+        stderr=subprocess.STDOUT
+    )
+    return process, log_file
+
+async def wait_until_ready(session, api_url, process, timeout):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}, see the server log")
+        try:
+            async with session.get(f"{api_url}/readyz") as response:
+                if response.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.5)
+    raise RuntimeError(f"Server not ready after {timeout}s")
+
+# ---- stats ----
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def summarize(values):
+    return {
+        "mean": round(statistics.mean(values), 1) if values else 0.0,
+        "p50": round(percentile(values, 50), 1),
+        "p95": round(percentile(values, 95), 1),
+        "p99": round(percentile(values, 99), 1)
+    }
+
+def summarize_stages(samples):
+    stages = {}
+    for timings in samples:
+        for name, ms in timings.items():
+            stages.setdefault(name, []).append(ms)
+    return {name: summarize(values) for name, values in sorted(stages.items())}
+
+# ---- workloads ----
+
+async def run_ingestion(session, api_url, fixtures_url, args):
+    async def ingest_one(doc_id):
+        start = time.perf_counter()
+        async with session.post(f"{api_url}/ingest", data={"url": f"{fixtures_url}/corpus/{doc_id}.html"}) as response:
+            response.raise_for_status()
+            job_id = (await response.json())["job_id"]
+
+        while True:
+            await asyncio.sleep(args.poll_interval)
+            async with session.get(f"{api_url}/ingest/{job_id}") as response:
+                job = await response.json()
+            if job["status"] in ("completed", "failed", "cancelled"):
+                job["latency_ms"] = (time.perf_counter() - start) * 1000
+                return job
+
+    start = time.perf_counter()
+    jobs = await asyncio.gather(*(ingest_one(doc_id) for doc_id in range(args.ingest_docs)))
+    wall = time.perf_counter() - start
+
+    completed = [job for job in jobs if job["status"] == "completed"]
+    chunks = sum(job["chunks_inserted"] for job in completed)
+    stage_samples = [
+        {f"{stage}_ms": seconds * 1000 for stage, seconds in (job["result"] or {}).get("stage_seconds", {}).items()}
+        for job in completed
+    ]
+    return {
+        "jobs": len(jobs),
+        "completed": len(completed),
+        "failed": len(jobs) - len(completed),
+        "errors": [error for job in jobs for error in job["errors"]][:10],
+        "wall_seconds": round(wall, 3),
+        "chunks": chunks,
+        "chunks_per_second": round(chunks / wall, 1) if wall else 0.0,
+        "jobs_per_second": round(len(completed) / wall, 3) if wall else 0.0,
+        "latency_ms": summarize([job["latency_ms"] for job in jobs]),
+        "stages_ms": summarize_stages(stage_samples)
+    }
+
+async def read_sse(response):
+    """Yield (event, data) pairs of a Server-Sent Events response"""
+    event, data = "message", []
+    async for raw in response.content:
+        line = raw.decode("utf-8").rstrip("\r\n")
+        if not line:
+            if data:
+                yield event, "\n".join(data)
+            event, data = "message", []
+        elif line.startswith("event:"):
+            event = line[6:].strip()
+        elif line.startswith("data:"):
+            data.append(line[5:].strip())
+
+async def ask(session, api_url, headers, conversation_id, question, endpoint):
+    """One QA request, returns a result dict (status, latency_ms, ttft_ms, timings)"""
+    payload = {"question": question, "conversation_id": conversation_id}
+    start = time.perf_counter()
+
+    if endpoint == "plain":
+        async with session.post(f"{api_url}/qa", json=payload, headers=headers) as response:
+            body = await response.json()
+            latency_ms = (time.perf_counter() - start) * 1000
+            if response.status != 200:
+                return {"status": response.status, "latency_ms": latency_ms}
+            return {"status": 200, "latency_ms": latency_ms, "ttft_ms": latency_ms, "timings": body.get("timings", {})}
+
+    async with session.post(f"{api_url}/qa/stream", json=payload, headers=headers) as response:
+        if response.status != 200:
+            await response.read()
+            return {"status": response.status, "latency_ms": (time.perf_counter() - start) * 1000}
+
+        ttft_ms, timings, status = None, {}, 200
+        async for event, data in read_sse(response):
+            if event == "token" and ttft_ms is None:
+                ttft_ms = (time.perf_counter() - start) * 1000
+            elif event == "done":
+                timings = json.loads(data).get("timings", {})
+            elif event == "error":
+                status = 429 if "retry_after" in json.loads(data) else 500
+        latency_ms = (time.perf_counter() - start) * 1000
+        return {"status": status, "latency_ms": latency_ms, "ttft_ms": ttft_ms or latency_ms, "timings": timings}
+
+async def run_qa(session, api_url, fixtures, args):
+    async def user(index):
+        rng = random.Random(args.seed * 7919 + index)
+        headers = {"Authorization": f"Bearer {fixtures.token(f'bench_user_{index}')}"}
+        async with session.post(f"{api_url}/conversations", headers=headers) as response:
+            response.raise_for_status()
+            conversation_id = (await response.json())["conversation_id"]
+
+        results = []
+        for _ in range(args.questions):
+            results.append(await ask(session, api_url, headers, conversation_id, fixtures.question(rng), args.qa_endpoint))
+        return results
+
+    start = time.perf_counter()
+    per_user = await asyncio.gather(*(user(i) for i in range(args.users)))
+    wall = time.perf_counter() - start
+
+    results = [result for user_results in per_user for result in user_results]
+    ok = [r for r in results if r["status"] == 200]
+    return {
+        "endpoint": args.qa_endpoint,
+        "requests": len(results),
+        "completed": len(ok),
+        "rejected": sum(1 for r in results if r["status"] == 429),
+        "errors": sum(1 for r in results if r["status"] not in (200, 429)),
+        "wall_seconds": round(wall, 3),
+        "requests_per_second": round(len(ok) / wall, 2) if wall else 0.0,
+        "latency_ms": summarize([r["latency_ms"] for r in ok]),
+        "ttft_ms": summarize([r["ttft_ms"] for r in ok]),
+        "stages_ms": summarize_stages([r["timings"] for r in ok])
+    }
+
+# ---- reporting ----
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=APP_DIR, text=True).strip()
+    except Exception:
+        return "unknown"
+
+def print_report(report):
+    ingest, qa = report.get("ingest"), report.get("qa")
+    if ingest:
+        print(f"\nIngestion: {ingest['completed']}/{ingest['jobs']} jobs, {ingest['chunks']} chunks "
+              f"in {ingest['wall_seconds']:.2f}s ({ingest['chunks_per_second']:.1f} chunks/s)")
+        print_latency_table({"job latency": ingest["latency_ms"], **ingest["stages_ms"]})
+    if qa:
+        print(f"\nQA ({qa['endpoint']}): {qa['completed']}/{qa['requests']} ok, {qa['rejected']} rejected, "
+              f"{qa['errors']} errors in {qa['wall_seconds']:.2f}s ({qa['requests_per_second']:.2f} req/s)")
+        print_latency_table({"latency": qa["latency_ms"], "ttft": qa["ttft_ms"], **qa["stages_ms"]})
+
+def print_latency_table(rows):
+    print(f"{'ms':>18} {'mean':>9} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for name, s in rows.items():
+        print(f"{name:>18} {s['mean']:>9.1f} {s['p50']:>9.1f} {s['p95']:>9.1f} {s['p99']:>9.1f}")
+
+def print_comparison(previous, current):
+    """Relative change of the headline metrics against an earlier result file"""
+    metrics = [
+        ("ingest", "chunks_per_second", None),
+        ("ingest", "latency_ms", "p95"),
+        ("qa", "requests_per_second", None),
+        ("qa", "latency_ms", "p50"),
+        ("qa", "latency_ms", "p95"),
+        ("qa", "latency_ms", "p99"),
+        ("qa", "ttft_ms", "p50"),
+        ("qa", "ttft_ms", "p95")
+    ]
+    print(f"\nCompared with {previous['meta']['commit']} ({previous['meta']['timestamp']})")
+    for section, name, pct in metrics:
+        before = (previous.get(section) or {}).get(name)
+        after = (current.get(section) or {}).get(name)
+        if pct:
+            before, after = (before or {}).get(pct), (after or {}).get(pct)
+        if not before or after is None:
+            continue
+        label = f"{section}.{name}" + (f".{pct}" if pct else "")
+        print(f"{label:>28} {before:>10.1f} -> {after:>10.1f} ({(after - before) / before * 100:+.1f}%)")
+
+# ----
+
+async def main(args):
+    fixtures = Fixtures(args.ingest_docs, args.sections_per_doc, args.seed)
+    fake = FakeOllama(
+        dimension=args.dimension,
+        latency_ms=args.embed_latency_ms,
+        per_item_ms=args.embed_per_item_ms,
+        parallel=args.parallel,
+        prefill_ms=args.prefill_ms,
+        tokens_per_second=args.tokens_per_second,
+        answer_tokens=args.answer_tokens
+    )
+    # The corpus and JWKS are served by the same app as the fake Ollama API
+    app = fake.create_app()
+    fixtures.add_routes(app)
+    runner, fake_url = await start_fake_ollama(fake, app=app)
+    fixtures.issuer = fake_url
+
+    port = free_port()
+    api_url = f"http://127.0.0.1:{port}"
+    workdir = tempfile.TemporaryDirectory(prefix="rag_bench_")
+    env = {
+        "OLLAMA_BASE_URL": fake_url,
+        "OLLAMA_NUM_PARALLEL": str(args.parallel),
+        "VECTOR_STORE": "faiss",
+        "FAISS_INDEX_DIR": os.path.join(workdir.name, "faiss"),
+        "LEXICAL_INDEX_PATH": os.path.join(workdir.name, "lexical_index.pkl"),
+        "INDEX_PROFILE": args.index_profile,
+        "MONGODB_URI": "mongomock://bench",
+        "CLERK_ISSUER": fake_url,
+        "CLERK_JWKS_URL": f"{fake_url}/.well-known/jwks.json",
+        "ANSWER_CACHE_ENABLED": "true" if args.answer_cache else "false",
+        "LANGCHAIN_TRACING_V2": "false"
+    }
+    log_path = args.server_log or os.path.join(workdir.name, "server.log")
+    process, log_file = start_server(port, env, log_path)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "config": vars(args)
+        }
+    }
+    try:
+        timeout = aiohttp.ClientTimeout(total=600)
+        connector = aiohttp.TCPConnector(limit=0)
+        async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+            await wait_until_ready(session, api_url, process, args.startup_timeout)
+
+            if args.ingest_docs:
+                report["ingest"] = await run_ingestion(session, api_url, fake_url, args)
+            if args.users and args.questions:
+                report["qa"] = await run_qa(session, api_url, fixtures, args)
+
+            async with session.get(f"{api_url}/qa/stats") as response:
+                report["server_stats"] = await response.json()
+        report["fake_ollama"] = {
+            "embed_requests": fake.requests,
+            "embedded_items": fake.items,
+            "generations": fake.generations
+        }
+    except Exception:
+        print(f"Benchmark failed, server log: {log_path}")
+        raise
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        log_file.close()
+        await runner.cleanup()
+        if not args.server_log:
+            workdir.cleanup()
+
+    print_report(report)
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    out_path = args.json or os.path.join(
+        RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{report['meta']['commit']}.json"
+    )
+    with open(out_path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {out_path}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(json.load(f), report)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    # workload
+    parser.add_argument("--users", type=int, default=8, help="concurrent QA users")
+    parser.add_argument("--questions", type=int, default=5, help="questions asked by each user, one after another")
+    parser.add_argument("--qa-endpoint", choices=("stream", "plain"), default="stream")
+    parser.add_argument("--ingest-docs", type=int, default=6, help="pages ingested concurrently before the QA run")
+    parser.add_argument("--sections-per-doc", type=int, default=40)
+    parser.add_argument("--poll-interval", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=0)
+    # fake Ollama
+    parser.add_argument("--dimension", type=int, default=768)
+    parser.add_argument("--embed-latency-ms", type=float, default=20.0)
+    parser.add_argument("--embed-per-item-ms", type=float, default=1.0)
+    parser.add_argument("--prefill-ms", type=float, default=150.0)
+    parser.add_argument("--tokens-per-second", type=float, default=40.0)
+    parser.add_argument("--answer-tokens", type=int, default=120)
+    parser.add_argument("--parallel", type=int, default=4, help="OLLAMA_NUM_PARALLEL of the fake server and the API")
+    # server
+    parser.add_argument("--index-profile", default="hnsw_balanced")
+    parser.add_argument("--answer-cache", action="store_true", help="leave the semantic answer cache on")
+    parser.add_argument("--startup-timeout", type=float, default=120.0)
+    parser.add_argument("--server-log", help="keep the server output in this file")
+    # output
+    parser.add_argument("--json", help="result file (default: bench_results/<time>-<commit>.json)")
+    parser.add_argument("--compare", help="earlier result file to compare against")
+    asyncio.run(main(parser.parse_args()))
@@ -3,11 +3,132 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+# Relative data paths are resolved against this directory, not the working directory
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def _app_path(path: str) -> str:
+    return path if os.path.isabs(path) else os.path.join(APP_DIR, path)
+
 # API Keys
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 MILVUS_URI = os.getenv("MILVUS_URI")
 ZILLIZ_API_KEY = os.getenv("ZILLIZ_API_KEY")
 
+# Clerk auth - the JWKS URL defaults to the issuer's well-known endpoint
+CLERK_ISSUER = os.getenv("CLERK_ISSUER", "https://darling-beagle-63.clerk.accounts.dev")
+CLERK_JWKS_URL = os.getenv("CLERK_JWKS_URL", f"{CLERK_ISSUER}/.well-known/jwks.json")
+JWKS_TTL_SECONDS = float(os.getenv("JWKS_TTL_SECONDS", "3600"))
+JWKS_MIN_REFRESH_SECONDS = float(os.getenv("JWKS_MIN_REFRESH_SECONDS", "30"))   # rate limit for unknown-kid refreshes
+AUTH_TOKEN_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_TOKEN_CACHE_MAX_ENTRIES", "10000"))
+
 # LangChain
 LANGCHAIN_TRACING_V2 = os.getenv("LANGCHAIN_TRACING_V2", "true")
-LANGCHAIN_API_KEY = os.getenv("LANGCHAIN_API_KEY")
\ No newline at end of file
+LANGCHAIN_API_KEY = os.getenv("LANGCHAIN_API_KEY")
+
+# Ollama
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+
+# Embeddings - chunks are sent to Ollama in micro-batches, several batches in flight at once
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "32"))
+EMBED_MAX_CONCURRENCY = int(os.getenv("EMBED_MAX_CONCURRENCY", "4"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "3"))
+
+# QA scheduling - match OLLAMA_NUM_PARALLEL to the value the Ollama server runs with
+OLLAMA_NUM_PARALLEL = int(os.getenv("OLLAMA_NUM_PARALLEL", "4"))
+QA_MAX_QUEUE_DEPTH = int(os.getenv("QA_MAX_QUEUE_DEPTH", "32"))
+# LLM calls of one LangServe /rag/batch request in flight at once (each still takes a scheduler slot)
+RAG_BATCH_CONCURRENCY = int(os.getenv("RAG_BATCH_CONCURRENCY", str(OLLAMA_NUM_PARALLEL)))
+
+# Concurrent identical LLM prompts / query embeddings share one in-flight Ollama request (see singleflight.py)
+SINGLEFLIGHT_ENABLED = os.getenv("SINGLEFLIGHT_ENABLED", "true").lower() == "true"
+
+# Semantic answer cache
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1024"))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+
+# Background ingestion
+INGEST_MAX_WORKERS = int(os.getenv("INGEST_MAX_WORKERS", "2"))
+INGEST_MAX_RETAINED_JOBS = int(os.getenv("INGEST_MAX_RETAINED_JOBS", "200"))
+# Chunks per pipeline batch, and how many batches may wait between stages (backpressure)
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "128"))
+INGEST_QUEUE_DEPTH = int(os.getenv("INGEST_QUEUE_DEPTH", "2"))
+
+# Retrieval - "hybrid" fuses dense (Milvus) and BM25 results, "dense" / "sparse" use one side only
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+RETRIEVAL_K = int(os.getenv("RETRIEVAL_K", "3"))
+RETRIEVAL_FETCH_K = int(os.getenv("RETRIEVAL_FETCH_K", "20"))   # candidates per side before fusion
+# Final k picked from the candidates by maximal marginal relevance (see rerank.py), optionally after a
+# CPU cross-encoder rescored them - skipped for the request if it takes longer than RERANK_BUDGET_MS
+RETRIEVAL_MMR = os.getenv("RETRIEVAL_MMR", "true").lower() == "true"
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))
+RERANKER_MODEL = os.getenv("RERANKER_MODEL", "")
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "200"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+LEXICAL_INDEX_PATH = _app_path(os.getenv("LEXICAL_INDEX_PATH", "data/lexical_index.pkl"))
+
+# Conversation memory - the prompt gets the last HISTORY_RECENT_MESSAGES verbatim, older turns are
+# folded into a rolling per-conversation summary in the background (see summarizer.py). Without
+# summaries nothing stands in for the older turns, so the window stays at the previous 6
+SUMMARY_ENABLED = os.getenv("SUMMARY_ENABLED", "true").lower() == "true"
+HISTORY_RECENT_MESSAGES = int(os.getenv("HISTORY_RECENT_MESSAGES", "4" if SUMMARY_ENABLED else "6"))
+SUMMARY_MAX_WORDS = int(os.getenv("SUMMARY_MAX_WORDS", "150"))
+SUMMARY_MAX_FOLD_MESSAGES = int(os.getenv("SUMMARY_MAX_FOLD_MESSAGES", "20"))
+
+# Chat messages are buffered and written to Mongo in batches (insert_many) every MESSAGE_FLUSH_INTERVAL_MS
+# or once MESSAGE_FLUSH_BATCH are pending; reads merge in the buffer, so they always see their own writes
+MESSAGE_WRITE_BEHIND = os.getenv("MESSAGE_WRITE_BEHIND", "true").lower() == "true"
+MESSAGE_FLUSH_INTERVAL_MS = float(os.getenv("MESSAGE_FLUSH_INTERVAL_MS", "200"))
+MESSAGE_FLUSH_BATCH = int(os.getenv("MESSAGE_FLUSH_BATCH", "100"))
+# Writers wait for a flush once this many messages are buffered (e.g. while Mongo is down)
+MESSAGE_BUFFER_MAX = int(os.getenv("MESSAGE_BUFFER_MAX", "10000"))
+
+# In-process cache of the newest messages and metadata of active conversations, written through by
+# every save - the steady-state QA path reads nothing from Mongo. Single server process only.
+CONVERSATION_CACHE_ENABLED = os.getenv("CONVERSATION_CACHE_ENABLED", "true").lower() == "true"
+CONVERSATION_CACHE_MAX_ENTRIES = int(os.getenv("CONVERSATION_CACHE_MAX_ENTRIES", "1000"))
+CONVERSATION_CACHE_IDLE_SECONDS = float(os.getenv("CONVERSATION_CACHE_IDLE_SECONDS", "1800"))
+
+# QA stages run as a dependency graph (see stage_graph.py); a stage past its timeout is skipped
+# ("history=2,sparse_search=3"), dependents carry on without its result
+QA_STAGE_TIMEOUTS = {
+    name.strip(): float(seconds)
+    for name, seconds in (
+        item.split("=") for item in os.getenv(
+            "QA_STAGE_TIMEOUTS", "embed=10,dense_search=10,sparse_search=5,history=5,summary=5"
+        ).split(",") if item.strip()
+    )
+}
+
+# Prompt assembly (see context_packer.py) - token budget for history + context, history gets at most its share
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "2048"))
+HISTORY_TOKEN_SHARE = float(os.getenv("HISTORY_TOKEN_SHARE", "0.25"))
+# A passage that would be cut below this many tokens is dropped instead
+CONTEXT_MIN_CHUNK_TOKENS = int(os.getenv("CONTEXT_MIN_CHUNK_TOKENS", "32"))
+CHARS_PER_TOKEN = float(os.getenv("CHARS_PER_TOKEN", "4"))
+
+# Vector store backend - "milvus" (server) or "faiss" (in-process, no Docker needed)
+VECTOR_STORE = os.getenv("VECTOR_STORE", "milvus")
+FAISS_INDEX_DIR = _app_path(os.getenv("FAISS_INDEX_DIR", "data/faiss"))
+FAISS_MMAP = os.getenv("FAISS_MMAP", "true").lower() == "true"
+# HNSW and IVF indexes can't remove vectors in place - deletes are tombstones until they are
+# this share of the index, then it is rebuilt (and IVF retrained) without them
+FAISS_COMPACT_RATIO = float(os.getenv("FAISS_COMPACT_RATIO", "0.2"))
+
+# Vector index profile (see index_profiles.py), applied when a collection / index is created
+INDEX_PROFILE = os.getenv("INDEX_PROFILE", "autoindex")
+INDEX_PROFILES_FILE = os.getenv("INDEX_PROFILES_FILE")
+
+# Metrics - also send a Server-Timing header on every /qa response (otherwise only with X-Debug-Timing)
+METRICS_TIMING_HEADER = os.getenv("METRICS_TIMING_HEADER", "false").lower() == "true"
+
+# Logging (see utils.py) - document, prompt and query text is left out unless LOG_DOCUMENT_TEXT is set
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+LOG_SAMPLE_RATE = max(1, int(os.getenv("LOG_SAMPLE_RATE", "100")))
+LOG_DOCUMENT_TEXT = os.getenv("LOG_DOCUMENT_TEXT", "false").lower() == "true"
+
+# Startup warm-up - required steps (embeddings, vector store, Mongo) are retried with backoff until they succeed
+WARMUP_RETRY_SECONDS = float(os.getenv("WARMUP_RETRY_SECONDS", "2"))
+WARMUP_MAX_RETRY_SECONDS = float(os.getenv("WARMUP_MAX_RETRY_SECONDS", "60"))
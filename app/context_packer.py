@@ -0,0 +1,168 @@
+"""
+Token-budgeted prompt assembly.
+
+Retrieved chunks of the same source are merged when they overlap (the
+splitter repeats up to 100 characters between neighbours) or are adjacent
+(consecutive chunk ids, ids are assigned in split order), exact and
+contained duplicates are dropped, and the result is trimmed to fit the
+context budget in rank order. Chat history (the rolling conversation
+summary, then the newest messages) gets its own share of the budget;
+whatever it leaves unused goes to context.
+
+Token counts are estimates (characters / CHARS_PER_TOKEN) - close enough
+for llama3.2 on English legal text, and free to compute.
+"""
+from typing import List, Tuple
+from config import PROMPT_TOKEN_BUDGET, HISTORY_TOKEN_SHARE, CONTEXT_MIN_CHUNK_TOKENS, CHARS_PER_TOKEN
+import math
+
+NO_CONTEXT = "No relevant information found in the knowledge base."
+
+# Shortest suffix/prefix match treated as a splitter overlap rather than coincidence
+_MIN_OVERLAP_CHARS = 20
+_MAX_OVERLAP_CHARS = 300
+
+def count_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+def _overlap(left: str, right: str) -> int:
+    """Length of the longest suffix of `left` that is a prefix of `right`"""
+    for size in range(min(len(left), len(right), _MAX_OVERLAP_CHARS), _MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+class _Group:
+    """Run of merged chunks from one source, ranked by its best member"""
+    __slots__ = ("source", "first_id", "last_id", "text", "rank", "members")
+
+    def __init__(self, doc, rank):
+        chunk_id = doc.metadata.get("id")
+        self.source = doc.metadata.get("source", "unknown")
+        # Only integer ids say anything about adjacency
+        self.first_id = self.last_id = chunk_id if isinstance(chunk_id, int) else None
+        self.text = doc.page_content
+        self.rank = rank
+        self.members = 1
+
+    def absorb(self, other: "_Group") -> bool:
+        if other.source != self.source:
+            return False
+
+        if other.text in self.text:
+            merged = self.text
+        elif self.text in other.text:
+            merged = other.text
+        elif (overlap := _overlap(self.text, other.text)):
+            merged = self.text + other.text[overlap:]
+        elif (overlap := _overlap(other.text, self.text)):
+            merged = other.text + self.text[overlap:]
+        elif self.last_id is not None and other.first_id == self.last_id + 1:
+            merged = f"{self.text}\n{other.text}"
+        elif self.first_id is not None and other.last_id == self.first_id - 1:
+            merged = f"{other.text}\n{self.text}"
+        else:
+            return False
+
+        self.text = merged
+        ids = [i for i in (self.first_id, self.last_id, other.first_id, other.last_id) if i is not None]
+        if ids:
+            self.first_id, self.last_id = min(ids), max(ids)
+        self.rank = min(self.rank, other.rank)
+        self.members += other.members
+        return True
+
+def _merge(docs) -> List[_Group]:
+    groups: List[_Group] = []
+    for rank, doc in enumerate(docs):
+        if not doc.page_content.strip():
+            continue
+        pending = _Group(doc, rank)
+        while True:
+            target = next((group for group in groups if group.absorb(pending)), None)
+            if target is None:
+                groups.append(pending)
+                break
+            # The grown group may now overlap or touch another one
+            groups.remove(target)
+            pending = target
+    return sorted(groups, key=lambda group: group.rank)
+
+def _truncate(text: str, max_tokens: int) -> str:
+    """Cut to roughly `max_tokens`, at a sentence or word boundary where possible"""
+    limit = int(max_tokens * CHARS_PER_TOKEN)
+    if len(text) <= limit:
+        return text
+    cut = text[:limit]
+    boundary = max(cut.rfind(". "), cut.rfind("\n"))
+    if boundary < limit // 2:
+        boundary = cut.rfind(" ")
+    return (cut[:boundary + 1] if boundary > 0 else cut).rstrip() + " …"
+
+def pack_history(messages: List[dict], budget: int, summary: str = "") -> Tuple[str, int]:
+    """Summary of earlier turns, then the newest messages that fit in `budget` tokens in chronological order"""
+    header, used = "", 0
+    if summary:
+        header = _truncate(f"Summary of the earlier conversation: {summary}", budget // 2)
+        used = count_tokens(header) + 1
+
+    lines = []
+    for message in reversed(messages):
+        line = f"{message['role'].capitalize()}: {message['content']}"
+        tokens = count_tokens(line) + 1
+        if used + tokens > budget:
+            break
+        lines.append(line)
+        used += tokens
+    return "\n".join(([header] if header else []) + lines[::-1]), used
+
+def pack_context(docs, budget: int) -> Tuple[str, dict]:
+    groups = _merge(docs)
+    parts, used, truncated, dropped = [], 0, 0, 0
+    for group in groups:
+        tokens = count_tokens(group.text)
+        remaining = budget - used
+        if tokens <= remaining:
+            parts.append(group.text)
+            used += tokens
+        elif remaining >= CONTEXT_MIN_CHUNK_TOKENS:
+            text = _truncate(group.text, remaining)
+            parts.append(text)
+            used += count_tokens(text)
+            truncated += 1
+        else:
+            dropped += group.members
+
+    stats = {
+        "chunks_in": len(docs),
+        "passages": len(parts),
+        "chunks_merged": sum(group.members - 1 for group in groups),
+        "chunks_dropped": dropped,
+        "passages_truncated": truncated
+    }
+    return "\n\n".join(parts), stats
+
+def pack_prompt(prompt_template, question: str, messages: List[dict], docs, summary: str = "",
+                budget: int = PROMPT_TOKEN_BUDGET, history_share: float = HISTORY_TOKEN_SHARE):
+    """
+    Format `prompt_template` with history and context packed into `budget`
+    tokens (the fixed template text and the question come on top).
+    Returns (prompt, stats).
+    """
+    history, history_tokens = pack_history(messages, int(budget * history_share), summary)
+    context, stats = pack_context(docs, budget - history_tokens)
+    if not context:
+        context = NO_CONTEXT
+
+    prompt = prompt_template.format(chat_history=history, context=context, question=question)
+    stats.update(
+        history_messages=len(messages),
+        history_summary=bool(summary),
+        history_tokens=history_tokens,
+        context_tokens=count_tokens(context),
+        prompt_tokens=count_tokens(prompt),
+        unpacked_tokens=count_tokens(
+            "\n".join(m["content"] for m in messages) + "\n\n".join(d.page_content for d in docs)
+        )
+    )
+    return prompt, stats
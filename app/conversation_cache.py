@@ -0,0 +1,136 @@
+from collections import OrderedDict, deque
+import time
+
+# get_conversation() result when the conversation isn't cached - None means "doesn't exist"
+NOT_CACHED = object()
+
+class _ConversationEntry:
+    __slots__ = ("messages", "conversation", "touched_at")
+
+    def __init__(self):
+        self.messages = None            # deque of the newest messages, None until loaded
+        self.conversation = NOT_CACHED  # conversation document (title, summary), None if there is none
+        self.touched_at = time.monotonic()
+
+class CacheLoad:
+    """A fill from Mongo in progress - dirty once the conversation was written meanwhile"""
+    __slots__ = ("key", "dirty")
+
+    def __init__(self, key):
+        self.key = key
+        self.dirty = False
+
+class ConversationCache:
+    """
+    Newest messages and metadata of recently active conversations, keyed
+    by (user_id, conversation_id).
+
+    Filled from Mongo on a miss and kept current by the writers (messages,
+    titles, summaries), so a conversation in steady use is served without
+    reading Mongo. Entries are evicted least-recently-used beyond
+    `max_entries` and after `idle_seconds` without use. Only correct with a
+    single server process - every write has to go through this cache.
+
+    A fill brackets its Mongo read with begin_load() / end_load(); a write
+    landing during the read marks the load dirty and the (possibly stale)
+    result isn't cached.
+    """
+    def __init__(self, max_entries: int = 1000, max_messages: int = 4, idle_seconds: float = 1800):
+        self.max_entries = max(1, max_entries)
+        self.max_messages = max(1, max_messages)
+        self.idle_seconds = idle_seconds
+        self._entries = OrderedDict()   # (user_id, conversation_id) -> _ConversationEntry, least recent first
+        self._loads = {}                # (user_id, conversation_id) -> CacheLoads in progress
+        self.hits = {"messages": 0, "conversation": 0}
+        self.misses = {"messages": 0, "conversation": 0}
+
+    def _get(self, key, create=False):
+        now = time.monotonic()
+        self._evict_idle(now)
+        entry = self._entries.get(key)
+        if entry is None:
+            if not create:
+                return None
+            entry = self._entries[key] = _ConversationEntry()
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        else:
+            self._entries.move_to_end(key)
+        entry.touched_at = now
+        return entry
+
+    def _evict_idle(self, now):
+        # Least recently used first, so stop at the first entry that is still fresh
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if now - entry.touched_at <= self.idle_seconds:
+                break
+            del self._entries[key]
+
+    def begin_load(self, user_id: str, conversation_id: str) -> CacheLoad:
+        load = CacheLoad((user_id, conversation_id))
+        self._loads.setdefault(load.key, set()).add(load)
+        return load
+
+    def end_load(self, load: CacheLoad):
+        loads = self._loads.get(load.key)
+        if loads is not None:
+            loads.discard(load)
+            if not loads:
+                del self._loads[load.key]
+
+    def _written(self, key):
+        for load in self._loads.get(key, ()):
+            load.dirty = True
+
+    def get_messages(self, user_id: str, conversation_id: str, limit: int):
+        """The newest `limit` messages oldest first, or None on a miss"""
+        entry = self._get((user_id, conversation_id))
+        if entry is None or entry.messages is None or limit > self.max_messages:
+            self.misses["messages"] += 1
+            return None
+        self.hits["messages"] += 1
+        return list(entry.messages)[-limit:] if limit > 0 else []
+
+    def set_messages(self, user_id: str, conversation_id: str, messages: list, load: CacheLoad = None):
+        """Fill from Mongo - `messages` are the newest ones, oldest first. Skipped if `load` went dirty"""
+        if load is not None and load.dirty:
+            return
+        entry = self._get((user_id, conversation_id), create=True)
+        entry.messages = deque(messages[-self.max_messages:], maxlen=self.max_messages)
+
+    def add_message(self, user_id: str, conversation_id: str, message: dict):
+        self._written((user_id, conversation_id))
+        # Only conversations already loaded - a partial list would pass for the whole history
+        entry = self._get((user_id, conversation_id))
+        if entry is not None and entry.messages is not None:
+            entry.messages.append(message)
+
+    def get_conversation(self, user_id: str, conversation_id: str):
+        """The conversation document, None if it doesn't exist, NOT_CACHED on a miss"""
+        entry = self._get((user_id, conversation_id))
+        if entry is None or entry.conversation is NOT_CACHED:
+            self.misses["conversation"] += 1
+            return NOT_CACHED
+        self.hits["conversation"] += 1
+        return entry.conversation
+
+    def set_conversation(self, user_id: str, conversation_id: str, conversation, load: CacheLoad = None):
+        if load is not None and load.dirty:
+            return
+        self._get((user_id, conversation_id), create=True).conversation = conversation
+
+    def update_conversation(self, user_id: str, conversation_id: str, fields: dict):
+        self._written((user_id, conversation_id))
+        entry = self._get((user_id, conversation_id))
+        if entry is not None and isinstance(entry.conversation, dict):
+            entry.conversation = {**entry.conversation, **fields}
+
+    def stats(self) -> dict:
+        hits, misses = sum(self.hits.values()), sum(self.misses.values())
+        return {
+            "entries": len(self._entries),
+            "hits": dict(self.hits),
+            "misses": dict(self.misses),
+            "hit_rate": round(hits / (hits + misses), 3) if hits + misses else 0.0
+        }
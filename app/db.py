@@ -1,14 +1,52 @@
-from pymongo import MongoClient
+from motor.motor_asyncio import AsyncIOMotorClient
 from dotenv import load_dotenv
 import os
 
 load_dotenv()
 
 MONGO_URI = os.getenv("MONGODB_URI")
+MONGO_DB = os.getenv("MONGODB_DB", "chatdb")
 
-client = MongoClient(MONGO_URI)
+# Connection pool tuning
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "5"))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "300000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
 
-db = client["chatdb"]
+def _create_client():
+    if MONGO_URI and MONGO_URI.startswith("mongomock://"):
+        # In-memory stand-in for tests and benchmarks, no Mongo server needed
+        from mongomock_motor import AsyncMongoMockClient
+        return AsyncMongoMockClient()
+
+    return AsyncIOMotorClient(
+        MONGO_URI,
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        minPoolSize=MONGO_MIN_POOL_SIZE,
+        maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+        serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS
+    )
+
+client = _create_client()
+
+db = client[MONGO_DB]
 
 chat_memory_collection = db["chat_memory"]
 conversations_collection = db["conversations"]
+
+async def ensure_indexes():
+    """
+    Indexes for the history queries, created at startup (a no-op when they exist).
+    _id is part of the keys because pages are sorted by (created_at, _id).
+    """
+    await chat_memory_collection.create_index(
+        [("user_id", 1), ("conversation_id", 1), ("created_at", 1), ("_id", 1)], name="user_conversation_created"
+    )
+    await chat_memory_collection.create_index(
+        [("user_id", 1), ("created_at", 1), ("_id", 1)], name="user_created"
+    )
+    await conversations_collection.create_index(
+        [("user_id", 1), ("created_at", 1), ("_id", 1)], name="user_created"
+    )
@@ -1,39 +1,62 @@
 import os
 import tempfile
-from langchain_community.document_loaders import PyPDFLoader, WebBaseLoader
-from langchain_community.document_loaders import Docx2txtLoader
-from utils import log_message
+from utils import log_message, log_debug, preview
+
+def iter_pdf(uploaded_file):
+    """Yield PDF pages one at a time instead of materializing the whole document"""
+    # langchain_community is slow to import, so loaders are only imported when used
+    from langchain_community.document_loaders import PyPDFLoader
 
-def load_pdf(uploaded_file):
     with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
         tmp_file.write(uploaded_file.getvalue())
         tmp_file_path = tmp_file.name
-    
-    loader = PyPDFLoader(tmp_file_path)
-    docs = loader.load()
-    os.unlink(tmp_file_path)
-    log_message(f"Loaded {len(docs)} pages from PDF")
-    return docs
 
-def load_web(url):
-    loader = WebBaseLoader(url)
-    docs = loader.load()
-    log_message(f"Loaded {len(docs)} documents from web page")
-    return docs
+    try:
+        count = 0
+        for page in PyPDFLoader(tmp_file_path).lazy_load():
+            count += 1
+            # Stable source (not the temp path) so re-uploads of the same file can be deduplicated
+            page.metadata["source"] = uploaded_file.name
+            yield page
+        log_message(f"Loaded {count} pages from PDF")
+    finally:
+        os.unlink(tmp_file_path)
+
+def iter_web(url):
+    from langchain_community.document_loaders import WebBaseLoader
+
+    count = 0
+    for doc in WebBaseLoader(url).lazy_load():
+        count += 1
+        yield doc
+    log_message(f"Loaded {count} documents from web page")
+
+def iter_word(uploaded_file):
+    from langchain_community.document_loaders import Docx2txtLoader
 
-def load_word(uploaded_file):
     log_message("[WORD] Using Docx2txtLoader")
 
     with tempfile.NamedTemporaryFile(delete=False, suffix=".docx") as tmp:
         tmp.write(uploaded_file.getvalue())
         tmp_path = tmp.name
 
-    loader = Docx2txtLoader(tmp_path)
-    docs = loader.load()
+    try:
+        count = 0
+        for doc in Docx2txtLoader(tmp_path).lazy_load():
+            if count == 0:
+                log_debug("[WORD] Sample text: %s", preview(doc.page_content, 200))
+            count += 1
+            doc.metadata["source"] = uploaded_file.name
+            yield doc
+        log_message(f"[WORD] Loaded {count} documents from Word")
+    finally:
+        os.unlink(tmp_path)
 
-    os.unlink(tmp_path)
+def load_pdf(uploaded_file):
+    return list(iter_pdf(uploaded_file))
 
-    log_message(f"[WORD] Loaded {len(docs)} documents from Word")
-    log_message(f"[WORD] Sample text: {docs[0].page_content[:200]}")
+def load_web(url):
+    return list(iter_web(url))
 
-    return docs
+def load_word(uploaded_file):
+    return list(iter_word(uploaded_file))
@@ -1,81 +1,212 @@
-from langchain.embeddings.base import Embeddings
-from typing import List
-from utils import log_message
-import ollama
+from langchain_core.embeddings import Embeddings
+from typing import Callable, List, Optional
+from utils import log_message, log_debug, log_sampled, preview
+from config import OLLAMA_BASE_URL, EMBED_BATCH_SIZE, EMBED_MAX_CONCURRENCY, EMBED_MAX_RETRIES, SINGLEFLIGHT_ENABLED
+from singleflight import SingleFlight
+import aiohttp
+import asyncio
+import time
 
 class NomicEmbeddings(Embeddings):
-    def __init__(self, model_name="nomic-embed-text:v1.5"):
+    def __init__(
+        self,
+        model_name="nomic-embed-text:v1.5",
+        base_url=OLLAMA_BASE_URL,
+        batch_size=EMBED_BATCH_SIZE,
+        max_concurrency=EMBED_MAX_CONCURRENCY,
+        max_retries=EMBED_MAX_RETRIES
+    ):
         self.model_name = model_name
+        self.base_url = base_url
+        self.batch_size = max(1, batch_size)
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_retries = max(1, max_retries)
         self._dimension = None
-        log_message(f"Initialized NomicEmbeddings with model: {model_name}")
+        self._sessions = {}     # event loop -> pooled session bound to it
+        # Identical queries in flight at the same time share one request
+        self.query_flight = SingleFlight("embed_query", SINGLEFLIGHT_ENABLED)
+        log_message(
+            f"Initialized NomicEmbeddings with model: {model_name} "
+            f"(batch_size={self.batch_size}, max_concurrency={self.max_concurrency})"
+        )
+
+    # ---- async API ----
+
+    async def aembed_documents(
+        self,
+        texts: List[str],
+        on_batch: Optional[Callable[[int], None]] = None
+    ) -> List[List[float]]:
+        """Embed documents in concurrent micro-batches over the pooled session"""
+        session = await self._get_session()
+        return await self._embed_texts(session, texts, on_batch)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """Embed a single query without blocking the event loop"""
+        session = await self._get_session()
+        return await self.query_flight.do((self.model_name, text), lambda: self._embed_query(session, text))
+
+    # ---- sync API (LangChain Embeddings interface) ----
 
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        """Embed a list of documents with detailed logging"""
+        """Sync wrapper around the batched engine, for callers outside the event loop"""
+        return self._run_sync(self._embed_texts, texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        """Sync wrapper for a single query embedding"""
+        return self._run_sync(self._embed_query, text)
+
+    async def warm_up(self) -> int:
+        """Make Ollama load the model and cache the embedding dimension, without blocking the loop"""
+        await self.aembed_query("sample")
+        return self._dimension
+
+    @property
+    def dimension(self):
+        """Get embedding dimension"""
+        if self._dimension is None:
+            log_message("Getting dimension with sample embedding...")
+            sample_embedding = self.embed_query("sample")
+            self._dimension = len(sample_embedding)
+        return self._dimension
+
+    # ---- engine ----
+
+    async def _embed_texts(self, session, texts, on_batch=None):
         if not texts:
             log_message("No texts to embed")
             return []
-            
-        embeddings_list = []
-        log_message(f"Generating embeddings for {len(texts)} document chunks...")
-        
+
         # Log text length statistics
         text_lengths = [len(text) for text in texts]
         avg_length = sum(text_lengths) / len(text_lengths)
-        max_length = max(text_lengths)
-        min_length = min(text_lengths)
-        log_message(f"Text length stats - Avg: {avg_length:.1f}, Min: {min_length}, Max: {max_length}")
-        
-        for i, text in enumerate(texts):
-            if i % 5 == 0:  # More frequent progress updates
-                log_message(f"Processing chunk {i+1}/{len(texts)} (length: {len(text)})")
-            
-            try:
-                # Show sample of text being embedded
-                if i < 3:
-                    log_message(f"Embedding chunk {i+1}: '{text[:100]}...'")
-                
-                response = ollama.embeddings(prompt=text, model=self.model_name)
-                embedding = response['embedding']
-                embeddings_list.append(embedding)
-                
-                # Cache dimension on first call
-                if self._dimension is None:
-                    self._dimension = len(embedding)
-                    log_message(f"Embedding dimension: {self._dimension}")
-                    
-            except Exception as e:
-                log_message(f"Error generating embedding for chunk {i+1}: {str(e)}")
-                log_message(f"Failed text (first 200 chars): {text[:200]}")
-                raise
-        
-        log_message(f"Successfully generated {len(embeddings_list)} embeddings")
+        log_debug(
+            "Generating embeddings for %d document chunks... Text length stats - Avg: %.1f, Min: %d, Max: %d",
+            len(texts), avg_length, min(text_lengths), max(text_lengths)
+        )
+
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        results = [None] * len(batches)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        start = time.perf_counter()
+
+        async def run_batch(index, batch):
+            async with semaphore:
+                results[index] = await self._embed_batch(session, batch, index)
+            if on_batch:
+                on_batch(len(batch))
+
+        tasks = [asyncio.ensure_future(run_batch(i, b)) for i, b in enumerate(batches)]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            # One batch exhausted its retries - don't leave the rest running
+            for task in tasks:
+                task.cancel()
+            raise
+
+        embeddings_list = [vector for batch in results for vector in batch]
+        elapsed = time.perf_counter() - start
+        log_message(
+            f"Successfully generated {len(embeddings_list)} embeddings in {len(batches)} batches "
+            f"({elapsed:.2f}s, {len(embeddings_list) / max(elapsed, 1e-9):.1f} chunks/s)"
+        )
         return embeddings_list
 
-    def embed_query(self, text: str) -> List[float]:
-        """Embed a single query with logging"""
+    async def _embed_query(self, session, text):
         try:
-            log_message(f"Embedding query (length: {len(text)}): '{text[:100]}...'")
-            
-            response = ollama.embeddings(prompt=text, model=self.model_name)
-            embedding = response['embedding']
-            
-            if self._dimension is None:
-                self._dimension = len(embedding)
-                log_message(f"Query embedding dimension: {self._dimension}")
-                
-            log_message(f"Successfully generated query embedding")
+            log_debug("Embedding query %s", preview(text))
+            embedding = (await self._embed_batch(session, [text], 0))[0]
+            log_debug("Successfully generated query embedding")
             return embedding
-            
+
         except Exception as e:
             log_message(f"Error generating query embedding: {str(e)}")
-            log_message(f"Failed query: {text}")
+            log_message("Failed query: %s", preview(text))
             raise
 
-    @property
-    def dimension(self):
-        """Get embedding dimension"""
-        if self._dimension is None:
-            log_message("Getting dimension with sample embedding...")
-            sample_embedding = self.embed_query("sample")
-            self._dimension = len(sample_embedding)
-        return self._dimension
\ No newline at end of file
+    async def _embed_batch(self, session, batch, index):
+        """POST one micro-batch to Ollama's /api/embed with exponential backoff retry logic"""
+        url = f"{self.base_url}/api/embed"
+        payload = {"model": self.model_name, "input": batch}
+
+        for attempt in range(self.max_retries):
+            try:
+                async with session.post(url, json=payload) as response:
+                    response.raise_for_status()
+                    result = await response.json()
+                    embeddings = result["embeddings"]
+
+                if len(embeddings) != len(batch):
+                    raise ValueError(f"Ollama returned {len(embeddings)} embeddings for {len(batch)} inputs")
+
+                # Cache dimension on first call
+                if self._dimension is None:
+                    self._dimension = len(embeddings[0])
+                    log_message(f"Embedding dimension: {self._dimension}")
+
+                log_sampled("embed_batch", "Embedded batch %d (%d texts)", index + 1, len(batch))
+                return embeddings
+
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt < self.max_retries - 1:
+                    wait_time = 2 ** attempt
+                    log_message(f"Embedding batch {index + 1} failed (attempt {attempt + 1}), retrying in {wait_time}s: {e}")
+                    await asyncio.sleep(wait_time)
+                else:
+                    log_message(f"Embedding batch {index + 1} failed after {self.max_retries} attempts: {e}")
+                    log_message("Failed text: %s", preview(batch[0], 200))
+                    raise
+
+    def _new_session(self):
+        connector = aiohttp.TCPConnector(
+            limit=self.max_concurrency * 2,   # Enough for every in-flight batch plus queries
+            keepalive_timeout=300,
+            enable_cleanup_closed=True
+        )
+        timeout = aiohttp.ClientTimeout(total=120)
+        return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+    async def _get_session(self):
+        """Pooled session of the running event loop - a session can't be shared across loops"""
+        loop = asyncio.get_running_loop()
+        session = self._sessions.get(loop)
+        if session is None or session.closed:
+            # Sessions of loops that have finished since (e.g. asyncio.run in a worker thread)
+            for old_loop in [l for l in self._sessions if l.is_closed()]:
+                await self._close_session(old_loop, self._sessions.pop(old_loop))
+            session = self._sessions[loop] = self._new_session()
+        return session
+
+    @staticmethod
+    async def _close_session(loop, session):
+        if session.closed:
+            return
+        if loop is asyncio.get_running_loop() or loop.is_closed():
+            # A closed loop took its connections with it - this just marks the session closed
+            await session.close()
+        elif loop.is_running():
+            # Still running in another thread - close it there
+            await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(session.close(), loop))
+        else:
+            # Stopped but not closed - nothing will run its callbacks, close what can be closed from here
+            try:
+                await session.close()
+            except RuntimeError:
+                pass
+
+    def _run_sync(self, func, *args):
+        # Sync callers get a short-lived session tied to their own loop
+        async def runner():
+            async with self._new_session() as session:
+                return await func(session, *args)
+
+        return asyncio.run(runner())
+
+    async def close(self):
+        """Close the HTTP sessions of every event loop"""
+        sessions, self._sessions = self._sessions, {}
+        for loop, session in sessions.items():
+            await self._close_session(loop, session)
+        if sessions:
+            log_message(f"Embeddings HTTP sessions closed ({len(sessions)})")
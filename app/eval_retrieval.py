@@ -0,0 +1,89 @@
+"""
+Recall / latency comparison of dense, sparse and hybrid retrieval.
+
+    python eval_retrieval.py --queries eval_queries.jsonl --k 1,3,5
+
+Runs against the live Ollama + Milvus setup, so the corpus must be ingested
+first. Each line of the query file is {"query": ..., "relevant": [...]}; a
+retrieved chunk counts as relevant if it contains any of the "relevant"
+strings (case-insensitive).
+"""
+from rag_chain import CustomRAGChain
+from embeddings import NomicEmbeddings
+from llm import OllamaLLM
+from prompt_template import PROMPT
+import argparse
+import asyncio
+import json
+import statistics
+
+MODES = ("dense", "sparse", "hybrid")
+
+def load_queries(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def first_relevant_rank(docs, relevant):
+    needles = [r.lower() for r in relevant]
+    for rank, doc in enumerate(docs, start=1):
+        text = doc.page_content.lower()
+        if any(needle in text for needle in needles):
+            return rank
+    return None
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+async def evaluate(chain, queries, mode, k):
+    hits, reciprocal_ranks, latencies, context_chars = 0, [], [], []
+    for item in queries:
+        timings = {}
+        _, docs = await chain._aretrieve(item["query"], k=k, mode=mode, timings=timings)
+        latencies.append(timings.get("retrieval_ms", 0.0))
+        context_chars.append(sum(len(d.page_content) for d in docs))
+
+        rank = first_relevant_rank(docs, item["relevant"])
+        if rank:
+            hits += 1
+        reciprocal_ranks.append(1 / rank if rank else 0.0)
+
+    return {
+        "mode": mode,
+        "k": k,
+        "recall": round(hits / len(queries), 3),
+        "mrr": round(statistics.mean(reciprocal_ranks), 3),
+        "p50_ms": round(percentile(latencies, 50), 1),
+        "p95_ms": round(percentile(latencies, 95), 1),
+        "avg_context_chars": round(statistics.mean(context_chars))
+    }
+
+async def main(args):
+    chain = CustomRAGChain(NomicEmbeddings(), OllamaLLM(), PROMPT)
+    queries = load_queries(args.queries)
+    results = []
+
+    for k in args.k:
+        for mode in MODES:
+            results.append(await evaluate(chain, queries, mode, k))
+
+    print(f"\n{len(queries)} labelled queries")
+    print(f"{'mode':>7} {'k':>3} {'recall':>7} {'mrr':>6} {'p50 ms':>8} {'p95 ms':>8} {'ctx chars':>10}")
+    for r in results:
+        print(
+            f"{r['mode']:>7} {r['k']:>3} {r['recall']:>7.3f} {r['mrr']:>6.3f} "
+            f"{r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['avg_context_chars']:>10}"
+        )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    await chain.embeddings.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare dense, sparse and hybrid retrieval")
+    parser.add_argument("--queries", default="eval_queries.jsonl")
+    parser.add_argument("--k", type=lambda v: [int(x) for x in v.split(",")], default=[1, 3, 5])
+    parser.add_argument("--json", help="Write results to this JSON file")
+    asyncio.run(main(parser.parse_args()))
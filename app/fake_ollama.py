@@ -0,0 +1,146 @@
+"""
+Local stand-in for the Ollama HTTP API, used by the benchmarks.
+
+Embeddings are deterministic pseudo-random unit vectors derived from the text,
+so the same chunk always maps to the same vector. Generations are filler
+words streamed at a fixed token rate after a prefill delay.
+"""
+from aiohttp import web
+import argparse
+import asyncio
+import hashlib
+import math
+import json
+import random
+
+_WORDS = (
+    "the", "court", "shall", "section", "offence", "police", "officer", "accused", "may", "under",
+    "provided", "that", "any", "person", "magistrate", "order", "within", "days", "of", "report"
+)
+
+class FakeOllama:
+    def __init__(self, dimension=768, latency_ms=20.0, per_item_ms=1.0, parallel=4,
+                 prefill_ms=150.0, tokens_per_second=40.0, answer_tokens=120):
+        self.dimension = dimension
+        self.latency_ms = latency_ms        # Fixed cost of every request (HTTP + model scheduling)
+        self.per_item_ms = per_item_ms      # Additional cost per embedded input
+        self.parallel = parallel            # Like OLLAMA_NUM_PARALLEL - requests beyond this queue up
+        self.prefill_ms = prefill_ms        # Time to first token of a generation
+        self.tokens_per_second = tokens_per_second
+        self.answer_tokens = answer_tokens
+        self.requests = 0
+        self.items = 0
+        self.generations = 0
+        self._slots = None
+
+    def embed(self, text):
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+        rng = random.Random(seed)
+        vector = [rng.gauss(0.0, 1.0) for _ in range(self.dimension)]
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def _get_slots(self):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.parallel)
+        return self._slots
+
+    async def _work(self, n_items):
+        async with self._get_slots():
+            self.requests += 1
+            self.items += n_items
+            await asyncio.sleep((self.latency_ms + self.per_item_ms * n_items) / 1000)
+
+    async def handle_embed(self, request):
+        body = await request.json()
+        inputs = body["input"]
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        await self._work(len(inputs))
+        return web.json_response({
+            "model": body.get("model"),
+            "embeddings": [self.embed(text) for text in inputs]
+        })
+
+    async def handle_embeddings(self, request):
+        # Legacy single-prompt endpoint used by ollama.embeddings()
+        body = await request.json()
+        await self._work(1)
+        return web.json_response({"embedding": self.embed(body["prompt"])})
+
+    def tokens(self, prompt):
+        rng = random.Random(hashlib.sha256(prompt.encode("utf-8")).digest())
+        return [f" {rng.choice(_WORDS)}" for _ in range(self.answer_tokens)]
+
+    async def handle_generate(self, request):
+        body = await request.json()
+        if not body.get("prompt"):
+            # Like Ollama: an empty prompt only loads the model
+            return web.json_response({"model": body.get("model"), "response": "", "done": True})
+        tokens = self.tokens(body["prompt"])
+        interval = 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+        # Same generation stats Ollama puts on its final message
+        stats = {
+            "prompt_eval_count": len(body["prompt"]) // 4 + 1,
+            "prompt_eval_duration": int(self.prefill_ms * 1e6) or 1,
+            "eval_count": len(tokens),
+            "eval_duration": int(interval * len(tokens) * 1e9)
+        }
+
+        if not body.get("stream", True):
+            async with self._get_slots():
+                self.generations += 1
+                await asyncio.sleep(self.prefill_ms / 1000 + interval * len(tokens))
+            return web.json_response({"model": body.get("model"), "response": "".join(tokens), "done": True, **stats})
+
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await response.prepare(request)
+        async with self._get_slots():
+            self.generations += 1
+            await asyncio.sleep(self.prefill_ms / 1000)
+            for token in tokens:
+                line = {"model": body.get("model"), "response": token, "done": False}
+                await response.write((json.dumps(line) + "\n").encode("utf-8"))
+                await asyncio.sleep(interval)
+        last = {"model": body.get("model"), "response": "", "done": True, **stats}
+        await response.write((json.dumps(last) + "\n").encode("utf-8"))
+        await response.write_eof()
+        return response
+
+    def create_app(self):
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/api/embed", self.handle_embed)
+        app.router.add_post("/api/embeddings", self.handle_embeddings)
+        app.router.add_post("/api/generate", self.handle_generate)
+        return app
+
+async def start_fake_ollama(fake: FakeOllama, host="127.0.0.1", port=0, app=None):
+    """
+    Start the fake server on the running loop, returns (runner, base_url).
+    Pass `app` (from fake.create_app()) to serve extra routes next to the API.
+    """
+    runner = web.AppRunner(app or fake.create_app())
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    bound_port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://{host}:{bound_port}"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a fake Ollama server")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--dimension", type=int, default=768)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--per-item-ms", type=float, default=1.0)
+    parser.add_argument("--parallel", type=int, default=4)
+    parser.add_argument("--prefill-ms", type=float, default=150.0)
+    parser.add_argument("--tokens-per-second", type=float, default=40.0)
+    parser.add_argument("--answer-tokens", type=int, default=120)
+    args = parser.parse_args()
+
+    fake = FakeOllama(
+        args.dimension, args.latency_ms, args.per_item_ms, args.parallel,
+        args.prefill_ms, args.tokens_per_second, args.answer_tokens
+    )
+    web.run_app(fake.create_app(), host="127.0.0.1", port=args.port)
@@ -0,0 +1,66 @@
+"""
+Declarative vector index profiles.
+
+A profile names an index type, its build parameters and default search
+parameters. INDEX_PROFILE selects the one used when a collection / FAISS
+index is created; search parameters can still be overridden per request.
+Extra profiles can be declared in a JSON file pointed to by
+INDEX_PROFILES_FILE, e.g. {"hnsw_m24": {"index_type": "HNSW", "params": {...}, "search_params": {...}}}.
+
+Parameter names follow Milvus: HNSW M / efConstruction / ef, IVF nlist / nprobe.
+"""
+from config import INDEX_PROFILE, INDEX_PROFILES_FILE
+import copy
+import json
+
+INDEX_PROFILES = {
+    # Milvus picks the index itself; FAISS falls back to HNSW with its defaults
+    "autoindex": {"index_type": "AUTOINDEX", "params": {}, "search_params": {}},
+    "flat": {"index_type": "FLAT", "params": {}, "search_params": {}},
+    "hnsw_fast": {
+        "index_type": "HNSW",
+        "params": {"M": 16, "efConstruction": 128},
+        "search_params": {"ef": 32}
+    },
+    "hnsw_balanced": {
+        "index_type": "HNSW",
+        "params": {"M": 32, "efConstruction": 200},
+        "search_params": {"ef": 64}
+    },
+    "hnsw_accurate": {
+        "index_type": "HNSW",
+        "params": {"M": 48, "efConstruction": 400},
+        "search_params": {"ef": 256}
+    },
+    "ivf_flat": {
+        "index_type": "IVF_FLAT",
+        "params": {"nlist": 1024},
+        "search_params": {"nprobe": 16}
+    },
+    "ivf_sq8": {
+        "index_type": "IVF_SQ8",
+        "params": {"nlist": 1024},
+        "search_params": {"nprobe": 16}
+    }
+}
+
+# Values swept by tune_index.py for each tunable search parameter
+SEARCH_PARAM_SWEEPS = {
+    "ef": [16, 32, 64, 128, 256, 512],
+    "nprobe": [1, 4, 8, 16, 32, 64, 128]
+}
+
+if INDEX_PROFILES_FILE:
+    with open(INDEX_PROFILES_FILE) as f:
+        INDEX_PROFILES.update(json.load(f))
+
+def get_profile(name: str = None) -> dict:
+    name = name or INDEX_PROFILE
+    if name not in INDEX_PROFILES:
+        raise ValueError(f"Unknown index profile '{name}', expected one of {sorted(INDEX_PROFILES)}")
+    profile = copy.deepcopy(INDEX_PROFILES[name])
+    profile["name"] = name
+    return profile
+
+def merge_search_params(profile: dict, overrides: dict = None) -> dict:
+    return {**profile.get("search_params", {}), **(overrides or {})}
@@ -0,0 +1,174 @@
+from collections import OrderedDict
+from datetime import datetime
+from typing import Awaitable, Callable, Optional
+from uuid import uuid4
+from utils import log_message
+import asyncio
+import time
+
+TERMINAL_STATUSES = ("completed", "failed", "cancelled")
+
+class IngestJob:
+    """State and progress of one submitted ingestion"""
+    def __init__(self, file_content: bytes = None, filename: str = None, url: str = None):
+        self.job_id = str(uuid4())
+        self.file_content = file_content
+        self.filename = filename
+        self.url = url
+        self.status = "queued"      # queued -> running -> completed / failed / cancelled
+        self.stage = "queued"       # processing (split/embed/insert overlap) -> done
+        self.pages_loaded = 0
+        self.chunks_total = 0
+        self.chunks_embedded = 0
+        self.chunks_inserted = 0
+        self.errors = []
+        self.result = None
+        self.created_at = datetime.utcnow()
+        self.started_at = None
+        self.finished_at = None
+        self.task = None
+
+    # ---- progress hooks used by the ingestion code ----
+
+    def set_stage(self, stage: str):
+        self.stage = stage
+        log_message(f"[INGEST {self.job_id[:8]}] stage={stage}")
+
+    def add_embedded(self, count: int):
+        self.chunks_embedded += count
+
+    def add_inserted(self, count: int):
+        self.chunks_inserted += count
+
+    # ----
+
+    @property
+    def elapsed_seconds(self) -> float:
+        if not self.started_at:
+            return 0.0
+        end = self.finished_at or time.time()
+        return end - self.started_at
+
+    def to_dict(self) -> dict:
+        elapsed = self.elapsed_seconds
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "stage": self.stage,
+            "filename": self.filename,
+            "url": self.url,
+            "pages_loaded": self.pages_loaded,
+            "chunks_total": self.chunks_total,
+            "chunks_embedded": self.chunks_embedded,
+            "chunks_inserted": self.chunks_inserted,
+            "elapsed_seconds": round(elapsed, 2),
+            "chunks_per_second": round(self.chunks_embedded / elapsed, 2) if elapsed else 0.0,
+            "errors": self.errors,
+            "result": self.result,
+            "created_at": self.created_at.isoformat()
+        }
+
+class IngestJobManager:
+    """
+    Runs submitted ingestion jobs on a fixed pool of worker tasks.
+
+    `process` is awaited once per job and receives the IngestJob; whatever it
+    returns becomes the job result. Finished jobs are kept (newest
+    `max_retained_jobs`) so their status can still be polled.
+    """
+    def __init__(
+        self,
+        process: Callable[[IngestJob], Awaitable[dict]],
+        max_workers: int = 2,
+        max_retained_jobs: int = 200
+    ):
+        self._process = process
+        self.max_workers = max(1, max_workers)
+        self.max_retained_jobs = max_retained_jobs
+        self._queue = None
+        self._jobs = OrderedDict()
+        self._workers = []
+
+    def start(self):
+        """Spawn the workers, must be called from the running event loop"""
+        self._queue = asyncio.Queue()
+        self._workers = [asyncio.create_task(self._worker(i)) for i in range(self.max_workers)]
+        log_message(f"Ingestion worker pool started with {self.max_workers} workers")
+
+    async def stop(self):
+        for job in self._jobs.values():
+            if job.status in ("queued", "running"):
+                self.cancel(job.job_id)
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def submit(self, file_content: bytes = None, filename: str = None, url: str = None) -> IngestJob:
+        job = IngestJob(file_content, filename, url)
+        self._jobs[job.job_id] = job
+        self._queue.put_nowait(job)
+        self._prune()
+        log_message(f"[INGEST {job.job_id[:8]}] queued (file={filename}, url={url})")
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestJob]:
+        return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a queued or running job, returns False if it had already finished"""
+        job = self._jobs.get(job_id)
+        if job is None or job.status in TERMINAL_STATUSES:
+            return False
+
+        if job.task is not None:
+            job.task.cancel()
+        else:
+            self._finish(job, "cancelled")
+        return True
+
+    async def _worker(self, index: int):
+        while True:
+            job = await self._queue.get()
+            try:
+                if job.status == "cancelled":
+                    continue
+
+                job.status = "running"
+                job.started_at = time.time()
+                job.task = asyncio.create_task(self._process(job))
+
+                # wait() doesn't raise, so the job's own cancellation can't take the worker down
+                await asyncio.wait({job.task})
+
+                if job.task.cancelled():
+                    self._finish(job, "cancelled")
+                elif job.task.exception() is not None:
+                    job.errors.append(str(job.task.exception()))
+                    self._finish(job, "failed")
+                else:
+                    job.result = job.task.result()
+                    self._finish(job, "completed")
+
+            except asyncio.CancelledError:
+                if job.task is not None:
+                    job.task.cancel()
+                raise
+            finally:
+                self._queue.task_done()
+
+    def _finish(self, job: IngestJob, status: str):
+        job.status = status
+        if status == "completed":
+            job.stage = "done"
+        job.finished_at = time.time()
+        job.file_content = None     # don't keep uploads around once processed
+        log_message(
+            f"[INGEST {job.job_id[:8]}] {status} after {job.elapsed_seconds:.1f}s "
+            f"({job.chunks_inserted}/{job.chunks_total} chunks inserted)"
+        )
+
+    def _prune(self):
+        finished = [j for j in self._jobs.values() if j.status in TERMINAL_STATUSES]
+        for job in finished[:max(0, len(self._jobs) - self.max_retained_jobs)]:
+            del self._jobs[job.job_id]
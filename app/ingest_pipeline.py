@@ -0,0 +1,163 @@
+"""
+Streaming ingestion: split -> dedupe -> embed -> insert, in fixed-size batches.
+
+The stages run concurrently and are connected by bounded queues, so at
+most a few batches are held in memory at once no matter how large the
+source document is, and Milvus starts receiving chunks while later pages
+are still being loaded and embedded.
+
+Every chunk is identified by the SHA-256 of its text. Chunks whose hash is
+already stored for the same source are not embedded again, and stored
+chunks of an ingested source that no longer appear are deleted at the end.
+"""
+from typing import Iterable
+from text_splitter import iter_split_documents
+from utils import log_message
+from metrics import span
+from config import INGEST_BATCH_SIZE, INGEST_QUEUE_DEPTH
+import asyncio
+import hashlib
+import time
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+class _HashIndex:
+    """Hashes stored per source (loaded lazily) and the ones seen during this ingest"""
+    def __init__(self, rag_chain):
+        self.rag_chain = rag_chain
+        self.stored = {}    # source -> {hash: [chunk ids]}
+        self.seen = {}      # source -> set of hashes
+        self.new = 0
+        self.unchanged = 0
+
+    def take_fresh(self, chunks, n):
+        """Next batch of up to n chunks that still need embedding (runs in a worker thread)"""
+        batch = []
+        for doc in chunks:
+            source = doc.metadata.get("source", "unknown")
+            if source not in self.stored:
+                self.stored[source] = self.rag_chain.stored_hashes(source)
+                self.seen[source] = set()
+
+            digest = content_hash(doc.page_content)
+            if digest in self.seen[source] or digest in self.stored[source]:
+                self.seen[source].add(digest)
+                self.unchanged += 1
+                continue
+
+            self.seen[source].add(digest)
+            # Chunks of one page share a metadata dict, so copy before tagging
+            doc.metadata = {**doc.metadata, "content_hash": digest}
+            batch.append(doc)
+            self.new += 1
+            if len(batch) >= n:
+                break
+        return batch
+
+    def stale_ids(self, source):
+        return [
+            chunk_id
+            for digest, ids in self.stored[source].items() if digest not in self.seen[source]
+            for chunk_id in ids
+        ]
+
+def _is_chunked(docs):
+    # Lists of already split chunks (e.g. from split_documents) are passed straight through
+    return isinstance(docs, list)
+
+async def run_ingestion_pipeline(
+    docs: Iterable,
+    rag_chain,
+    progress=None,
+    batch_size: int = INGEST_BATCH_SIZE,
+    queue_depth: int = INGEST_QUEUE_DEPTH
+) -> dict:
+    """
+    Stream `docs` into the vector store. `docs` is either a list of chunks or
+    a (lazy) iterable of pages, which is split on the fly. Loader and
+    splitter work is pulled in a worker thread one batch at a time.
+    """
+    chunks = iter(docs) if _is_chunked(docs) else iter_split_documents(docs)
+    hashes = _HashIndex(rag_chain)
+    to_embed = asyncio.Queue(maxsize=max(1, queue_depth))
+    to_insert = asyncio.Queue(maxsize=max(1, queue_depth))
+    totals = {"chunks": 0, "inserted": 0}
+    # Busy time of each stage in ms; they overlap, so these add up to more than the wall time
+    stage_ms = {}
+    start = time.perf_counter()
+
+    if progress:
+        progress.set_stage("processing")
+
+    async def produce():
+        while True:
+            with span("ingest", "split", stage_ms):
+                batch = await asyncio.to_thread(hashes.take_fresh, chunks, batch_size)
+            if not batch:
+                break
+            totals["chunks"] += len(batch)
+            if progress:
+                progress.chunks_total += len(batch)
+            # Blocks while the embedder is `queue_depth` batches behind
+            await to_embed.put(batch)
+        await to_embed.put(None)
+
+    async def embed():
+        while (batch := await to_embed.get()) is not None:
+            with span("ingest", "embed", stage_ms):
+                vectors = await rag_chain.embeddings.aembed_documents(
+                    [doc.page_content for doc in batch],
+                    on_batch=progress.add_embedded if progress else None
+                )
+            await to_insert.put((batch, vectors))
+        await to_insert.put(None)
+
+    async def insert():
+        while (item := await to_insert.get()) is not None:
+            with span("ingest", "insert", stage_ms):
+                inserted = await rag_chain.insert_batch(*item)
+            totals["inserted"] += inserted
+            if progress:
+                progress.add_inserted(inserted)
+
+    tasks = [asyncio.create_task(stage()) for stage in (produce, embed, insert)]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+    # Only once everything was ingested - a failed or cancelled run must not delete anything
+    removed = 0
+    with span("ingest", "delete_stale", stage_ms):
+        for source in hashes.stored:
+            stale = hashes.stale_ids(source)
+            if stale:
+                removed += await rag_chain.delete_chunks(stale, source)
+
+    elapsed = time.perf_counter() - start
+    inserted = totals["inserted"]
+    log_message(
+        f"Ingestion pipeline: {hashes.new} new, {hashes.unchanged} unchanged, {removed} removed chunks "
+        f"in {elapsed:.2f}s ({inserted / max(elapsed, 1e-9):.1f} chunks/s embedded)"
+    )
+
+    if not hashes.new and not hashes.unchanged and not removed:
+        return {"message": "No documents to add", "doc_count": 0}
+
+    return {
+        "doc_count": inserted,
+        "new": hashes.new,
+        "unchanged": hashes.unchanged,
+        "removed": removed,
+        "total_docs": rag_chain.document_count,
+        "elapsed_seconds": round(elapsed, 3),
+        "stage_seconds": {name[:-3]: round(ms / 1000, 3) for name, ms in stage_ms.items()},
+        "message": (
+            f"Successfully added {inserted} new document chunks, {hashes.unchanged} unchanged, "
+            f"{removed} removed (total: {rag_chain.document_count})"
+        )
+    }
@@ -0,0 +1,124 @@
+"""
+In-process BM25 index kept alongside the vector store.
+
+Dense embeddings are poor at exact tokens such as "Section 303" or
+"BNSS 173"; a lexical index over the same chunks catches those, and the
+two rankings are merged with reciprocal rank fusion.
+"""
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+from utils import log_message
+import math
+import os
+import pickle
+import re
+import threading
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were "
+    "what which who whom will with under any shall such".split()
+)
+
+def tokenize(text: str) -> List[str]:
+    # Numbers are kept as tokens - section numbers are often the whole point of the query
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in _STOPWORDS]
+
+class BM25Index:
+    def __init__(self, path: str = None, k1: float = 1.5, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[int, int]] = {}   # term -> {chunk id: term frequency}
+        self._lengths: Dict[int, int] = {}               # chunk id -> token count
+        self._payloads: Dict[int, dict] = {}             # chunk id -> payload (text, source, type)
+        self._total_length = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._lengths)
+
+    def add(self, ids: Iterable[int], payloads: Iterable[dict]):
+        with self._lock:
+            for chunk_id, payload in zip(ids, payloads):
+                if chunk_id in self._lengths:
+                    continue
+                terms = Counter(tokenize(payload["text"]))
+                for term, tf in terms.items():
+                    self._postings.setdefault(term, {})[chunk_id] = tf
+                length = sum(terms.values())
+                self._lengths[chunk_id] = length
+                self._payloads[chunk_id] = payload
+                self._total_length += length
+
+    def remove(self, ids: Iterable[int]):
+        with self._lock:
+            for chunk_id in ids:
+                length = self._lengths.pop(chunk_id, None)
+                if length is None:
+                    continue
+                payload = self._payloads.pop(chunk_id)
+                self._total_length -= length
+                for term in set(tokenize(payload["text"])):
+                    postings = self._postings.get(term)
+                    if postings is not None:
+                        postings.pop(chunk_id, None)
+                        if not postings:
+                            del self._postings[term]
+
+    def search(self, query: str, k: int) -> List[Tuple[int, float, dict]]:
+        """Top-k (chunk id, score, payload) by BM25"""
+        with self._lock:
+            n_docs = len(self._lengths)
+            if not n_docs:
+                return []
+            avg_length = self._total_length / n_docs
+
+            scores: Dict[int, float] = {}
+            for term in set(tokenize(query)):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                for chunk_id, tf in postings.items():
+                    norm = tf + self.k1 * (1 - self.b + self.b * self._lengths[chunk_id] / avg_length)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.k1 + 1) / norm
+
+            top = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+            return [(chunk_id, score, self._payloads[chunk_id]) for chunk_id, score in top]
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            state = (self._postings, self._lengths, self._payloads, self._total_length)
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.path)
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            log_message("Lexical index: no saved index found, starting empty")
+            return
+        with self._lock:
+            with open(self.path, "rb") as f:
+                self._postings, self._lengths, self._payloads, self._total_length = pickle.load(f)
+        log_message(f"Lexical index: loaded {len(self._lengths)} chunks from {self.path}")
+
+def reciprocal_rank_fusion(rankings: List[List], key=lambda doc: doc, k: int = 60) -> List:
+    """
+    Merge several ranked lists: score(d) = sum over lists of 1 / (k + rank).
+    Returns (item, score) pairs for the distinct items, best first.
+    """
+    scores = {}
+    items = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            item_key = key(item)
+            scores[item_key] = scores.get(item_key, 0.0) + 1.0 / (k + rank)
+            items.setdefault(item_key, item)
+
+    ordered = sorted(scores, key=scores.get, reverse=True)
+    return [(items[item_key], scores[item_key]) for item_key in ordered]
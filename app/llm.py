@@ -1,12 +1,22 @@
 import aiohttp
-from utils import log_message
+from utils import log_message, log_debug, preview
+from config import OLLAMA_BASE_URL, SINGLEFLIGHT_ENABLED
+from metrics import LLM_IN_FLIGHT, observe_token_rate
+from singleflight import SingleFlight
 import asyncio
+import json
+
+# __call__ returns this instead of raising, callers use it to tell errors from answers
+LLM_ERROR_PREFIX = "Sorry, an error occurred"
 
 class OllamaLLM:
-    def __init__(self, model="llama3.2", base_url="http://localhost:11434"):
+    def __init__(self, model="llama3.2", base_url=OLLAMA_BASE_URL):
         self.model = model
         self.base_url = base_url
         self.session = None
+        # Identical prompts in flight at the same time share one generation (or one token stream)
+        self.generate_flight = SingleFlight("llm_generate", SINGLEFLIGHT_ENABLED)
+        self.stream_flight = SingleFlight("llm_stream", SINGLEFLIGHT_ENABLED)
         log_message(f"Initialized Ollama LLM with model: {model}")
 
     async def __call__(self, prompt):
@@ -14,7 +24,7 @@ class OllamaLLM:
         if self.session is None:
             await self._init_session()
 
-        log_message(f"Sending prompt to Ollama: {prompt[:100]}...")
+        log_debug("Sending prompt to Ollama: %s", preview(prompt))
         
         url = f"{self.base_url}/api/generate"
         payload = {
@@ -23,15 +33,69 @@ class OllamaLLM:
             "stream": False
         }
 
+        async def generate():
+            with LLM_IN_FLIGHT.track_inprogress():
+                return await self._make_request_with_retry(url, payload)
+
         try:
-            response_text = await self._make_request_with_retry(url, payload)
-            log_message(f"Received Ollama response: {response_text[:100]}...")
+            response_text = await self.generate_flight.do((self.model, prompt), generate)
+            log_debug("Received Ollama response: %s", preview(response_text))
             return response_text
                         
         except Exception as e:
             log_message(f"Error calling Ollama: {e}")
-            return f"Sorry, an error occurred: {e}"
+            return f"{LLM_ERROR_PREFIX}: {e}"
     
+    async def astream(self, prompt):
+        """Async generator yielding tokens as Ollama emits them"""
+        async for token in self.stream_flight.stream((self.model, prompt), lambda: self._stream(prompt)):
+            yield token
+
+    async def _stream(self, prompt):
+        if self.session is None:
+            await self._init_session()
+
+        log_debug("Streaming prompt to Ollama: %s", preview(prompt))
+
+        url = f"{self.base_url}/api/generate"
+        payload = {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": True
+        }
+
+        # Ollama streams newline-delimited JSON objects, the last one has "done": true
+        with LLM_IN_FLIGHT.track_inprogress():
+            async with self.session.post(url, json=payload) as response:
+                response.raise_for_status()
+                async for line in response.content:
+                    line = line.strip()
+                    if not line:
+                        continue
+
+                    chunk = json.loads(line)
+                    if "error" in chunk:
+                        raise RuntimeError(f"Ollama error: {chunk['error']}")
+
+                    token = chunk.get("response", "")
+                    if token:
+                        yield token
+
+                    if chunk.get("done"):
+                        observe_token_rate(chunk)
+                        break
+
+    async def warm_up(self):
+        """Make Ollama load the model - a generate call with an empty prompt only loads it"""
+        if self.session is None:
+            await self._init_session()
+
+        payload = {"model": self.model, "prompt": "", "stream": False}
+        async with self.session.post(f"{self.base_url}/api/generate", json=payload) as response:
+            response.raise_for_status()
+            await response.read()
+        log_message(f"Ollama model {self.model} loaded")
+
     async def _init_session(self):
         """Initialize the HTTP session with optimized settings for concurrent requests"""
         connector = aiohttp.TCPConnector(
@@ -50,6 +114,7 @@ class OllamaLLM:
                 async with self.session.post(url, json=payload) as response:
                     response.raise_for_status()
                     result = await response.json()
+                    observe_token_rate(result)
                     return result["response"]
                     
             except aiohttp.ClientError as e:
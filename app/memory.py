@@ -1,23 +1,355 @@
-from datetime import datetime
-from db import chat_memory_collection
+from datetime import datetime, timedelta
+from bson import ObjectId
+from db import chat_memory_collection, conversations_collection
+from conversation_cache import ConversationCache, NOT_CACHED
+from pagination import keyset_filter, is_after, sort_spec, MAX_PAGE_SIZE
+from utils import log_message, log_debug
+from config import (
+    HISTORY_RECENT_MESSAGES, MESSAGE_WRITE_BEHIND, MESSAGE_FLUSH_INTERVAL_MS, MESSAGE_FLUSH_BATCH, MESSAGE_BUFFER_MAX,
+    CONVERSATION_CACHE_ENABLED, CONVERSATION_CACHE_MAX_ENTRIES, CONVERSATION_CACHE_IDLE_SECONDS
+)
+import asyncio
 
-def save_message(user_id: str, conversation_id: str, role: str, content: str):
+# Mongo's duplicate key error - a retried document that had already been written
+_DUPLICATE_KEY = 11000
 
-    chat_memory_collection.insert_one({
+class MessageWriter:
+    """
+    Write-behind buffer for chat messages.
+
+    add() stamps the message with its _id and created_at and returns at
+    once; a background task writes the buffer with insert_many every flush
+    interval, or as soon as a batch is full. Failed writes are put back and
+    retried - the _id is assigned here, so a retry can't duplicate anything.
+    Until a message is in Mongo, pending() hands it to readers, and stop()
+    writes whatever is left at shutdown.
+    """
+    def __init__(self, collection, flush_interval_ms: float = 200, batch_size: int = 100,
+                 max_buffered: int = 10000):
+        self.collection = collection
+        self.flush_interval = flush_interval_ms / 1000
+        self.batch_size = max(1, batch_size)
+        self.max_buffered = max(self.batch_size, max_buffered)
+        self._buffer = []
+        self._writing = []          # the batch insert_many is working on
+        self._last_created_at = None
+        self._lock = None
+        self._wakeup = None
+        self._task = None
+        self.written = 0
+        self.batches = 0
+
+    def _stamp(self) -> datetime:
+        # Mongo keeps milliseconds - keep them strictly increasing, so a question
+        # and its answer saved within the same millisecond still sort in order
+        now = datetime.utcnow()
+        now = now.replace(microsecond=now.microsecond // 1000 * 1000)
+        if self._last_created_at is not None and now <= self._last_created_at:
+            now = self._last_created_at + timedelta(milliseconds=1)
+        self._last_created_at = now
+        return now
+
+    async def add(self, document: dict) -> dict:
+        if self._task is None or self._task.done():
+            self._start()
+        if len(self._buffer) >= self.max_buffered:
+            # Mongo isn't keeping up (or is down) - make the writer wait instead of growing without bound
+            await self.flush()
+
+        document = {"_id": ObjectId(), **document, "created_at": self._stamp()}
+        self._buffer.append(document)
+        if len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+        return document
+
+    def pending(self, user_id: str, conversation_id: str = None) -> list:
+        """Messages of a user (and conversation) not yet confirmed written, oldest first"""
+        return [
+            m for m in self._writing + self._buffer
+            if m["user_id"] == user_id and (conversation_id is None or m["conversation_id"] == conversation_id)
+        ]
+
+    def _start(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+            self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                log_message(f"Message flush failed, {len(self._buffer)} messages kept for retry: {e}")
+                await asyncio.sleep(min(self.flush_interval * 10, 5))
+
+    async def flush(self):
+        """Write everything buffered so far, returns once it is in Mongo"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+            self._wakeup = asyncio.Event()
+        async with self._lock:
+            while self._buffer:
+                batch, self._buffer = self._buffer[:self.batch_size], self._buffer[self.batch_size:]
+                self._writing = batch
+                failed = batch      # until insert_many says otherwise - also if we're cancelled mid-write
+                try:
+                    await self.collection.insert_many(batch, ordered=False)
+                    failed = []
+                except Exception as e:
+                    failed = self._failed(e, batch)
+                    if failed:
+                        raise
+                finally:
+                    self._writing = []
+                    self._buffer = failed + self._buffer
+                    self.written += len(batch) - len(failed)
+                    self.batches += 1
+                log_debug("Flushed %d chat messages", len(batch))
+
+    @staticmethod
+    def _failed(error, batch):
+        """Documents of `batch` that didn't make it, duplicates count as written"""
+        details = getattr(error, "details", None)
+        if not isinstance(details, dict) or "writeErrors" not in details:
+            return list(batch)      # e.g. a network error - retry the lot
+        return [
+            batch[e["index"]] for e in details["writeErrors"] if e.get("code") != _DUPLICATE_KEY
+        ]
+
+    async def stop(self):
+        """Stop the background task and write what is left"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._buffer:
+            await self.flush()
+            log_message(f"Chat messages flushed at shutdown ({self.written} written)")
+
+message_writer = MessageWriter(
+    chat_memory_collection, MESSAGE_FLUSH_INTERVAL_MS, MESSAGE_FLUSH_BATCH, MESSAGE_BUFFER_MAX
+)
+conversation_cache = ConversationCache(
+    CONVERSATION_CACHE_MAX_ENTRIES, HISTORY_RECENT_MESSAGES, CONVERSATION_CACHE_IDLE_SECONDS
+) if CONVERSATION_CACHE_ENABLED else None
+
+def _with_pending(messages: list, user_id: str, conversation_id: str = None) -> list:
+    """Add the not yet written messages to a query result (oldest first), without duplicates"""
+    pending = message_writer.pending(user_id, conversation_id)
+    if not pending:
+        return messages
+    seen = {m["_id"] for m in messages}
+    merged = messages + [m for m in pending if m["_id"] not in seen]
+    return sorted(merged, key=lambda m: m["created_at"])
+
+
+async def save_message(user_id: str, conversation_id: str, role: str, content: str):
+
+    document = {
         "user_id": user_id,
         "conversation_id": conversation_id,
         "role": role,
-        "content": content,
-        "created_at": datetime.utcnow()
-    })
+        "content": content
+    }
+    if MESSAGE_WRITE_BEHIND:
+        document = await message_writer.add(document)
+    else:
+        document["created_at"] = datetime.utcnow()
+        await chat_memory_collection.insert_one(document)
+    if conversation_cache is not None:
+        conversation_cache.add_message(user_id, conversation_id, document)
+
+
+async def get_recent_messages(user_id: str, conversation_id: str, limit: int = HISTORY_RECENT_MESSAGES):
+    load = None
+    if conversation_cache is not None:
+        cached = conversation_cache.get_messages(user_id, conversation_id, limit)
+        if cached is not None:
+            return cached
+        # Load as many as the cache holds, so later calls with a larger limit are hits too
+        fetch = max(limit, conversation_cache.max_messages)
+        load = conversation_cache.begin_load(user_id, conversation_id)
+    else:
+        fetch = limit
+
+    try:
+        cursor = chat_memory_collection.find(
+            {
+                "user_id": user_id,
+                "conversation_id": conversation_id
+            }
+        ).sort("created_at", -1).limit(fetch)
+
+        messages = await cursor.to_list(length=fetch)
+        messages = _with_pending(list(reversed(messages)), user_id, conversation_id)[-fetch:]
+        if load is not None:
+            # Not cached if a message was saved while we read - it may be missing from `messages`
+            conversation_cache.set_messages(user_id, conversation_id, messages, load)
+    finally:
+        if load is not None:
+            conversation_cache.end_load(load)
+    return messages[-limit:] if limit > 0 else []
+
+
+# Fields the history endpoints return, plus the cursor key
+_MESSAGE_FIELDS = {"role": 1, "content": 1, "conversation_id": 1, "created_at": 1}
+
+async def list_messages(user_id: str, conversation_id: str = None, limit: int = 100, cursor=None):
+    """
+    One page of a conversation's messages (or of all the user's messages),
+    newest page first: the `limit` messages before `cursor` ((created_at, _id)
+    of the oldest message of the previous page, None for the newest page).
+    Returns (messages oldest first, the document to continue after or None
+    if there are no older ones).
+    """
+    query = {"user_id": user_id, **keyset_filter(cursor, descending=True)}
+    if conversation_id is not None:
+        query["conversation_id"] = conversation_id
+
+    found = chat_memory_collection.find(query, _MESSAGE_FIELDS).sort(sort_spec(descending=True)).limit(limit + 1)
+    messages = await found.to_list(length=limit + 1)
+
+    # Still in the write-behind buffer - these are the newest, so they only land on early pages
+    pending = [m for m in message_writer.pending(user_id, conversation_id) if is_after(m, cursor, descending=True)]
+    if pending:
+        seen = {m["_id"] for m in messages}
+        messages += [m for m in pending if m["_id"] not in seen]
+        messages.sort(key=lambda m: (m["created_at"], m["_id"]), reverse=True)
+
+    page = messages[:limit]
+    return page[::-1], page[-1] if len(messages) > limit else None
+
+
+async def list_conversations(user_id: str, limit: int = 100, cursor=None):
+    """One page of the user's conversations, newest first. Returns (conversations, document to continue after)"""
+    query = {"user_id": user_id, **keyset_filter(cursor, descending=True)}
+    found = conversations_collection.find(query, {"title": 1, "created_at": 1}).sort(sort_spec(descending=True))
+    conversations = await found.limit(limit + 1).to_list(length=limit + 1)
+
+    page = conversations[:limit]
+    return page, page[-1] if len(conversations) > limit else None
+
+
+async def iter_messages(user_id: str, conversation_id: str = None, batch_size: int = MAX_PAGE_SIZE):
+    """
+    All of a conversation's messages (or all the user's), oldest first, in
+    batches read off one Mongo cursor - for responses streamed as they're read
+    """
+    query = {"user_id": user_id}
+    if conversation_id is not None:
+        query["conversation_id"] = conversation_id
+
+    # Taken before the cursor opens - one flushed meanwhile may or may not be seen by it
+    pending = message_writer.pending(user_id, conversation_id)
+    found = chat_memory_collection.find(query, _MESSAGE_FIELDS).sort(sort_spec(descending=False))
+    last = None
+    async for batch in _batches(found, batch_size):
+        last = (batch[-1]["created_at"], batch[-1]["_id"])
+        yield batch
+
+    # The write-behind buffer holds the newest ones - those the cursor didn't get to see
+    pending = [m for m in pending if is_after(m, last, descending=False)]
+    if pending:
+        yield pending
+
+
+async def iter_conversations(user_id: str, batch_size: int = MAX_PAGE_SIZE):
+    """All the user's conversations, newest first, in batches read off one Mongo cursor"""
+    found = conversations_collection.find({"user_id": user_id}, {"title": 1, "created_at": 1})
+    async for batch in _batches(found.sort(sort_spec(descending=True)), batch_size):
+        yield batch
+
+
+async def _batches(cursor, batch_size: int):
+    # One getMore's worth at a time
+    batch = []
+    async for document in cursor.batch_size(batch_size):
+        batch.append(document)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def get_messages_between(user_id: str, conversation_id: str, after=None, before=None, limit: int = 20):
+    """Oldest first, `after` < created_at < `before` (either bound optional)"""
+    created_at = {}
+    if after is not None:
+        created_at["$gt"] = after
+    if before is not None:
+        created_at["$lt"] = before
+
+    query = {"user_id": user_id, "conversation_id": conversation_id}
+    if created_at:
+        query["created_at"] = created_at
+
+    cursor = chat_memory_collection.find(query).sort("created_at", 1).limit(limit)
+    messages = _with_pending(await cursor.to_list(length=limit), user_id, conversation_id)
+    return [
+        m for m in messages
+        if (after is None or m["created_at"] > after) and (before is None or m["created_at"] < before)
+    ][:limit]
+
+
+async def create_conversation(user_id: str, conversation_id: str, title: str = "New Chat"):
+    conversation = {"_id": conversation_id, "user_id": user_id, "title": title, "created_at": datetime.utcnow()}
+    await conversations_collection.insert_one(conversation)
+    if conversation_cache is not None:
+        conversation_cache.set_conversation(user_id, conversation_id, conversation)
+        conversation_cache.set_messages(user_id, conversation_id, [])
+
+
+async def get_conversation(user_id: str, conversation_id: str):
+    """The user's conversation document (without messages), None if there is no such conversation"""
+    if conversation_cache is None:
+        return await conversations_collection.find_one({"_id": conversation_id, "user_id": user_id})
+
+    cached = conversation_cache.get_conversation(user_id, conversation_id)
+    if cached is not NOT_CACHED:
+        return cached
+    load = conversation_cache.begin_load(user_id, conversation_id)
+    try:
+        conversation = await conversations_collection.find_one({"_id": conversation_id, "user_id": user_id})
+        conversation_cache.set_conversation(user_id, conversation_id, conversation, load)
+    finally:
+        conversation_cache.end_load(load)
+    return conversation
+
+
+async def set_conversation_title(user_id: str, conversation_id: str, title: str, only_if: str = None):
+    """Set the title - if `only_if` is given, only while the title is still that"""
+    query = {"_id": conversation_id, "user_id": user_id}
+    if only_if is not None:
+        query["title"] = only_if
+    result = await conversations_collection.update_one(query, {"$set": {"title": title}})
+    if conversation_cache is not None and result.modified_count:
+        conversation_cache.update_conversation(user_id, conversation_id, {"title": title})
+
 
+async def get_conversation_summary(user_id: str, conversation_id: str):
+    """
+    Rolling summary of the conversation as {"text", "through"} - `through` is
+    the created_at of the last message folded in. None if the conversation
+    doesn't exist; text is empty until the first summary was written.
+    """
+    convo = await get_conversation(user_id, conversation_id)
+    if convo is None:
+        return None
+    return convo.get("summary") or {"text": "", "through": None}
 
-def get_recent_messages(user_id: str, conversation_id: str, limit: int = 6):
-    messages = chat_memory_collection.find(
-        {
-            "user_id": user_id,
-            "conversation_id": conversation_id
-        }
-    ).sort("created_at", -1).limit(limit)
 
-    return list(reversed(list(messages)))
\ No newline at end of file
+async def save_conversation_summary(user_id: str, conversation_id: str, text: str, through):
+    summary = {"text": text, "through": through, "updated_at": datetime.utcnow()}
+    await conversations_collection.update_one(
+        {"_id": conversation_id, "user_id": user_id},
+        {"$set": {"summary": summary}}
+    )
+    if conversation_cache is not None:
+        conversation_cache.update_conversation(user_id, conversation_id, {"summary": summary})
@@ -0,0 +1,107 @@
+"""
+Prometheus metrics for the API, served at GET /metrics.
+
+Stage timings are recorded with `span()`, which observes the stage
+histogram and, when given a timings dict, also adds the duration in ms
+under "<stage>_ms" - the same dicts /qa returns and the Server-Timing
+header is built from.
+"""
+from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+import contextlib
+import time
+
+# Generations and whole ingestions run far past the default 10s top bucket
+_SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+STAGE_SECONDS = Histogram(
+    "rag_stage_seconds",
+    "Duration of one stage of the QA or ingestion pipeline",
+    ["pipeline", "stage"],
+    buckets=_SECONDS_BUCKETS
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "rag_http_request_seconds",
+    "HTTP request duration until the response headers are sent",
+    ["method", "route", "status"],
+    buckets=_SECONDS_BUCKETS
+)
+LLM_IN_FLIGHT = Gauge("rag_llm_in_flight", "Ollama generate calls currently running")
+LLM_TOKENS_PER_SECOND = Histogram(
+    "rag_llm_tokens_per_second",
+    "Generation speed reported by Ollama",
+    buckets=(1, 2, 5, 10, 20, 40, 60, 80, 100, 150, 200, 400)
+)
+LLM_PREFILL_TOKENS_PER_SECOND = Histogram(
+    "rag_llm_prefill_tokens_per_second",
+    "Prompt evaluation speed reported by Ollama",
+    buckets=(50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000)
+)
+PROMPT_TOKENS = Histogram(
+    "rag_prompt_tokens",
+    "Estimated prompt size after packing, by part (history, context, total)",
+    ["part"],
+    buckets=(64, 128, 256, 512, 1024, 1536, 2048, 3072, 4096, 8192)
+)
+UPSTREAM_CALLS = Counter(
+    "rag_upstream_calls_total",
+    "LLM / embedding calls by whether they went upstream or joined an identical one in flight",
+    ["client", "result"]
+)
+QA_QUEUE_DEPTH = Gauge("rag_qa_queue_depth", "QA requests waiting for an LLM slot")
+QA_SLOTS_IN_USE = Gauge("rag_qa_slots_in_use", "LLM slots held by QA requests")
+ANSWER_CACHE_LOOKUPS = Counter("rag_answer_cache_lookups_total", "Semantic answer cache lookups", ["result"])
+ANSWER_CACHE_HIT_RATIO = Gauge("rag_answer_cache_hit_ratio", "Hit ratio of the semantic answer cache")
+ANSWER_CACHE_ENTRIES = Gauge("rag_answer_cache_entries", "Answers held by the semantic answer cache")
+CONVERSATION_CACHE_HIT_RATIO = Gauge(
+    "rag_conversation_cache_hit_ratio", "Hit ratio of the recent-messages / conversation cache"
+)
+CONVERSATION_CACHE_ENTRIES = Gauge("rag_conversation_cache_entries", "Conversations held by the conversation cache")
+
+def record(pipeline: str, stage: str, seconds: float, timings: dict = None):
+    STAGE_SECONDS.labels(pipeline, stage).observe(seconds)
+    if timings is not None:
+        key = f"{stage}_ms"
+        timings[key] = timings.get(key, 0.0) + seconds * 1000
+
+@contextlib.contextmanager
+def span(pipeline: str, stage: str, timings: dict = None):
+    """Time the enclosed block as `stage` of `pipeline` ("qa", "rag_batch" or "ingest")"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(pipeline, stage, time.perf_counter() - start, timings)
+
+def observe_token_rate(chunk: dict):
+    # Ollama reports eval_count tokens generated in eval_duration nanoseconds,
+    # and the same for the prompt as prompt_eval_*
+    count, duration = chunk.get("eval_count"), chunk.get("eval_duration")
+    if count and duration:
+        LLM_TOKENS_PER_SECOND.observe(count / (duration / 1e9))
+    count, duration = chunk.get("prompt_eval_count"), chunk.get("prompt_eval_duration")
+    if count and duration:
+        LLM_PREFILL_TOKENS_PER_SECOND.observe(count / (duration / 1e9))
+
+def observe_prompt(stats: dict):
+    PROMPT_TOKENS.labels("history").observe(stats["history_tokens"])
+    PROMPT_TOKENS.labels("context").observe(stats["context_tokens"])
+    PROMPT_TOKENS.labels("total").observe(stats["prompt_tokens"])
+
+def watch_scheduler(scheduler):
+    QA_QUEUE_DEPTH.set_function(lambda: scheduler.metrics()["queued"])
+    QA_SLOTS_IN_USE.set_function(lambda: scheduler.metrics()["in_flight"])
+
+def watch_answer_cache(answer_cache):
+    ANSWER_CACHE_HIT_RATIO.set_function(lambda: answer_cache.stats()["hit_rate"])
+    ANSWER_CACHE_ENTRIES.set_function(lambda: answer_cache.stats()["entries"])
+
+def watch_conversation_cache(conversation_cache):
+    CONVERSATION_CACHE_HIT_RATIO.set_function(lambda: conversation_cache.stats()["hit_rate"])
+    CONVERSATION_CACHE_ENTRIES.set_function(lambda: conversation_cache.stats()["entries"])
+
+def server_timing(timings: dict) -> str:
+    """Server-Timing header value, e.g. "history;dur=2.1, embed;dur=14.8" """
+    return ", ".join(f"{name[:-3] if name.endswith('_ms') else name};dur={ms:.1f}" for name, ms in timings.items())
+
+def render():
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,54 @@
+"""
+Keyset (cursor) pagination over (created_at, _id).
+
+A cursor is the opaque, URL-safe encoding of the last document of a page;
+the next page is everything strictly past it in sort order. Unlike
+skip/offset, every page is one index range scan, however deep it is.
+"""
+from datetime import datetime
+from bson import ObjectId
+import base64
+import json
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+def encode_cursor(document: dict) -> str:
+    doc_id = document["_id"]
+    key = {
+        "t": document["created_at"].isoformat(),
+        "id": str(doc_id),
+        "oid": isinstance(doc_id, ObjectId)
+    }
+    return base64.urlsafe_b64encode(json.dumps(key, separators=(",", ":")).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str):
+    """(created_at, _id) of a cursor, ValueError if it isn't one"""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        doc_id = ObjectId(key["id"]) if key.get("oid") else key["id"]
+        return datetime.fromisoformat(key["t"]), doc_id
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+def page_size(limit) -> int:
+    return DEFAULT_PAGE_SIZE if limit is None else max(1, min(int(limit), MAX_PAGE_SIZE))
+
+def keyset_filter(cursor, descending: bool) -> dict:
+    """Mongo filter for the documents after `cursor` ((created_at, _id) or None)"""
+    if cursor is None:
+        return {}
+    created_at, doc_id = cursor
+    op = "$lt" if descending else "$gt"
+    return {"$or": [{"created_at": {op: created_at}}, {"created_at": created_at, "_id": {op: doc_id}}]}
+
+def is_after(document: dict, cursor, descending: bool) -> bool:
+    """keyset_filter for documents that aren't in Mongo yet"""
+    if cursor is None:
+        return True
+    key = (document["created_at"], document["_id"])
+    return key < cursor if descending else key > cursor
+
+def sort_spec(descending: bool):
+    direction = -1 if descending else 1
+    return [("created_at", direction), ("_id", direction)]
@@ -1,211 +1,632 @@
-from langchain_core.runnables import Runnable
-from pymilvus import MilvusClient
-from utils import log_message
+from langchain_core.runnables import Runnable, AddableDict
+from utils import log_message, log_debug, log_sampled, preview
 import asyncio
-from memory import get_recent_messages, save_message
+import contextlib
+import threading
+import time
+from memory import get_recent_messages, get_conversation_summary, save_message
+from llm import LLM_ERROR_PREFIX
+from ingest_pipeline import run_ingestion_pipeline, content_hash
+from lexical_index import BM25Index, reciprocal_rank_fusion
+from vector_store import create_vector_store
+from metrics import span, record, observe_prompt, ANSWER_CACHE_LOOKUPS
+from context_packer import pack_prompt
+from answer_cache import history_digest
+from rerank import mmr, normalize_scores
+from stage_graph import StageGraph
+from config import (
+    RETRIEVAL_MODE, RETRIEVAL_K, RETRIEVAL_FETCH_K, RRF_K, LEXICAL_INDEX_PATH, VECTOR_STORE,
+    RETRIEVAL_MMR, MMR_LAMBDA, RERANK_BUDGET_MS, QA_STAGE_TIMEOUTS, RAG_BATCH_CONCURRENCY
+)
+
+# Scheduler user of the stateless LangServe /rag routes
+LANGSERVE_USER = "langserve"
 
 class CustomRAGChain(Runnable):
-    def __init__(self, embeddings, llm, prompt_template, collection_name="rag_demo_local"):
+    def __init__(self, embeddings, llm, prompt_template, collection_name="rag_demo_local",
+                 scheduler=None, answer_cache=None, summarizer=None, reranker=None):
         self.embeddings = embeddings
         self.llm = llm
         self.prompt_template = prompt_template
+        self.scheduler = scheduler
+        self.answer_cache = answer_cache
+        self.summarizer = summarizer
+        self.reranker = reranker
         self.collection_name = collection_name
-        self.client = None
         self.document_count = 0
-        self._initialize_milvus()
-
-    def _initialize_milvus(self):
-        log_message("Initializing Milvus client...")
-        self.client = MilvusClient(uri="tcp://127.0.0.1:19530")
-
-        if not self.client.has_collection(self.collection_name):
-            log_message("Creating new collection...")
-
-            self.client.create_collection(
-                collection_name=self.collection_name,
-                dimension=self.embeddings.dimension,
-                metric_type="IP",
-                consistency_level="Bounded",
-                auto_id=True,
-                enable_dynamic_field=True   # 🔑 THIS enables JSON payload
-            )
+        # Opened by initialize() - from the server warm-up, or on first use
+        self._store = None
+        self._lexical_index = None
+        self._init_lock = threading.Lock()
+        # The server's event loop, set at startup - sync invoke() from other threads runs on it
+        self.loop = None
+
+    @property
+    def ready(self) -> bool:
+        return self._store is not None
+
+    @property
+    def store(self):
+        return self._store if self._store is not None else self.initialize()._store
+
+    @property
+    def lexical_index(self):
+        return self._lexical_index if self._store is not None else self.initialize()._lexical_index
 
-            log_message(f"Collection '{self.collection_name}' created")
+    def initialize(self):
+        """Load the lexical index and open the vector store (blocking, idempotent)"""
+        with self._init_lock:
+            if self._store is None:
+                lexical_index = BM25Index(LEXICAL_INDEX_PATH)
+                lexical_index.load()
+                self._lexical_index = lexical_index
+                self._initialize_store()
+                self._sync_lexical_index()
+        return self
 
+    def _initialize_store(self):
+        store = create_vector_store(self.collection_name, lambda: self.embeddings.dimension)
+        self.document_count = store.count()
+        self._store = store
+        log_message(f"Vector store ready ({VECTOR_STORE}, {self.document_count} chunks)")
 
+    def _sync_lexical_index(self):
+        # BM25 is only persisted as a pickle - when it's missing or out of step with the
+        # store, rebuild it from the stored payloads (dedup would never re-add those chunks)
+        if len(self._lexical_index) == self.document_count:
+            return
+        log_message(
+            f"Lexical index has {len(self._lexical_index)} chunks, the vector store {self.document_count} - "
+            "rebuilding it from the store"
+        )
+        lexical_index = BM25Index(LEXICAL_INDEX_PATH)
+        for ids, payloads in self._store.iter_payloads():
+            lexical_index.add(ids, payloads)
+        lexical_index.save()
+        self._lexical_index = lexical_index
+        log_message(f"Lexical index rebuilt ({len(lexical_index)} chunks)")
 
-    def get_relevant_documents(self, query, k=3):
-        """Generate embedding and search Milvus with detailed logging"""
+    def get_relevant_documents(self, query, k=RETRIEVAL_K):
+        """Generate embedding and search the vector store (fused with BM25 in hybrid mode) with detailed logging"""
         try:
-            log_message(f"Processing query: '{query[:100]}...'")
+            log_debug("Processing query %s", preview(query))
             
             # Generate query embedding
-            log_message("Generating query embedding...")
+            log_debug("Generating query embedding...")
             query_vector = self.embeddings.embed_query(query)
-            
-            # Search Milvus
-            log_message(f"Searching Milvus for {k} most relevant documents...")
-            results = self.client.search(
-                collection_name=self.collection_name,
-                data=[query_vector],
-                limit=k,
-                search_params={"metric_type": "IP", "params": {}},
-                output_fields=["payload"]
-            )
+            if RETRIEVAL_MODE == "dense" and not RETRIEVAL_MMR:
+                return self._search(query_vector, k)
 
-            
-            documents = []
-            if results and results[0]:
-                log_message(f"Found {len(results[0])} search results")
-                for i, result in enumerate(results[0]):
-                    distance = result.get("distance", 0)
-                    payload = result["entity"]["payload"]
-                    text_preview = payload["text"][:100]
-                    log_message(f"Result {i+1}: distance={distance:.4f}, text='{text_preview}...'")
-                    
-                    doc = type('Document', (), {
-                        'page_content': payload["text"],
-                        'metadata': {
-                            'source': payload.get("source", "unknown"),
-                            'type': payload.get("type", "general"),
-                            'distance': distance,
-                            'chunk_length': len(payload["text"])
-                        }
-                    })()
-                    documents.append(doc)
-            else:
-                log_message("No search results found")
-            
-            log_message(f"Retrieved {len(documents)} relevant documents")
-            return documents
+            fetch_k = max(k, RETRIEVAL_FETCH_K)
+            candidates = self._search(query_vector, fetch_k, with_vectors=RETRIEVAL_MMR)
+            if RETRIEVAL_MODE != "dense":
+                candidates = self._fuse(candidates, self._lexical_search(query, fetch_k), fetch_k)
+            return self._mmr_select(candidates, k) if RETRIEVAL_MMR else candidates[:k]
             
         except Exception as e:
-            log_message(f"Error searching Milvus: {str(e)}")
+            log_message(f"Error searching vector store: {str(e)}")
             return []
 
-    def add_documents(self, docs):
-        """Add documents to Milvus collection with detailed processing info"""
-        if not docs:
-            log_message("No documents to add")
-            return {"message": "No documents to add", "doc_count": 0}
+    async def aget_relevant_documents(self, query, k=RETRIEVAL_K):
+        """Async variant - the query embedding never blocks a thread, only the vector store call is offloaded"""
+        _, documents = await self._aretrieve(query, k)
+        return documents
+
+    async def _aretrieve(self, query, k=RETRIEVAL_K, mode=None, timings=None, search_params=None, diversify=None):
+        """
+        Returns (query_vector, documents); the vector is None if embedding failed.
+        `search_params` override the index profile's search parameters (ef / nprobe).
+        Per-stage durations in ms are written to `timings` if given.
+        """
+        graph = StageGraph("qa", timings, QA_STAGE_TIMEOUTS)
+        self._add_retrieval_stages(graph, query, k, mode, search_params, diversify)
+        try:
+            results = await graph.run()
+        except Exception as e:
+            log_message(f"Error searching vector store: {str(e)}")
+            return None, []
+        record("qa", "retrieval", graph.elapsed("select"), timings)
+        return results.get("embed"), results["select"]
+
+    def _add_retrieval_stages(self, graph, query, k=RETRIEVAL_K, mode=None, search_params=None, diversify=None):
+        """
+        Retrieval as graph stages, the documents end up in results["select"]
+        and the query vector in results["embed"].
+
+        In hybrid mode the BM25 lookup runs concurrently with embedding + vector
+        search, and both rankings are fused with reciprocal rank fusion. With
+        `diversify` (default RETRIEVAL_MMR) the final k are picked from the
+        RETRIEVAL_FETCH_K candidates by reranker + MMR instead of the top k.
+        A dense or sparse side that fails or times out leaves the other one.
+        """
+        mode = mode or RETRIEVAL_MODE
+        diversify = RETRIEVAL_MMR if diversify is None else diversify
+        fetch_k = k if mode == "dense" and not diversify else max(k, RETRIEVAL_FETCH_K)
+        log_debug("Processing query %s", preview(query))
+
+        async def embed(results):
+            return await self.embeddings.aembed_query(query)
+
+        async def dense_search(results):
+            if results["embed"] is None:
+                return []
+            return await asyncio.to_thread(self._search, results["embed"], fetch_k, search_params, diversify)
+
+        async def sparse_search(results):
+            return await asyncio.to_thread(self._lexical_search, query, fetch_k)
+
+        async def fusion(results):
+            return self._fuse(results["dense_search"], results["sparse_search"], fetch_k if diversify else k)
+
+        async def select(results):
+            candidates = results[candidates_stage]
+            if not diversify:
+                return candidates[:k]
+            try:
+                return await self._aselect(query, candidates, k, graph.timings)
+            except Exception as e:
+                log_message(f"Candidate selection failed, using the top {k}: {e}")
+                return candidates[:k]
+
+        if mode != "sparse":
+            graph.add("embed", embed, fallback=None)
+            graph.add("dense_search", dense_search, deps=["embed"], fallback=[])
+        if mode != "dense":
+            graph.add("sparse_search", sparse_search, fallback=[])
+        if mode == "hybrid":
+            graph.add("fusion", fusion, deps=["dense_search", "sparse_search"])
+        candidates_stage = {"dense": "dense_search", "sparse": "sparse_search"}.get(mode, "fusion")
+        graph.add("select", select, deps=[candidates_stage])
+
+    def _search(self, query_vector, k, search_params=None, with_vectors=False):
+        return self._search_many([query_vector], k, search_params, with_vectors)[0]
+
+    def _search_many(self, query_vectors, k, search_params=None, with_vectors=False):
+        # One vector store request for all query vectors, a list of documents per query
+        log_debug("Searching vector store for %d most relevant documents of %d queries...", k, len(query_vectors))
+        results = self.store.search(query_vectors, k, search_params, with_vectors=with_vectors)
+        return [self._to_documents(hits) for hits in results or [[] for _ in query_vectors]]
+
+    def _to_documents(self, hits):
+        documents = []
+        if hits:
+            log_debug("Found %d search results", len(hits))
+            for i, result in enumerate(hits):
+                distance = result["distance"]
+                payload = result["payload"]
+                log_sampled("search_result", "Result %d: distance=%.4f, text=%s", i + 1, distance, preview(payload["text"]))
+                doc = self._make_document(result["id"], payload, distance=distance)
+                doc.vector = result.get("vector")
+                documents.append(doc)
+        else:
+            log_debug("No search results found")
         
+        log_debug("Retrieved %d relevant documents", len(documents))
+        return documents
+
+    async def _aselect(self, query, candidates, k, timings=None):
+        """Rerank (if configured, within its latency budget) and MMR-select k of the candidates"""
+        if len(candidates) <= k:
+            return candidates
+
+        relevance = None
+        if self.reranker is not None:
+            with span("qa", "rerank", timings):
+                try:
+                    # On timeout the thread finishes in the background, its scores are just not used
+                    relevance = await asyncio.wait_for(
+                        asyncio.to_thread(self.reranker.score, query, [d.page_content for d in candidates]),
+                        RERANK_BUDGET_MS / 1000
+                    )
+                except asyncio.TimeoutError:
+                    log_sampled("rerank_timeout", "Reranker over its %.0fms budget, using retrieval scores", RERANK_BUDGET_MS)
+                except Exception as e:
+                    log_message(f"Reranker failed, using retrieval scores: {e}")
+
+        with span("qa", "mmr", timings):
+            return await asyncio.to_thread(self._mmr_select, candidates, k, relevance)
+
+    def _mmr_select(self, candidates, k, relevance=None):
+        if len(candidates) <= k:
+            return candidates
+
+        # Lexical-only hits come without a vector, look those up in the store
+        missing = [d.metadata["id"] for d in candidates if getattr(d, "vector", None) is None]
+        stored = self.store.get_vectors(missing) if missing else {}
+
+        if relevance is None:
+            relevance = [self._retrieval_score(d) for d in candidates]
+        else:
+            for doc, score in zip(candidates, relevance):
+                doc.metadata["rerank_score"] = score
+
+        pool, vectors, scores = [], [], []
+        for doc, score in zip(candidates, relevance):
+            vector = doc.vector if getattr(doc, "vector", None) is not None else stored.get(doc.metadata["id"])
+            if vector is not None:
+                pool.append(doc)
+                vectors.append(vector)
+                scores.append(score)
+        if not pool:
+            return candidates[:k]
+
+        picked = mmr(normalize_scores(scores), vectors, k, MMR_LAMBDA)
+        log_debug("MMR picked candidates %s of %d", picked, len(pool))
+        return [pool[i] for i in picked]
+
+    @staticmethod
+    def _retrieval_score(doc):
+        metadata = doc.metadata
+        for key in ("rrf_score", "distance", "bm25"):
+            if metadata.get(key) is not None:
+                return metadata[key]
+        return 0.0
+
+    def _lexical_search(self, query, k):
+        return [
+            self._make_document(chunk_id, payload, bm25=score)
+            for chunk_id, score, payload in self.lexical_index.search(query, k)
+        ]
+
+    def _fuse(self, dense_docs, sparse_docs, k):
+        fused = reciprocal_rank_fusion(
+            [dense_docs, sparse_docs], key=lambda d: d.metadata["id"], k=RRF_K
+        )
+        documents = []
+        for doc, score in fused[:k]:
+            doc.metadata["rrf_score"] = score
+            documents.append(doc)
+        log_debug("Fused %d dense + %d lexical results into %d documents", len(dense_docs), len(sparse_docs), len(documents))
+        return documents
+
+    @staticmethod
+    def _make_document(chunk_id, payload, **scores):
+        return type('Document', (), {
+            'page_content': payload["text"],
+            'metadata': {
+                'id': chunk_id,
+                'source': payload.get("source", "unknown"),
+                'type': payload.get("type", "general"),
+                'chunk_length': len(payload["text"]),
+                **scores
+            }
+        })()
+
+    async def add_documents(self, docs, progress=None):
+        """
+        Add documents to the vector store with detailed processing info.
+
+        `docs` may be any iterable, including a lazy generator of pages or
+        chunks; it is streamed through embedding and insertion in batches.
+        `progress` is an optional IngestJob-like object whose hooks are
+        called as work completes.
+        """
         try:
-            log_message(f"Adding {len(docs)} document chunks to Milvus...")
-                            
-            # Show sample chunks
-            for i, doc in enumerate(docs[:3]):
-                log_message(f"Sample chunk {i+1} (length {len(doc.page_content)}): '{doc.page_content[:100]}...'")
-            
-            # Generate embeddings for all documents
-            log_message("Generating embeddings for document chunks...")
-            text_contents = [doc.page_content for doc in docs]
-            vectors = self.embeddings.embed_documents(text_contents)
-            log_message(f"Generated {len(vectors)} embeddings")
-            
-            # Prepare data for insertion
-            data = []
-            for i, (doc, vector) in enumerate(zip(docs, vectors)):
-                if not hasattr(doc, "metadata") or doc.metadata is None:
-                    doc.metadata = {}
-                
-                data.append({
-                    "vector": vector,
-                    "payload": {
-                        "text": doc.page_content,
-                        "source": doc.metadata.get("source", "unknown"),
-                        "type": doc.metadata.get("type", "general")
-                    }
-                })
-       
-            # Insert into Milvus
-            log_message("Inserting data into Milvus...")
-            result = self.client.insert(collection_name=self.collection_name, data=data)
-            
-            inserted_count = result.get('insert_count', 0)
-            self.document_count += inserted_count
-            
-            log_message(f"Successfully inserted {inserted_count} document chunks")
+            try:
+                result = await run_ingestion_pipeline(docs, self, progress=progress)
+            finally:
+                # Persist whatever made it into the store, even if the run was cut short
+                with span("ingest", "persist"):
+                    await asyncio.to_thread(self.lexical_index.save)
+                    await asyncio.to_thread(self.store.flush)
             log_message(f"Total documents in collection: {self.document_count}")
-            
-            return {
-                "doc_count": inserted_count,
-                "total_docs": self.document_count,
-                "message": f"Successfully added {inserted_count} document chunks (total: {self.document_count})"
-            }
+            return result
             
         except Exception as e:
             error_msg = f"Error adding documents: {str(e)}"
             log_message(error_msg)
             raise Exception(error_msg)
 
-    def invoke(self, input: dict, config=None) -> dict:
-        """LangChain Runnable entrypoint with enhanced logging"""
-        question = input["question"]
-        log_message(f"RAG Chain invoke called with question: '{question[:100]}...'")
-        
-        # Get relevant documents
-        docs = self.get_relevant_documents(question)
+    async def insert_batch(self, docs, vectors) -> int:
+        """Insert one batch of embedded chunks into the vector store, returns the inserted count"""
+        # Prepare data for insertion
+        data = []
+        for doc, vector in zip(docs, vectors):
+            if not hasattr(doc, "metadata") or doc.metadata is None:
+                doc.metadata = {}
+            
+            source = doc.metadata.get("source", "unknown")
+            data.append({
+                "vector": vector,
+                "payload": {
+                    "text": doc.page_content,
+                    "source": source,
+                    "type": doc.metadata.get("type", "general")
+                },
+                # Top-level fields, so dedup lookups can filter and project without the payload
+                "source": source,
+                "content_hash": doc.metadata.get("content_hash") or content_hash(doc.page_content)
+            })
+
+        ids = await asyncio.to_thread(self.store.insert, data)
         
-        if not docs:
-            log_message("No relevant documents found for context")
-            context = "No relevant information found in the knowledge base."
+        inserted_count = len(ids)
+        self.document_count += inserted_count
+        self.lexical_index.add(ids, [d["payload"] for d in data])
+
+        if self.answer_cache is not None:
+            self.answer_cache.invalidate_sources({d["payload"]["source"] for d in data})
+
+        return inserted_count
+
+    def _delete_from_indexes(self, ids) -> int:
+        deleted = self.store.delete(ids)
+        self.lexical_index.remove(ids)
+        return deleted
+
+    def stored_hashes(self, source: str) -> dict:
+        """content_hash -> [chunk ids] of everything stored for a source"""
+        return self.store.hashes_for_source(source)
+
+    async def delete_chunks(self, ids, source: str = None) -> int:
+        """Delete chunks by id, returns the number removed"""
+        if not ids:
+            return 0
+        deleted = await asyncio.to_thread(self._delete_from_indexes, list(ids))
+        # Back on the loop - the answer cache and the counters are only touched from here
+        self.document_count = max(0, self.document_count - deleted)
+
+        if self.answer_cache is not None and source is not None:
+            self.answer_cache.invalidate_sources({source})
+
+        log_message(f"Deleted {deleted} stale chunks of '{source}'")
+        return deleted
+
+    # ---- LangServe (Runnable) entrypoints ----
+    # /rag is stateless: no user, no saved conversation. Its generations go
+    # through the scheduler as one user, so a batch can't crowd out /qa.
+
+    async def ainvoke(self, input: dict, config=None, **kwargs) -> dict:
+        question = input["question"]
+        log_message("RAG Chain ainvoke called with question: %s", preview(question))
+        query_vector, docs = await self._aretrieve(question)
+        answer = await self._agenerate(question, input.get("chat_history"), query_vector, docs)
+        return {"output": answer, "source_documents": docs}
+
+    async def abatch(self, inputs: list, config=None, *, return_exceptions: bool = False, **kwargs) -> list:
+        """
+        All questions are embedded in one request and searched with one
+        multi-vector query, then the LLM calls fan out - at most
+        RAG_BATCH_CONCURRENCY at a time, each also holding a scheduler slot.
+        """
+        if not inputs:
+            return []
+        questions = [input["question"] for input in inputs]
+        log_message("RAG Chain batch called with %d questions", len(questions))
+        vectors, doc_lists = await self._aretrieve_many(questions)
+        semaphore = asyncio.Semaphore(RAG_BATCH_CONCURRENCY)
+
+        async def answer(input, query_vector, docs):
+            async with semaphore:
+                output = await self._agenerate(input["question"], input.get("chat_history"), query_vector, docs)
+            return {"output": output, "source_documents": docs}
+
+        results = await asyncio.gather(
+            *(answer(*args) for args in zip(inputs, vectors, doc_lists)), return_exceptions=True
+        )
+        if not return_exceptions:
+            for result in results:
+                if isinstance(result, Exception):
+                    raise result
+        return results
+
+    async def astream(self, input: dict, config=None, **kwargs):
+        """Yields the source documents first, then the answer token by token"""
+        question = input["question"]
+        log_message("RAG Chain astream called with question: %s", preview(question))
+        query_vector, docs = await self._aretrieve(question)
+        yield AddableDict(source_documents=docs)
+
+        chat_history = input.get("chat_history") or []
+        prompt = self._pack(question, chat_history, docs)
+        history = history_digest(chat_history)
+        answer = self._cached_answer(query_vector, docs, history)
+        if answer is not None:
+            yield AddableDict(output=answer)
+            return
+
+        tokens = []
+        async with self.llm_slot(LANGSERVE_USER):
+            start = time.perf_counter()
+            async for token in self.llm.astream(prompt):
+                tokens.append(token)
+                yield AddableDict(output=token)
+        self._cache_answer(query_vector, docs, "".join(tokens), time.perf_counter() - start, history)
+
+    def invoke(self, input: dict, config=None, **kwargs) -> dict:
+        """Sync entrypoint for scripts - the server goes through ainvoke"""
+        return self._run_sync(self.ainvoke(input, config))
+
+    def batch(self, inputs: list, config=None, *, return_exceptions: bool = False, **kwargs) -> list:
+        return self._run_sync(self.abatch(inputs, config, return_exceptions=return_exceptions))
+
+    def _run_sync(self, coro):
+        # The scheduler and the HTTP sessions belong to the server's loop, so a sync
+        # caller in another thread hands the work to that loop instead of starting its own
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            pass
         else:
-            context = "\n\n".join([d.page_content for d in docs])
-            log_message(f"Context prepared from {len(docs)} documents (total length: {len(context)})")
-        
-        # Format prompt
-        prompt = self.prompt_template.format(context=context, question=question)
-        log_message(f"Prompt prepared (length: {len(prompt)})")
+            coro.close()
+            raise RuntimeError("Sync invoke/batch called inside an event loop, await ainvoke/abatch instead")
+        if self.loop is not None and self.loop.is_running():
+            return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+        return asyncio.run(coro)
+
+    async def _aretrieve_many(self, questions, k=RETRIEVAL_K):
+        """
+        Batch retrieval, returns (query vectors, documents per question).
+        One embedding request and one vector store search for all questions,
+        BM25 runs alongside; fusion and selection are per question.
+        """
+        mode, diversify = RETRIEVAL_MODE, RETRIEVAL_MMR
+        fetch_k = k if mode == "dense" and not diversify else max(k, RETRIEVAL_FETCH_K)
+        empty = [[] for _ in questions]
+        graph = StageGraph("rag_batch", None, QA_STAGE_TIMEOUTS)
+
+        async def embed(results):
+            return await self.embeddings.aembed_documents(questions)
+
+        async def dense_search(results):
+            if results["embed"] is None:
+                return empty
+            return await asyncio.to_thread(self._search_many, results["embed"], fetch_k, None, diversify)
 
+        async def sparse_search(results):
+            return await asyncio.to_thread(lambda: [self._lexical_search(q, fetch_k) for q in questions])
+
+        if mode != "sparse":
+            graph.add("embed", embed, fallback=None)
+            graph.add("dense_search", dense_search, deps=["embed"], fallback=empty)
+        if mode != "dense":
+            graph.add("sparse_search", sparse_search, fallback=empty)
         try:
-            log_message("Calling LLM...")
-            if asyncio.iscoroutinefunction(self.llm):
-                answer = asyncio.run(self.llm(prompt))
-            else:
-                answer = self.llm(prompt)
-            
-            log_message(f"LLM response received (length: {len(answer)})")
-            return {"output": answer, "source_documents": docs}
-            
+            results = await graph.run()
         except Exception as e:
-            error_msg = f"Error in RAG chain invoke: {str(e)}"
-            log_message(error_msg)
-            raise
+            log_message(f"Error searching vector store: {str(e)}")
+            return [None] * len(questions), empty
 
-    async def run(self, question: str, user_id: str, conversation_id: str) -> str:
+        vectors = results.get("embed") or [None] * len(questions)
+        dense = results.get("dense_search", empty)
+        sparse = results.get("sparse_search", empty)
+
+        async def select(question, dense_docs, sparse_docs):
+            if mode == "hybrid":
+                candidates = self._fuse(dense_docs, sparse_docs, fetch_k if diversify else k)
+            else:
+                candidates = dense_docs if mode == "dense" else sparse_docs
+            if not diversify:
+                return candidates[:k]
+            try:
+                return await self._aselect(question, candidates, k)
+            except Exception as e:
+                log_message(f"Candidate selection failed, using the top {k}: {e}")
+                return candidates[:k]
+
+        with span("rag_batch", "select"):
+            doc_lists = await asyncio.gather(*(select(*args) for args in zip(questions, dense, sparse)))
+        return vectors, list(doc_lists)
+
+    def _pack(self, question, chat_history, docs) -> str:
+        prompt, stats = pack_prompt(self.prompt_template, question, chat_history or [], docs)
+        observe_prompt(stats)
+        return prompt
+
+    async def _agenerate(self, question, chat_history, query_vector, docs) -> str:
+        prompt = self._pack(question, chat_history, docs)
+        history = history_digest(chat_history or [])
+        answer = self._cached_answer(query_vector, docs, history)
+        if answer is None:
+            async with self.llm_slot(LANGSERVE_USER):
+                start = time.perf_counter()
+                answer = await self.llm(prompt)
+            self._cache_answer(query_vector, docs, answer, time.perf_counter() - start, history)
+        log_message("LLM response received (length: %d)", len(answer))
+        return answer
+
+    def llm_slot(self, user_id: str):
+        """Scheduler slot around an LLM generation (no-op without a scheduler)"""
+        if self.scheduler is None:
+            return contextlib.nullcontext()
+        return self.scheduler.slot(user_id)
+
+    async def _prepare_prompt(self, question: str, user_id: str, conversation_id: str,
+                              search_params: dict = None, timings: dict = None, trace: dict = None):
+        """
+        Build the prompt from chat history and retrieved context, returns
+        (prompt, query_vector, docs, history) - `history` is the history_digest
+        of what the prompt holds besides question and context, for the answer cache.
+
+        History, summary and retrieval have no dependency on each other and
+        run concurrently; only packing waits for all of them. The stage
+        trace with its critical path is written to `trace` if given.
+        """
+        graph = StageGraph("qa", timings, QA_STAGE_TIMEOUTS)
+        graph.add("history", lambda results: get_recent_messages(user_id, conversation_id), fallback=[])
+        graph.add("summary", lambda results: self._get_summary(user_id, conversation_id), fallback="")
+        self._add_retrieval_stages(graph, question, search_params=search_params)
+
+        async def packing(results):
+            # Merge overlapping / adjacent chunks and fit history + context into the token budget
+            return pack_prompt(
+                self.prompt_template, question, results["history"], results["select"], results["summary"]
+            )
+        graph.add("packing", packing, deps=["history", "summary", "select"])
+
+        results = await graph.run()
+        record("qa", "retrieval", graph.elapsed("select"), timings)
+        if trace is not None:
+            trace.update(graph.trace())
+        log_debug("QA critical path: %s", " -> ".join(graph.critical_path()))
+
+        prompt, stats = results["packing"]
+        observe_prompt(stats)
+        log_message(
+            "Prompt packed: ~%d tokens from %d chunks (%d merged, %d dropped)",
+            stats["prompt_tokens"], stats["chunks_in"], stats["chunks_merged"], stats["chunks_dropped"], **stats
+        )
+        return prompt, results.get("embed"), results["select"], history_digest(results["history"], results["summary"])
+
+    async def _get_summary(self, user_id, conversation_id) -> str:
+        if self.summarizer is None:
+            return ""
+        summary = await get_conversation_summary(user_id, conversation_id)
+        return summary["text"] if summary else ""
+
+    def _cached_answer(self, query_vector, docs, history=""):
+        if self.answer_cache is None or query_vector is None:
+            return None
+        answer = self.answer_cache.lookup(query_vector, [d.metadata.get("id") for d in docs], history)
+        ANSWER_CACHE_LOOKUPS.labels("miss" if answer is None else "hit").inc()
+        return answer
+
+    def _cache_answer(self, query_vector, docs, answer, generation_seconds, history=""):
+        if self.answer_cache is None or query_vector is None or answer.startswith(LLM_ERROR_PREFIX):
+            return
+        self.answer_cache.store(
+            query_vector,
+            [d.metadata.get("id") for d in docs],
+            [d.metadata.get("source", "unknown") for d in docs],
+            answer,
+            generation_seconds,
+            history
+        )
+
+    async def run(self, question: str, user_id: str, conversation_id: str,
+                  search_params: dict = None, timings: dict = None, trace: dict = None) -> str:
         """
         Async version - handles each request independently
-        Multiple concurrent calls will run in parallel
+        Multiple concurrent calls will run in parallel.
+        Per-stage durations in ms are written to `timings` if given, the
+        stage trace (start / end offsets, critical path) to `trace`.
         """            
+        timings = timings if timings is not None else {}
         try:
-            log_message(f"RAG Chain async run called with question: '{question[:100]}...'")
+            log_message("RAG Chain async run called with question: %s", preview(question))
 
-            messages = get_recent_messages(user_id, conversation_id)
-            chat_history = "\n".join(
-                [f"{m['role'].capitalize()}: {m['content']}" for m in messages]
-            )
-            
-            # Retrieve relevant documents (synchronous operation)
-            docs = await asyncio.to_thread(self.get_relevant_documents, question)
-            
-            if not docs:
-                context = "No relevant information found in the knowledge base."
-            else:
-                context = "\n\n".join([d.page_content for d in docs])
-                log_message(f"Context prepared from {len(docs)} documents")
-            
-            prompt = self.prompt_template.format(
-                chat_history=chat_history,
-                context=context, 
-                question=question
+            prompt, query_vector, docs, history = await self._prepare_prompt(
+                question, user_id, conversation_id, search_params, timings, trace
             )
-            
-            # Call LLM asynchronously - this is where concurrent execution happens
-            log_message("Calling LLM asynchronously...")
-            answer = await self.llm(prompt)     
 
-            save_message(user_id, conversation_id, "user", question)
-            save_message(user_id, conversation_id, "assistant", answer)
+            answer = self._cached_answer(query_vector, docs, history)
+            if answer is None:
+                # Call LLM asynchronously - this is where concurrent execution happens
+                log_debug("Calling LLM asynchronously...")
+                wait_start = time.perf_counter()
+                async with self.llm_slot(user_id):
+                    start = time.perf_counter()
+                    record("qa", "queue_wait", start - wait_start, timings)
+                    with span("qa", "generation", timings):
+                        answer = await self.llm(prompt)     
+                    self._cache_answer(query_vector, docs, answer, time.perf_counter() - start, history)
+
+            with span("qa", "save", timings):
+                await save_message(user_id, conversation_id, "user", question)
+                await save_message(user_id, conversation_id, "assistant", answer)
+            if self.summarizer is not None:
+                # Older turns are folded into the rolling summary off the request path
+                self.summarizer.schedule(user_id, conversation_id)
 
             log_message("LLM response received")
             return answer     
@@ -213,4 +634,52 @@ class CustomRAGChain(Runnable):
         except Exception as e:
             error_msg = f"Error in RAG chain run: {str(e)}"
             log_message(error_msg)
-            raise
\ No newline at end of file
+            raise
+
+    async def astream_run(self, question: str, user_id: str, conversation_id: str,
+                          search_params: dict = None, timings: dict = None, trace: dict = None):
+        """
+        Streaming version of run - yields answer tokens as the LLM produces them.
+        The full answer is persisted once the stream has finished.
+        """
+        timings = timings if timings is not None else {}
+        try:
+            log_message("RAG Chain stream called with question: %s", preview(question))
+
+            prompt, query_vector, docs, history = await self._prepare_prompt(
+                question, user_id, conversation_id, search_params, timings, trace
+            )
+
+            answer = self._cached_answer(query_vector, docs, history)
+            if answer is not None:
+                yield answer
+            else:
+                log_debug("Streaming LLM response...")
+                tokens = []
+                wait_start = time.perf_counter()
+                async with self.llm_slot(user_id):
+                    start = time.perf_counter()
+                    record("qa", "queue_wait", start - wait_start, timings)
+                    with span("qa", "generation", timings):
+                        async for token in self.llm.astream(prompt):
+                            if not tokens:
+                                record("qa", "first_token", time.perf_counter() - start, timings)
+                            tokens.append(token)
+                            yield token
+
+                answer = "".join(tokens)
+                self._cache_answer(query_vector, docs, answer, time.perf_counter() - start, history)
+
+            with span("qa", "save", timings):
+                await save_message(user_id, conversation_id, "user", question)
+                await save_message(user_id, conversation_id, "assistant", answer)
+            if self.summarizer is not None:
+                # Older turns are folded into the rolling summary off the request path
+                self.summarizer.schedule(user_id, conversation_id)
+
+            log_message("LLM stream finished (length: %d)", len(answer))
+
+        except Exception as e:
+            error_msg = f"Error in RAG chain stream: {str(e)}"
+            log_message(error_msg)
+            raise
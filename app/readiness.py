@@ -0,0 +1,84 @@
+"""
+Startup warm-up and readiness.
+
+The server imports and starts accepting connections without touching any
+backend. Warm-up steps (load the Ollama models, cache the embedding
+dimension, open the vector store, reach Mongo) then run in the background;
+/readyz reports ready once every required step has succeeded. A failing
+required step is retried with backoff, so the server recovers by itself
+when a dependency comes up late instead of failing at import.
+"""
+from typing import Awaitable, Callable, List, Tuple
+from utils import log_message
+import asyncio
+import time
+
+# (name, step, required) - optional steps are attempted once and only logged on failure
+WarmUpStep = Tuple[str, Callable[[], Awaitable], bool]
+
+class Readiness:
+    def __init__(self, retry_seconds: float = 2.0, max_retry_seconds: float = 60.0):
+        self.retry_seconds = retry_seconds
+        self.max_retry_seconds = max_retry_seconds
+        self.steps = {}
+        self.started_at = time.time()
+        self.ready_at = None
+        self._required = set()
+        self._task = None
+
+    @property
+    def ready(self) -> bool:
+        return self.ready_at is not None
+
+    def start(self, steps: List[WarmUpStep]):
+        """Run the warm-up in the background, must be called from the running event loop"""
+        self._required = {name for name, _, required in steps if required}
+        self._task = asyncio.create_task(self._run(steps))
+        return self._task
+
+    async def stop(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def _run(self, steps):
+        delay = self.retry_seconds
+        pending = list(steps)
+        while pending:
+            # In order - later steps may depend on earlier ones (e.g. the store needs the dimension)
+            name, step, required = pending[0]
+            if await self._attempt(name, step) or not required:
+                pending.pop(0)
+                delay = self.retry_seconds
+                continue
+
+            log_message(f"Warm-up step '{name}' failed, retrying in {delay:.0f}s")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_retry_seconds)
+
+        self.ready_at = time.time()
+        log_message(f"Server ready after {self.ready_at - self.started_at:.2f}s")
+
+    async def _attempt(self, name, step) -> bool:
+        start = time.perf_counter()
+        state = self.steps.setdefault(name, {"ok": False, "attempts": 0})
+        state["attempts"] += 1
+        try:
+            await step()
+            state.update(ok=True, ms=round((time.perf_counter() - start) * 1000, 1), error=None)
+            log_message(f"Warm-up step '{name}' done in {state['ms']:.0f}ms")
+            return True
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            state.update(ok=False, ms=round((time.perf_counter() - start) * 1000, 1), error=str(e))
+            log_message(f"Warm-up step '{name}' failed: {e}")
+            return False
+
+    def to_dict(self) -> dict:
+        return {
+            "ready": self.ready,
+            "uptime_seconds": round(time.time() - self.started_at, 1),
+            "ready_after_seconds": round(self.ready_at - self.started_at, 2) if self.ready else None,
+            "steps": {name: {**state, "required": name in self._required} for name, state in self.steps.items()}
+        }
@@ -0,0 +1,80 @@
+"""
+Selection of the final k chunks from an over-fetched candidate set.
+
+Retrieval returns RETRIEVAL_FETCH_K candidates; an optional CPU reranker
+rescores them against the query (within RERANK_BUDGET_MS, otherwise the
+retrieval scores are kept), then maximal marginal relevance picks k that
+are relevant but not redundant, so near-duplicate chunks of one page don't
+fill every slot.
+
+A reranker is any object with `score(query, texts) -> list of floats`
+(higher is more relevant). RERANKER_MODEL names a sentence-transformers
+cross-encoder, e.g. "cross-encoder/ms-marco-MiniLM-L-6-v2".
+"""
+from typing import List, Optional, Sequence
+from utils import log_message
+import numpy as np
+
+def normalize_scores(scores: Sequence[float]) -> np.ndarray:
+    """Min-max scale to [0, 1], so relevance and cosine redundancy are comparable"""
+    scores = np.asarray(scores, dtype=np.float32)
+    spread = float(scores.max() - scores.min()) if len(scores) else 0.0
+    if spread < 1e-9:
+        return np.ones_like(scores)
+    return (scores - scores.min()) / spread
+
+def mmr(relevance: Sequence[float], vectors, k: int, lambda_mult: float = 0.7) -> List[int]:
+    """
+    Indexes of `k` candidates chosen by maximal marginal relevance, in pick order.
+
+    `relevance` is in [0, 1]; each step takes the candidate maximizing
+    lambda * relevance - (1 - lambda) * max cosine similarity to the ones
+    already picked. lambda_mult=1 is plain relevance order.
+    """
+    relevance = np.asarray(relevance, dtype=np.float32)
+    n = len(relevance)
+    k = min(k, n)
+    if k <= 0:
+        return []
+
+    matrix = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    matrix = matrix / np.maximum(norms, 1e-12)
+    similarity = matrix @ matrix.T      # n x n, n is a few dozen
+
+    selected = [int(np.argmax(relevance))]
+    redundancy = similarity[selected[0]].copy()
+    taken = np.zeros(n, dtype=bool)
+    taken[selected[0]] = True
+    for _ in range(k - 1):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[taken] = -np.inf
+        pick = int(np.argmax(scores))
+        selected.append(pick)
+        taken[pick] = True
+        np.maximum(redundancy, similarity[pick], out=redundancy)
+    return selected
+
+class CrossEncoderReranker:
+    """sentence-transformers cross-encoder on CPU, loaded on first use"""
+    def __init__(self, model_name: str, max_length: int = 512):
+        self.model_name = model_name
+        self.max_length = max_length
+        self._model = None
+
+    def score(self, query: str, texts: List[str]) -> List[float]:
+        if self._model is None:
+            from sentence_transformers import CrossEncoder
+            self._model = CrossEncoder(self.model_name, max_length=self.max_length, device="cpu")
+            log_message(f"Reranker {self.model_name} loaded")
+        return [float(s) for s in self._model.predict([(query, text) for text in texts])]
+
+def load_reranker(model_name: Optional[str]):
+    if not model_name:
+        return None
+    try:
+        import sentence_transformers  # noqa: F401
+    except ImportError:
+        log_message(f"RERANKER_MODEL={model_name} needs sentence-transformers, reranking disabled")
+        return None
+    return CrossEncoderReranker(model_name)
@@ -0,0 +1,132 @@
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from utils import log_message
+import asyncio
+import math
+import time
+
+class QueueFullError(Exception):
+    """Raised when the QA queue is at its depth limit"""
+    def __init__(self, retry_after: int):
+        super().__init__(f"QA queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+class QAScheduler:
+    """
+    Admits at most `max_concurrent` LLM generations at a time.
+
+    Requests beyond that wait in a per-user FIFO, and users are served
+    round-robin so one user with many questions in flight cannot starve
+    the others. Once `max_queue_depth` requests are waiting, new ones are
+    rejected with QueueFullError instead of piling up.
+    """
+    def __init__(self, max_concurrent: int = 4, max_queue_depth: int = 32):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue_depth = max(0, max_queue_depth)
+        self._queues = OrderedDict()    # user_id -> deque of waiter futures, in round-robin order
+        self._queued = 0
+        self._in_flight = 0
+        self._admitted = 0
+        self._rejected = 0
+        self._total_wait = 0.0
+        self._avg_generation = None     # EWMA of seconds a slot is held
+        log_message(
+            f"QA scheduler: max_concurrent={self.max_concurrent}, max_queue_depth={self.max_queue_depth}"
+        )
+
+    @asynccontextmanager
+    async def slot(self, user_id: str):
+        """Hold one generation slot for the duration of the block"""
+        wait = await self.acquire(user_id)
+        start = time.perf_counter()
+        try:
+            yield wait
+        finally:
+            self._record_generation(time.perf_counter() - start)
+            self.release()
+
+    def check_capacity(self):
+        """Fail fast before doing any work for a request that would be rejected anyway"""
+        if self._queued >= self.max_queue_depth and self._in_flight >= self.max_concurrent:
+            self._rejected += 1
+            raise QueueFullError(self.retry_after())
+
+    async def acquire(self, user_id: str) -> float:
+        """Wait for a slot, returns the time spent queued in seconds"""
+        if self._in_flight < self.max_concurrent and self._queued == 0:
+            self._in_flight += 1
+            self._admitted += 1
+            return 0.0
+
+        self.check_capacity()
+
+        start = time.perf_counter()
+        waiter = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(user_id, deque()).append(waiter)
+        self._queued += 1
+
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed to us just as we were cancelled - pass it on
+                self.release()
+            else:
+                self._remove_waiter(user_id, waiter)
+            raise
+
+        wait = time.perf_counter() - start
+        self._admitted += 1
+        self._total_wait += wait
+        return wait
+
+    def release(self):
+        self._in_flight -= 1
+        self._dispatch()
+
+    def retry_after(self) -> int:
+        """Rough estimate of seconds until the current queue drains"""
+        per_generation = self._avg_generation or 10.0
+        return max(1, math.ceil((self._queued + 1) / self.max_concurrent * per_generation))
+
+    def metrics(self) -> dict:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queue_depth": self.max_queue_depth,
+            "in_flight": self._in_flight,
+            "queued": self._queued,
+            "queued_users": len(self._queues),
+            "admitted_total": self._admitted,
+            "rejected_total": self._rejected,
+            "avg_wait_ms": round(self._total_wait / self._admitted * 1000, 1) if self._admitted else 0.0,
+            "avg_generation_ms": round((self._avg_generation or 0.0) * 1000, 1)
+        }
+
+    def _dispatch(self):
+        while self._in_flight < self.max_concurrent and self._queues:
+            user_id, queue = self._queues.popitem(last=False)
+            waiter = queue.popleft()
+            self._queued -= 1
+            if queue:
+                # Back of the line until every other waiting user has had a turn
+                self._queues[user_id] = queue
+
+            if waiter.done():
+                continue
+
+            self._in_flight += 1
+            waiter.set_result(None)
+
+    def _remove_waiter(self, user_id, waiter):
+        queue = self._queues.get(user_id)
+        if queue and waiter in queue:
+            queue.remove(waiter)
+            self._queued -= 1
+            if not queue:
+                del self._queues[user_id]
+
+    def _record_generation(self, seconds):
+        if self._avg_generation is None:
+            self._avg_generation = seconds
+        else:
+            self._avg_generation = 0.8 * self._avg_generation + 0.2 * seconds
@@ -1,34 +1,59 @@
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Request
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.concurrency import run_in_threadpool
-from langserve import add_routes
+from sse_starlette.sse import EventSourceResponse
 import tempfile
 from pydantic import BaseModel
 from rag_chain import CustomRAGChain
 from prompt_template import PROMPT
 from embeddings import NomicEmbeddings
 from llm import OllamaLLM
-from document_loaders import load_pdf, load_web, load_word
-from text_splitter import split_documents
-from utils import log_message
-from typing import List, Dict, Any
+from document_loaders import iter_pdf, iter_web, iter_word
+from utils import log_message, preview
+from typing import List, Dict, Any, Optional
 import os
 import asyncio
-from auth import get_current_user
-from memory import chat_memory_collection
-from db import conversations_collection
+import itertools
+import json
+import time
+from auth import get_current_user, jwks_cache
+from memory import (
+    list_messages, list_conversations, iter_messages, iter_conversations, message_writer, conversation_cache, create_conversation as store_conversation,
+    get_conversation, set_conversation_title
+)
+from db import conversations_collection, client as mongo_client, ensure_indexes
+from pagination import encode_cursor, decode_cursor, page_size
 from uuid import uuid4
 from datetime import datetime
 from fastapi import FastAPI, UploadFile, File
-from faster_whisper import WhisperModel
 import shutil
 import os
-from deep_translator import GoogleTranslator
 from title_prompt import TITLE_PROMPT
+from ingest_jobs import IngestJob, IngestJobManager
+from scheduler import QAScheduler, QueueFullError
+from answer_cache import SemanticAnswerCache
+from summarizer import ConversationSummarizer
+from rerank import load_reranker
+from readiness import Readiness
+import metrics
+from config import (
+    OLLAMA_NUM_PARALLEL, QA_MAX_QUEUE_DEPTH, INGEST_MAX_WORKERS, INGEST_MAX_RETAINED_JOBS,
+    ANSWER_CACHE_ENABLED, ANSWER_CACHE_THRESHOLD, ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_TTL_SECONDS,
+    METRICS_TIMING_HEADER, WARMUP_RETRY_SECONDS, WARMUP_MAX_RETRY_SECONDS, SUMMARY_ENABLED,
+    RERANKER_MODEL
+)
+
+# Optional - /rag is only mounted when LangServe is installed
+try:
+    from langserve import add_routes
+except ImportError:
+    add_routes = None
 
 # Setup App
 app = FastAPI(title="RAG API", version="1.0")
 
+# from faster_whisper import WhisperModel
 # model = WhisperModel(
 #     "medium",
 #     device="cpu"
@@ -41,24 +66,53 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "X-Next-Cursor"],
 )
 
+@app.middleware("http")
+async def record_request_duration(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    # Route template rather than the raw path, so IDs don't explode the label set
+    route = request.scope.get("route")
+    metrics.HTTP_REQUEST_SECONDS.labels(
+        request.method, route.path if route else "unmatched", str(response.status_code)
+    ).observe(time.perf_counter() - start)
+    return response
+
 # Global variables
 rag_chain = None
 embeddings = NomicEmbeddings()
 llm = OllamaLLM()
-qa_lock = asyncio.Lock()  # Lock for sequential QA processing
+# Bounds concurrent LLM generations; retrieval and history lookups are not gated
+scheduler = QAScheduler(max_concurrent=OLLAMA_NUM_PARALLEL, max_queue_depth=QA_MAX_QUEUE_DEPTH)
+answer_cache = SemanticAnswerCache(
+    threshold=ANSWER_CACHE_THRESHOLD,
+    max_entries=ANSWER_CACHE_MAX_ENTRIES,
+    ttl_seconds=ANSWER_CACHE_TTL_SECONDS
+) if ANSWER_CACHE_ENABLED else None
+
+metrics.watch_scheduler(scheduler)
+if answer_cache:
+    metrics.watch_answer_cache(answer_cache)
+if conversation_cache:
+    metrics.watch_conversation_cache(conversation_cache)
 
 class QARequest(BaseModel):
     question: str
     conversation_id: str
+    search_params: Optional[Dict[str, Any]] = None     # e.g. {"ef": 128} or {"nprobe": 32}
 
 def initialize_rag_chain():
-    """Initialize RAG chain with Milvus integration"""
+    """Create the RAG chain - cheap, the vector store is opened during warm-up"""
     global rag_chain
     
     try:
-        rag_chain = CustomRAGChain(embeddings, llm, PROMPT)
+        summarizer = ConversationSummarizer(llm, scheduler.slot) if SUMMARY_ENABLED else None
+        rag_chain = CustomRAGChain(
+            embeddings, llm, PROMPT, scheduler=scheduler, answer_cache=answer_cache, summarizer=summarizer,
+            reranker=load_reranker(RERANKER_MODEL)
+        )
         log_message("RAG chain initialized successfully")
         return rag_chain
         
@@ -69,16 +123,74 @@ def initialize_rag_chain():
 # Initialize on startup
 initialize_rag_chain()
 
+readiness = Readiness(retry_seconds=WARMUP_RETRY_SECONDS, max_retry_seconds=WARMUP_MAX_RETRY_SECONDS)
+
+async def warm_up_reranker():
+    # Loading the model takes seconds, far past the per-request budget - do it before the first request
+    if rag_chain.reranker is not None:
+        await asyncio.to_thread(rag_chain.reranker.score, "warm up", ["warm up"])
+
+async def ping_mongo():
+    # A real round trip - creating the client doesn't connect
+    await conversations_collection.find_one({}, {"_id": 1})
+
 @app.on_event("startup")
 async def startup_event():
+    ingest_jobs.start()
+    # Kept on app.state so the prefetch can't be garbage-collected mid-flight
+    app.state.jwks_warm_up = jwks_cache.warm_up()
+    rag_chain.loop = asyncio.get_running_loop()
+    readiness.start([
+        ("embeddings", embeddings.warm_up, True),        # loads the model, caches the dimension
+        ("vector_store", lambda: asyncio.to_thread(rag_chain.initialize), True),
+        ("mongo", ping_mongo, True),
+        ("mongo_indexes", ensure_indexes, False),
+        ("llm", llm.warm_up, False),
+        ("reranker", warm_up_reranker, False),
+    ])
     log_message("FastAPI application started")
 
+def require_ready():
+    if not readiness.ready:
+        raise HTTPException(
+            status_code=503,
+            detail="Server is warming up",
+            headers={"Retry-After": str(int(WARMUP_RETRY_SECONDS) or 1)}
+        )
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness - the process is up and serving requests"""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness - 200 once the warm-up finished, 503 with the step states before that"""
+    state = readiness.to_dict()
+    return JSONResponse(state, status_code=200 if readiness.ready else 503)
+
 @app.on_event("shutdown")
 async def shutdown_event():
     global llm
+    await readiness.stop()
+    await ingest_jobs.stop()
+    if rag_chain and rag_chain.summarizer:
+        await rag_chain.summarizer.stop()
+    await finish_background_tasks()
+    # Buffered chat messages must reach Mongo before the client goes
+    await message_writer.stop()
     if llm:
         await llm.close()
         log_message("LLM session closed")
+    await embeddings.close()
+    warm_up = getattr(app.state, "jwks_warm_up", None)
+    if warm_up is not None and not warm_up.done():
+        warm_up.cancel()
+        await asyncio.gather(warm_up, return_exceptions=True)
+    await jwks_cache.close()
+    if rag_chain and rag_chain.ready:
+        await asyncio.to_thread(rag_chain.store.close)
+    mongo_client.close()
 
 
 async def generate_chat_title(llm, question: str):
@@ -91,72 +203,119 @@ async def generate_chat_title(llm, question: str):
 
     return title
 
-async def process_ingestion(
-    file_content: bytes = None,
-    filename: str = None,
-    url: str = None
-) -> Dict[str, Any]:
+async def update_chat_title(user_id: str, conversation_id: str, question: str):
+    """Give a fresh conversation a title generated from its first question"""
+    convo = await get_conversation(user_id, conversation_id)
 
-    global rag_chain
+    if convo and convo["title"] == "New Chat":
+
+        async with rag_chain.llm_slot(user_id):
+            with metrics.span("qa", "title_generation"):
+                title = await generate_chat_title(rag_chain.llm, question)
+
+        await set_conversation_title(user_id, conversation_id, title, only_if="New Chat")
+
+# Post-response work (titles) - kept referenced until done, waited for at shutdown
+background_tasks = set()
 
+def run_in_background(coro):
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+async def finish_background_tasks(timeout: float = 10):
+    if background_tasks:
+        done, pending = await asyncio.wait(set(background_tasks), timeout=timeout)
+        for task in pending:
+            task.cancel()
+
+titles_in_progress = set()
+
+async def title_in_background(user_id: str, conversation_id: str, question: str):
+    # A quick second question must not start another title for the same conversation
+    if conversation_id in titles_in_progress:
+        return
+    titles_in_progress.add(conversation_id)
     try:
-        docs = []
-        # 1. Log ingestion request
-        log_message(
-            f"[INGEST] file={filename}, "
-            f"bytes={len(file_content) if file_content else 0}, "
-            f"url={url}"
-        )
+        await update_chat_title(user_id, conversation_id, question)
+    except QueueFullError:
+        log_message(f"Title for {conversation_id} skipped, QA queue full")
+    except Exception as e:
+        log_message(f"Title generation failed for {conversation_id}: {e}")
+    finally:
+        titles_in_progress.discard(conversation_id)
 
-        # ---- FILE UPLOAD HANDLING ----
-        if file_content and filename:
-            log_message(f"[INGEST] Detected uploaded file: {filename}")
-            
-            class FileWrapper:
-                def __init__(self, content, filename):
-                    self.content = content
-                    self.filename = filename
-                def getvalue(self):
-                    return self.content
-                @property
-                def name(self):
-                    return self.filename
-
-            file_wrapper = FileWrapper(file_content, filename)
-
-            # PDF
-            if filename.lower().endswith(".pdf"):
-                log_message("[INGEST] Routing to PDF loader")
-                docs.extend(await run_in_threadpool(load_pdf, file_wrapper))
-
-            elif filename.lower().endswith(".docx"):
-                log_message("[INGEST] Routing to WORD loader")
-                docs.extend(await run_in_threadpool(load_word, file_wrapper))
-            
+async def process_ingestion(job: IngestJob) -> Dict[str, Any]:
+    """
+    Runs on an ingestion worker. Pages are loaded lazily and streamed
+    through split -> embed -> insert, so nothing is materialized up front.
+    """
 
-        # ---- WEB URL ----
-        if url:
-            docs.extend(await run_in_threadpool(load_web, url))
+    global rag_chain
 
-        if not docs:
-            return {"message": "No documents to ingest", "doc_count": 0}
+    file_content, filename, url = job.file_content, job.filename, job.url
+    sources = []
+    # 1. Log ingestion request
+    log_message(
+        f"[INGEST] file={filename}, "
+        f"bytes={len(file_content) if file_content else 0}, "
+        f"url={url}"
+    )
 
-        # ---- SPLIT / CHUNK ----
-        docs = await run_in_threadpool(split_documents, docs)
+    # ---- FILE UPLOAD HANDLING ----
+    if file_content and filename:
+        log_message(f"[INGEST] Detected uploaded file: {filename}")
+        
+        class FileWrapper:
+            def __init__(self, content, filename):
+                self.content = content
+                self.filename = filename
+            def getvalue(self):
+                return self.content
+            @property
+            def name(self):
+                return self.filename
+
+        file_wrapper = FileWrapper(file_content, filename)
+
+        # PDF
+        if filename.lower().endswith(".pdf"):
+            log_message("[INGEST] Routing to PDF loader")
+            sources.append(iter_pdf(file_wrapper))
+
+        elif filename.lower().endswith(".docx"):
+            log_message("[INGEST] Routing to WORD loader")
+            sources.append(iter_word(file_wrapper))
+        
 
-        # ---- ADD TO VECTOR DB ----
-        result = rag_chain.add_documents(docs)
+    # ---- WEB URL ----
+    if url:
+        sources.append(iter_web(url))
 
-        return result
+    def pages():
+        for page in itertools.chain.from_iterable(sources):
+            job.pages_loaded += 1
+            yield page
+
+    # ---- SPLIT / EMBED / INSERT, streamed in batches ----
+    with metrics.span("ingest", "job"):
+        return await rag_chain.add_documents(pages(), progress=job)
 
-    except Exception as e:
-        log_message(f"Error in process_ingestion: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
 
+ingest_jobs = IngestJobManager(
+    process_ingestion,
+    max_workers=INGEST_MAX_WORKERS,
+    max_retained_jobs=INGEST_MAX_RETAINED_JOBS
+)
 
-@app.post("/ingest")
+@app.post("/ingest", status_code=202)
 async def ingest_documents(file: UploadFile = File(None), url: str = Form(None)):
-    """Single document ingestion endpoint"""
+    """Submit a document for ingestion - returns a job ID to poll at GET /ingest/{job_id}"""
+    if not file and not url:
+        raise HTTPException(status_code=400, detail="Provide a file or a url")
+    require_ready()
+
     try:
         file_content = None
         filename = None
@@ -165,63 +324,173 @@ async def ingest_documents(file: UploadFile = File(None), url: str = Form(None))
             file_content = await file.read()
             filename = file.filename
         
-        result = await process_ingestion(file_content, filename, url)
-        return result
+        job = ingest_jobs.submit(file_content, filename, url)
+        return {
+            "job_id": job.job_id,
+            "status": job.status,
+            "message": f"Ingestion job {job.job_id} queued"
+        }
         
-    except HTTPException:
-        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
 
+@app.get("/ingest/{job_id}")
+async def ingest_status(job_id: str):
+    """Stage, progress, throughput and errors of an ingestion job"""
+    job = ingest_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown ingestion job")
+    return job.to_dict()
+
+@app.delete("/ingest/{job_id}")
+async def cancel_ingestion(job_id: str):
+    """Cancel a queued or running ingestion job"""
+    job = ingest_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown ingestion job")
+    if not ingest_jobs.cancel(job_id):
+        raise HTTPException(status_code=409, detail=f"Job already {job.status}")
+    return {"job_id": job_id, "status": "cancelling"}
+
 @app.post("/qa")
 async def question_answer(req: QARequest, request: Request):
     """
-    QA endpoint - processes ONE request at a time (sequential)
-    Other requests will wait in queue until the current one completes
+    QA endpoint - requests run concurrently, only the LLM generations go
+    through the scheduler (fair per-user queue, 429 once the queue is full)
     """
-    global qa_lock
-    
     try:
-        if not rag_chain:
-            raise HTTPException(
-                status_code=400, 
-                detail="RAG chain not initialized. Please ingest documents first."
-            )
+        require_ready()
+        
+        scheduler.check_capacity()
+        start = time.perf_counter()
+        log_message("[PROCESSING] QA request: %s", preview(req.question, 50))
+
+        user_id = await get_current_user(request)
+
+        # Call RAG chain's async run method
+        timings = {}
+        debug_timing = METRICS_TIMING_HEADER or bool(request.headers.get("X-Debug-Timing"))
+        trace = {} if debug_timing else None
+        answer = await rag_chain.run(
+            question=req.question,
+            user_id=user_id,
+            conversation_id=req.conversation_id,
+            search_params=req.search_params,
+            timings=timings,
+            trace=trace
+        )
+        
+        metrics.record("qa", "total", time.perf_counter() - start)
+        log_message("[COMPLETED] QA request: %s", preview(req.question, 50))
+
+        # A fresh conversation gets its title after the answer, off the request path
+        run_in_background(title_in_background(user_id, req.conversation_id, req.question))
         
-        # Acquire lock - only one request can proceed at a time
-        async with qa_lock:
-            log_message(f"[PROCESSING] QA request: {req.question[:50]}...")
+        content = {"answer": answer, "timings": {name: round(ms, 1) for name, ms in timings.items()}}
+        if debug_timing:
+            # Stage start / end offsets and the critical path up to the LLM call
+            content["trace"] = trace
+            return JSONResponse(content, headers={"Server-Timing": metrics.server_timing(timings)})
+        return content
+            
+    except HTTPException:
+        raise
+    except QueueFullError as e:
+        raise queue_full_response(e)
+    except Exception as e:
+        log_message(f"Error in QA endpoint: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
 
-            user_id = get_current_user(request)
+@app.post("/qa/stream")
+async def question_answer_stream(req: QARequest, request: Request):
+    """
+    Streaming QA endpoint - sends answer tokens as Server-Sent Events.
 
-            # Check existing conversation
-            convo = conversations_collection.find_one({"_id": req.conversation_id})
+    Events: "token" ({"token": ...}) for every generated piece, then a final
+    "done" with {"ttft_ms", "total_ms", "timings"} (per-stage ms, plus the
+    stage "trace" with X-Debug-Timing), or "error" if generation failed.
+    """
+    require_ready()
+
+    try:
+        scheduler.check_capacity()
+    except QueueFullError as e:
+        raise queue_full_response(e)
 
-            if convo and convo["title"] == "New Chat":
+    user_id = await get_current_user(request)
+    start = time.perf_counter()
 
-                title = await generate_chat_title(rag_chain.llm, req.question)
+    trace = {} if METRICS_TIMING_HEADER or request.headers.get("X-Debug-Timing") else None
 
-                conversations_collection.update_one(
-                    {"_id": req.conversation_id},
-                    {"$set": {"title": title}}
-                )
+    async def event_stream():
+        ttft_ms = None
+        timings = {}
+        try:
+            log_message("[PROCESSING] Streaming QA request: %s", preview(req.question, 50))
 
-            # Call RAG chain's async run method
-            answer = await rag_chain.run(
+            async for token in rag_chain.astream_run(
                 question=req.question,
                 user_id=user_id,
-                conversation_id=req.conversation_id
+                conversation_id=req.conversation_id,
+                search_params=req.search_params,
+                timings=timings,
+                trace=trace
+            ):
+                if ttft_ms is None:
+                    ttft_ms = (time.perf_counter() - start) * 1000
+                yield {"event": "token", "data": json.dumps({"token": token})}
+
+            total_ms = (time.perf_counter() - start) * 1000
+            metrics.record("qa", "total", total_ms / 1000)
+            run_in_background(title_in_background(user_id, req.conversation_id, req.question))
+            log_message(
+                "[COMPLETED] Streaming QA request: %s (ttft=%.0fms, total=%.0fms)",
+                preview(req.question, 50), ttft_ms or 0, total_ms
             )
-            
-            log_message(f"[COMPLETED] QA request: {req.question[:50]}...")
-        
-        return {"answer": answer}
-            
-    except HTTPException:
-        raise
-    except Exception as e:
-        log_message(f"Error in QA endpoint: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
+            yield {
+                "event": "done",
+                "data": json.dumps({
+                    "ttft_ms": round(ttft_ms or total_ms, 1),
+                    "total_ms": round(total_ms, 1),
+                    "timings": {name: round(ms, 1) for name, ms in timings.items()},
+                    **({"trace": trace} if trace is not None else {})
+                })
+            }
+
+        except QueueFullError as e:
+            yield {"event": "error", "data": json.dumps({"detail": str(e), "retry_after": e.retry_after})}
+        except Exception as e:
+            log_message(f"Error in streaming QA endpoint: {str(e)}")
+            yield {"event": "error", "data": json.dumps({"detail": str(e)})}
+
+    return EventSourceResponse(event_stream())
+
+def queue_full_response(e: QueueFullError) -> HTTPException:
+    log_message(f"[REJECTED] QA queue full, retry after {e.retry_after}s")
+    return HTTPException(
+        status_code=429,
+        detail=str(e),
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus scrape endpoint"""
+    body, content_type = metrics.render()
+    return Response(body, media_type=content_type)
+
+@app.get("/qa/stats")
+async def qa_stats():
+    """Queue metrics of the QA scheduler, cache hit rates and coalesced upstream calls"""
+    return {
+        "scheduler": scheduler.metrics(),
+        "answer_cache": answer_cache.stats() if answer_cache else None,
+        "conversation_cache": conversation_cache.stats() if conversation_cache else None,
+        "coalescing": {
+            flight.name: flight.stats()
+            for flight in (llm.generate_flight, llm.stream_flight, embeddings.query_flight)
+        }
+    }
     
 # @app.post("/transcribe")
 # async def transcribe(
@@ -259,6 +528,12 @@ class TranslateRequest(BaseModel):
 
 @app.post("/translate")
 async def translate(req: TranslateRequest):
+    # Imported on first use, it's slow to import and optional
+    try:
+        from deep_translator import GoogleTranslator
+    except ImportError:
+        raise HTTPException(status_code=501, detail="Translation is not available (deep_translator not installed)")
+
     translated = GoogleTranslator(
         source=req.source_lang.split("-")[0],
         target="en"
@@ -269,78 +544,95 @@ async def translate(req: TranslateRequest):
 
 from fastapi import Request
 
+def parse_cursor(cursor: Optional[str]):
+    try:
+        return decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def list_response(fetch, iterate, render, limit: Optional[int], cursor: Optional[str]):
+    """
+    One page as a plain JSON array, the cursor of the next page (if any) in
+    X-Next-Cursor. When the client asked for neither a limit nor a cursor,
+    everything - as these endpoints did before paging - streamed batch by
+    batch off the Mongo cursor instead of built up in memory first.
+    """
+    if limit is None and cursor is None:
+        return StreamingResponse(json_array(iterate(), render), media_type="application/json")
+    items, next_after = await fetch(page_size(limit), parse_cursor(cursor))
+    headers = {"X-Next-Cursor": encode_cursor(next_after)} if next_after else None
+    return JSONResponse([render(item) for item in items], headers=headers)
+
+async def json_array(batches, render):
+    """A JSON array written one batch of items at a time"""
+    separator = "["
+    async for batch in batches:
+        if batch:
+            yield separator + ",".join(json.dumps(render(item)) for item in batch)
+            separator = ","
+    yield "]" if separator == "," else "[]"
+
+def render_message(m: dict) -> dict:
+    return {"role": m["role"], "content": m["content"]}
+
 @app.get("/chats")
-async def get_chats(request: Request):
-    user_id = get_current_user(request)
+async def get_chats(request: Request, limit: Optional[int] = None, cursor: Optional[str] = None):
+    """
+    The user's messages across conversations - all of them, or with `limit` /
+    `cursor` the newest page first (older pages via X-Next-Cursor)
+    """
+    user_id = await get_current_user(request)
 
-    chats = (
-        chat_memory_collection
-        .find({"user_id": user_id})
-        .sort("created_at", 1)
+    # Includes messages still in the write-behind buffer
+    return await list_response(
+        lambda n, after: list_messages(user_id, limit=n, cursor=after),
+        lambda: iter_messages(user_id),
+        render_message, limit, cursor
     )
 
-    return [
-        {
-            "role": c["role"],
-            "content": c["content"]
-        }
-        for c in chats
-    ]
-
 from uuid import uuid4
 from db import conversations_collection
 
 @app.post("/conversations")
 async def create_conversation(request: Request):
 
-    user_id = get_current_user(request)
+    user_id = await get_current_user(request)
 
     convo_id = str(uuid4())
 
-    conversations_collection.insert_one({
-        "_id": convo_id,
-        "user_id": user_id,
-        "title": "New Chat",
-        "created_at": datetime.utcnow()
-    })
+    await store_conversation(user_id, convo_id)
 
     return {"conversation_id": convo_id}
 
 @app.get("/conversations")
-async def get_conversations(request: Request):
-
-    user_id = get_current_user(request)
-
-    convos = conversations_collection.find({"user_id": user_id})
-
-    return [
-        {
-            "id": c["_id"],
-            "title": c["title"]
-        }
-        for c in convos
-    ]
+async def get_conversations(request: Request, limit: Optional[int] = None, cursor: Optional[str] = None):
+    """The user's conversations, newest first - all of them, or pages of `limit` (more via X-Next-Cursor)"""
+    user_id = await get_current_user(request)
+
+    return await list_response(
+        lambda n, after: list_conversations(user_id, limit=n, cursor=after),
+        lambda: iter_conversations(user_id),
+        lambda c: {"id": c["_id"], "title": c["title"]}, limit, cursor
+    )
 
 @app.get("/messages/{conversation_id}")
-async def get_messages(conversation_id: str, request: Request):
-
-    user_id = get_current_user(request)
-
-    msgs = chat_memory_collection.find({
-        "user_id": user_id,
-        "conversation_id": conversation_id
-    }).sort("created_at", 1)
+async def get_messages(conversation_id: str, request: Request,
+                       limit: Optional[int] = None, cursor: Optional[str] = None):
+    """
+    A conversation's messages oldest first - all of them, or with `limit` /
+    `cursor` the newest page (earlier ones via the X-Next-Cursor cursor)
+    """
+    user_id = await get_current_user(request)
 
-    return [
-        {
-            "role": m["role"],
-            "content": m["content"]
-        }
-        for m in msgs
-    ]
+    # Includes messages still in the write-behind buffer
+    return await list_response(
+        lambda n, after: list_messages(user_id, conversation_id, limit=n, cursor=after),
+        lambda: iter_messages(user_id, conversation_id),
+        render_message, limit, cursor
+    )
 
 # Add LangServe routes
-if rag_chain:
+if rag_chain and add_routes:
     add_routes(app, rag_chain, path="/rag") 
 
 if __name__ == "__main__":
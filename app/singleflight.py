@@ -0,0 +1,118 @@
+"""
+Single-flight coalescing of identical upstream calls.
+
+While a call for a key is in flight, further calls for the same key don't
+go upstream again - they wait for the same result (or error). For streams
+every subscriber gets all tokens from the start, however late it joined.
+The upstream work is cancelled once every waiter has gone. Calls only
+coalesce within one event loop.
+"""
+from typing import Any, AsyncIterator, Awaitable, Callable, Hashable
+from metrics import UPSTREAM_CALLS
+import asyncio
+
+class _Flight:
+    __slots__ = ("task", "waiters", "tokens", "done", "changed")
+
+    def __init__(self):
+        self.task = None
+        self.waiters = 0
+        self.tokens = []                # streams only - everything produced so far
+        self.done = False
+        self.changed = asyncio.Event()  # streams only - set (and replaced) on every new token
+
+class SingleFlight:
+    def __init__(self, name: str, enabled: bool = True):
+        self.name = name
+        self.enabled = enabled
+        self._flights = {}      # (loop, key) -> _Flight
+        self.calls = 0
+        self.coalesced = 0
+
+    def _join(self, key, start):
+        key = (asyncio.get_running_loop(), key)
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = _Flight()
+            flight.task = asyncio.ensure_future(start(flight))
+            flight.task.add_done_callback(lambda task: self._finished(key, flight, task))
+            self.calls += 1
+            UPSTREAM_CALLS.labels(self.name, "upstream").inc()
+        else:
+            self.coalesced += 1
+            UPSTREAM_CALLS.labels(self.name, "coalesced").inc()
+        flight.waiters += 1
+        return key, flight
+
+    def _leave(self, key, flight):
+        flight.waiters -= 1
+        if flight.waiters == 0 and not flight.task.done():
+            # Nobody wants the result anymore - new callers start over instead of joining a cancelled call
+            self._forget(key, flight)
+            flight.task.cancel()
+
+    def _finished(self, key, flight, task):
+        self._forget(key, flight)
+        if not task.cancelled():
+            task.exception()    # the waiters re-raise it - don't let asyncio log it as never retrieved
+
+    def _forget(self, key, flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]):
+        """Result of `fn()`, shared with every concurrent call for the same key"""
+        if not self.enabled:
+            return await fn()
+
+        async def start(flight):
+            return await fn()
+
+        key, flight = self._join(key, start)
+        try:
+            # shield - one waiter being cancelled must not cancel the call for the others
+            return await asyncio.shield(flight.task)
+        finally:
+            self._leave(key, flight)
+
+    async def stream(self, key: Hashable, fn: Callable[[], AsyncIterator[Any]]):
+        """Items of the async iterator `fn()`, one upstream stream shared by every concurrent call for the same key"""
+        if not self.enabled:
+            async for item in fn():
+                yield item
+            return
+
+        async def start(flight):
+            try:
+                async for item in fn():
+                    flight.tokens.append(item)
+                    flight.changed.set()
+                    flight.changed = asyncio.Event()
+            finally:
+                flight.done = True
+                flight.changed.set()
+
+        key, flight = self._join(key, start)
+        try:
+            sent = 0
+            while True:
+                if sent < len(flight.tokens):
+                    yield flight.tokens[sent]
+                    sent += 1
+                elif flight.done:
+                    # Raises the upstream error, if there was one
+                    await flight.task
+                    return
+                else:
+                    await flight.changed.wait()
+        finally:
+            self._leave(key, flight)
+
+    def stats(self) -> dict:
+        total = self.calls + self.coalesced
+        return {
+            "in_flight": len(self._flights),
+            "upstream_calls": self.calls,
+            "coalesced": self.coalesced,
+            "coalesced_ratio": round(self.coalesced / total, 3) if total else 0.0
+        }
@@ -0,0 +1,125 @@
+"""
+Pipeline stages as a dependency graph.
+
+Each stage starts as soon as the stages it depends on have finished, so
+independent ones (history lookup, query embedding, BM25 search) overlap
+and the time to the end is that of the slowest chain, not the sum. A
+stage may have a timeout and a fallback value: if it times out or fails,
+dependents carry on with the fallback; stages without a fallback fail
+the whole run. The trace records when every stage ran and the critical
+path - the chain of stages that determined the total.
+"""
+from typing import Any, Awaitable, Callable, Dict, Iterable, List
+from metrics import record
+from utils import log_message
+import asyncio
+import time
+
+_REQUIRED = object()
+
+class _Stage:
+    __slots__ = ("name", "fn", "deps", "timeout", "fallback", "start", "end", "status")
+
+    def __init__(self, name, fn, deps, timeout, fallback):
+        self.name = name
+        self.fn = fn
+        self.deps = tuple(deps)
+        self.timeout = timeout
+        self.fallback = fallback
+        self.start = self.end = None
+        self.status = "pending"
+
+class StageGraph:
+    def __init__(self, pipeline: str = "qa", timings: dict = None, timeouts: Dict[str, float] = None):
+        self.pipeline = pipeline
+        self.timings = timings
+        self.timeouts = timeouts or {}
+        self.results = {}
+        self._stages = {}
+        self._started = None
+
+    def add(self, name: str, fn: Callable[[dict], Awaitable[Any]], deps: Iterable[str] = (),
+            fallback=_REQUIRED, timeout: float = None):
+        """
+        `fn(results)` gets the results of the finished stages by name. Stages
+        must be added after their dependencies. `timeout` defaults to the
+        graph's timeouts[name].
+        """
+        deps = tuple(deps)
+        missing = [d for d in deps if d not in self._stages]
+        if missing:
+            raise ValueError(f"Stage '{name}' depends on unknown stages {missing}")
+        self._stages[name] = _Stage(name, fn, deps, timeout or self.timeouts.get(name), fallback)
+        return self
+
+    async def run(self) -> dict:
+        self._started = time.perf_counter()
+        tasks = {}
+        for stage in self._stages.values():
+            tasks[stage.name] = asyncio.create_task(self._run_stage(stage, [tasks[d] for d in stage.deps]))
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+        return self.results
+
+    async def _run_stage(self, stage, dep_tasks):
+        if dep_tasks:
+            await asyncio.gather(*dep_tasks)
+        stage.start = time.perf_counter()
+        try:
+            call = stage.fn(self.results)
+            value = await (asyncio.wait_for(call, stage.timeout) if stage.timeout else call)
+            stage.status = "ok"
+        except asyncio.TimeoutError:
+            stage.status = "timeout"
+            if stage.fallback is _REQUIRED:
+                raise
+            log_message(f"Stage '{stage.name}' timed out after {stage.timeout}s, continuing without it")
+            value = stage.fallback
+        except Exception as e:
+            stage.status = "error"
+            if stage.fallback is _REQUIRED:
+                raise
+            log_message(f"Stage '{stage.name}' failed, continuing without it: {e}")
+            value = stage.fallback
+        finally:
+            stage.end = time.perf_counter()
+            record(self.pipeline, stage.name, stage.end - stage.start, self.timings)
+        self.results[stage.name] = value
+
+    def elapsed(self, name: str) -> float:
+        """Seconds from the start of the run until stage `name` finished"""
+        return self._stages[name].end - self._started
+
+    def critical_path(self) -> List[str]:
+        """From the last stage to finish back through the dependency that finished last"""
+        finished = [s for s in self._stages.values() if s.end is not None]
+        if not finished:
+            return []
+        stage = max(finished, key=lambda s: s.end)
+        path = [stage.name]
+        while stage.deps:
+            stage = max((self._stages[d] for d in stage.deps), key=lambda s: s.end or 0)
+            path.append(stage.name)
+        return path[::-1]
+
+    def trace(self) -> dict:
+        def offset(t):
+            return round((t - self._started) * 1000, 1) if t is not None else None
+        return {
+            "stages": [
+                {
+                    "stage": s.name,
+                    "deps": list(s.deps),
+                    "start_ms": offset(s.start),
+                    "end_ms": offset(s.end),
+                    "status": s.status
+                }
+                for s in self._stages.values()
+            ],
+            "critical_path": self.critical_path()
+        }
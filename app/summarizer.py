@@ -0,0 +1,97 @@
+"""
+Rolling conversation summaries.
+
+After every turn the messages that have fallen out of the recent window
+(the last HISTORY_RECENT_MESSAGES, which go into the prompt verbatim) are
+folded into a short per-conversation summary stored on the conversation
+document. The update runs in the background, so the answer never waits for
+it; the next turn's prompt is built from summary + recent messages and
+stays roughly the same size however long the conversation gets.
+"""
+from memory import get_recent_messages, get_messages_between, get_conversation_summary, save_conversation_summary
+from summary_prompt import SUMMARY_PROMPT
+from llm import LLM_ERROR_PREFIX
+from metrics import span
+from scheduler import QueueFullError
+from utils import log_message, log_debug
+from config import HISTORY_RECENT_MESSAGES, SUMMARY_MAX_WORDS, SUMMARY_MAX_FOLD_MESSAGES
+import asyncio
+import contextlib
+
+class ConversationSummarizer:
+    def __init__(self, llm, llm_slot=None, keep_recent: int = HISTORY_RECENT_MESSAGES,
+                 max_words: int = SUMMARY_MAX_WORDS, max_fold_messages: int = SUMMARY_MAX_FOLD_MESSAGES):
+        self.llm = llm
+        # Summaries share the LLM with QA, so they queue for a slot like any other generation
+        self.llm_slot = llm_slot or (lambda user_id: contextlib.nullcontext())
+        self.keep_recent = keep_recent
+        self.max_words = max_words
+        self.max_fold_messages = max_fold_messages
+        self._tasks = {}        # conversation_id -> running update
+        self._dirty = set()     # conversations that got a new turn while their update was running
+
+    def schedule(self, user_id: str, conversation_id: str):
+        """Update the summary in the background, at most one update per conversation at a time"""
+        task = self._tasks.get(conversation_id)
+        if task is not None and not task.done():
+            self._dirty.add(conversation_id)
+            return task
+        task = asyncio.create_task(self._run(user_id, conversation_id))
+        self._tasks[conversation_id] = task
+        return task
+
+    async def _run(self, user_id, conversation_id):
+        try:
+            while True:
+                self._dirty.discard(conversation_id)
+                try:
+                    await self.update(user_id, conversation_id)
+                except asyncio.CancelledError:
+                    raise
+                except QueueFullError:
+                    # Busy - the messages stay pending and get folded in after a later turn
+                    log_debug("Summary of %s skipped, QA queue full", conversation_id)
+                except Exception as e:
+                    log_message(f"Summary update failed for {conversation_id}: {e}")
+                if conversation_id not in self._dirty:
+                    break
+        finally:
+            self._tasks.pop(conversation_id, None)
+
+    async def update(self, user_id: str, conversation_id: str) -> bool:
+        """Fold the messages older than the recent window into the summary, returns True if it changed"""
+        summary = await get_conversation_summary(user_id, conversation_id)
+        if summary is None:
+            return False
+
+        recent = await get_recent_messages(user_id, conversation_id, limit=self.keep_recent)
+        if len(recent) < self.keep_recent:
+            return False
+
+        pending = await get_messages_between(
+            user_id, conversation_id,
+            after=summary["through"], before=recent[0]["created_at"], limit=self.max_fold_messages
+        )
+        if not pending:
+            return False
+
+        prompt = SUMMARY_PROMPT.format(
+            max_words=self.max_words,
+            summary=summary["text"] or "(none yet)",
+            messages="\n".join(f"{m['role'].capitalize()}: {m['content']}" for m in pending)
+        )
+        async with self.llm_slot(user_id):
+            with span("qa", "summary"):
+                text = await self.llm(prompt)
+        if text.startswith(LLM_ERROR_PREFIX):
+            raise RuntimeError(text)
+
+        await save_conversation_summary(user_id, conversation_id, text.strip(), pending[-1]["created_at"])
+        log_debug("Summary of %s updated with %d messages", conversation_id, len(pending))
+        return True
+
+    async def stop(self):
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
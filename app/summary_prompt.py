@@ -0,0 +1,19 @@
+SUMMARY_PROMPT = """
+You maintain a running summary of a conversation between a user and an Indian legal assistant.
+
+Update the summary with the new messages below.
+
+Rules:
+- Keep the user's facts, circumstances and open questions
+- Keep the legal provisions and sections that were discussed
+- Drop greetings, disclaimers and repeated explanations
+- Write plain prose, no more than {max_words} words
+
+Current summary:
+{summary}
+
+New messages:
+{messages}
+
+Updated summary:
+"""
@@ -0,0 +1,247 @@
+"""
+JWKS TTL cache, verified-token cache and RS256 verification, offline - Clerk
+is replaced by a fake session serving locally generated keys:
+
+    python -m pytest -q test_auth.py
+"""
+from types import SimpleNamespace
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from fastapi import HTTPException
+from jose import jwk, jwt
+import asyncio
+import time
+import pytest
+import auth
+from auth import JWKSCache, VerifiedTokenCache
+
+def run(coro):
+    return asyncio.run(coro)
+
+class SigningKey:
+    """An RSA keypair, as Clerk holds it - tokens signed with the private half, the public half in the JWKS"""
+    def __init__(self, kid):
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        self.kid = kid
+        self.private_pem = key.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+        ).decode()
+        public_pem = key.public_key().public_bytes(
+            serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+        ).decode()
+        self.jwk = {**jwk.construct(public_pem, "RS256").to_dict(), "kid": kid, "use": "sig"}
+
+    def token(self, sub="user_1", expires_in=3600, kid=None, **claims):
+        now = int(time.time())
+        claims = {"sub": sub, "aud": "authenticated", "iss": auth.CLERK_ISSUER,
+                  "iat": now, "exp": now + expires_in, **claims}
+        return jwt.encode(claims, self.private_pem, algorithm="RS256", headers={"kid": kid or self.kid})
+
+@pytest.fixture(scope="module")
+def keys():
+    return {kid: SigningKey(kid) for kid in ("k1", "k2")}
+
+def modulus(key):
+    return key.to_dict()["n"]
+
+class FakeClock:
+    # Starts at the real time - jose checks `exp` against the real clock
+    def __init__(self):
+        self.now = time.time()
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+class _Response:
+    def __init__(self, jwks):
+        self.jwks = jwks
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        if isinstance(self.jwks, Exception):
+            raise self.jwks
+
+    async def json(self):
+        return self.jwks
+
+class FakeJWKSSession:
+    """Serves whatever `keys` currently holds as the JWKS, counts the fetches"""
+    def __init__(self, *keys):
+        self.keys = list(keys)
+        self.fetches = 0
+        self.error = None
+
+    def get(self, url):
+        self.fetches += 1
+        if self.error is not None:
+            return _Response(self.error)
+        return _Response({"keys": [key.jwk for key in self.keys]})
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(auth, "time", clock)
+    return clock
+
+def jwks_cache(session, ttl=3600, min_refresh=30):
+    cache = JWKSCache("https://issuer.test/.well-known/jwks.json", ttl, min_refresh)
+    cache._session = session
+    return cache
+
+
+# ---- JWKSCache ----
+
+def test_keys_are_fetched_once_per_ttl(clock, keys):
+    session = FakeJWKSSession(keys["k1"])
+    cache = jwks_cache(session, ttl=60)
+
+    async def scenario():
+        assert modulus(await cache.get_key("k1")) == keys["k1"].jwk["n"]
+        clock.now += 59
+        await cache.get_key("k1")
+        assert session.fetches == 1
+        clock.now += 2      # past the TTL
+        assert await cache.get_key("k1") is not None
+        assert session.fetches == 2
+
+    run(scenario())
+
+def test_unknown_kid_refetches_after_rotation(clock, keys):
+    session = FakeJWKSSession(keys["k1"])
+    cache = jwks_cache(session, ttl=3600, min_refresh=30)
+
+    async def scenario():
+        await cache.get_key("k1")
+        session.keys = [keys["k1"], keys["k2"]]     # Clerk rotated its signing key
+
+        # Within the refresh rate limit an unknown kid doesn't hit Clerk
+        clock.now += 10
+        assert await cache.get_key("k2") is None
+        assert session.fetches == 1
+
+        clock.now += 30
+        assert modulus(await cache.get_key("k2")) == keys["k2"].jwk["n"]
+        assert session.fetches == 2
+
+    run(scenario())
+
+def test_failed_refresh_keeps_cached_keys(clock, keys):
+    session = FakeJWKSSession(keys["k1"])
+    cache = jwks_cache(session, ttl=60)
+
+    async def scenario():
+        await cache.get_key("k1")
+        session.error = ConnectionError("Clerk is down")
+        clock.now += 120
+        assert modulus(await cache.get_key("k1")) == keys["k1"].jwk["n"]
+        assert session.fetches == 2
+
+    run(scenario())
+
+def test_first_fetch_failure_is_raised(clock, keys):
+    session = FakeJWKSSession(keys["k1"])
+    session.error = ConnectionError("Clerk is down")
+
+    with pytest.raises(ConnectionError):
+        run(jwks_cache(session).get_key("k1"))
+
+def test_concurrent_refreshes_fetch_once(clock, keys):
+    session = FakeJWKSSession(keys["k1"])
+    cache = jwks_cache(session)
+
+    async def scenario():
+        return await asyncio.gather(*(cache.get_key("k1") for _ in range(10)))
+
+    assert len({modulus(key) for key in run(scenario())}) == 1
+    assert session.fetches == 1
+
+
+# ---- VerifiedTokenCache ----
+
+def test_token_expires_at_exp(clock):
+    cache = VerifiedTokenCache()
+    cache.put("token", "user_1", exp=clock.now + 60)
+    assert cache.get("token") == "user_1"
+    clock.now += 60
+    assert cache.get("token") is None
+    assert len(cache._entries) == 0     # dropped, not just hidden
+
+def test_token_without_exp_is_kept(clock):
+    cache = VerifiedTokenCache()
+    cache.put("token", "user_1", exp=None)
+    clock.now += 10 ** 6
+    assert cache.get("token") == "user_1"
+
+def test_least_recently_used_token_is_evicted(clock):
+    cache = VerifiedTokenCache(max_entries=2)
+    cache.put("a", "user_a", exp=None)
+    cache.put("b", "user_b", exp=None)
+    cache.get("a")
+    cache.put("c", "user_c", exp=None)
+    assert cache.get("b") is None
+    assert cache.get("a") == "user_a" and cache.get("c") == "user_c"
+
+
+# ---- get_current_user ----
+
+@pytest.fixture
+def clerk(clock, keys, monkeypatch):
+    """The JWKS session behind a fresh auth.jwks_cache, with an empty token cache"""
+    session = FakeJWKSSession(keys["k1"])
+    monkeypatch.setattr(auth, "jwks_cache", jwks_cache(session))
+    monkeypatch.setattr(auth, "token_cache", VerifiedTokenCache())
+    return session
+
+def authenticate(token):
+    return run(auth.get_current_user(SimpleNamespace(headers={"Authorization": f"Bearer {token}"})))
+
+def tampered(token):
+    header, payload, signature = token.split(".")
+    flipped = "A" if signature[10] != "A" else "B"
+    return ".".join([header, payload, signature[:10] + flipped + signature[11:]])
+
+def test_valid_token_passes(clerk, keys):
+    assert authenticate(keys["k1"].token(sub="user_42")) == "user_42"
+    assert clerk.fetches == 1
+
+def test_verified_token_skips_verification_the_second_time(clerk, keys, monkeypatch):
+    token = keys["k1"].token()
+    assert authenticate(token) == "user_1"
+
+    def no_parsing(token):
+        raise AssertionError("a cached token must not be parsed again")
+    monkeypatch.setattr(auth.jwt, "get_unverified_header", no_parsing)
+    monkeypatch.setattr(auth.jwt, "decode", no_parsing)
+
+    assert authenticate(token) == "user_1"
+    assert clerk.fetches == 1
+
+@pytest.mark.parametrize("make_token", [
+    pytest.param(lambda keys: tampered(keys["k1"].token()), id="tampered signature"),
+    pytest.param(lambda keys: keys["k2"].token(kid="k1"), id="signed with another key"),
+    pytest.param(lambda keys: keys["k1"].token(aud="someone-else"), id="wrong audience"),
+    pytest.param(lambda keys: keys["k1"].token(iss="https://evil.example"), id="wrong issuer"),
+    pytest.param(lambda keys: keys["k1"].token(expires_in=-60), id="expired"),
+    pytest.param(lambda keys: keys["k2"].token(), id="unknown kid"),
+    pytest.param(lambda keys: "not-a-jwt", id="garbage"),
+])
+def test_invalid_token_is_rejected(clerk, keys, make_token):
+    token = make_token(keys)
+    with pytest.raises(HTTPException) as error:
+        authenticate(token)
+    assert error.value.status_code == 401
+    # Nothing about a rejected token is remembered
+    assert len(auth.token_cache._entries) == 0
+
+def test_missing_token_is_rejected(clerk):
+    with pytest.raises(HTTPException) as error:
+        run(auth.get_current_user(SimpleNamespace(headers={})))
+    assert error.value.status_code == 401
@@ -0,0 +1,220 @@
+"""
+Persistence layer against the in-memory Mongo stand-in (mongomock-motor), no server needed:
+
+    python -m pytest -q test_memory.py
+"""
+import os
+
+# Before db is imported - never run these against a real database
+os.environ["MONGODB_URI"] = "mongomock://"
+
+from datetime import datetime, timedelta
+from bson import ObjectId
+import asyncio
+import pytest
+import db
+import memory
+from conversation_cache import ConversationCache
+from pagination import encode_cursor, decode_cursor
+
+USER = "test_user"
+
+def run(coro):
+    return asyncio.run(coro)
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch):
+    run(db.chat_memory_collection.delete_many({}))
+    run(db.conversations_collection.delete_many({}))
+    # Module-level singletons hold asyncio primitives - one per test, each test runs its own loop
+    monkeypatch.setattr(memory, "message_writer", memory.MessageWriter(db.chat_memory_collection, 10_000, 2))
+    monkeypatch.setattr(memory, "conversation_cache", ConversationCache(max_messages=4))
+    monkeypatch.setattr(memory, "MESSAGE_WRITE_BEHIND", True)
+
+def message(i, conversation_id="c1"):
+    return {"user_id": USER, "conversation_id": conversation_id, "role": "user", "content": f"m{i}"}
+
+async def seed(count, conversation_id="c1"):
+    start = datetime(2024, 1, 1)
+    await db.chat_memory_collection.insert_many([
+        {**message(i, conversation_id), "_id": ObjectId(), "created_at": start + timedelta(seconds=i)}
+        for i in range(count)
+    ])
+
+
+# ---- MessageWriter ----
+
+def test_writer_buffers_until_flush():
+    async def scenario():
+        writer = memory.message_writer
+        for i in range(3):
+            await writer.add(message(i))
+        assert [m["content"] for m in writer.pending(USER, "c1")] == ["m0", "m1", "m2"]
+        await writer.flush()
+        stored = await db.chat_memory_collection.find({}).sort("created_at", 1).to_list(None)
+        await writer.stop()
+        return writer, stored
+
+    writer, stored = run(scenario())
+    assert [m["content"] for m in stored] == ["m0", "m1", "m2"]
+    assert writer.pending(USER) == []
+    assert writer.written == 3 and writer.batches == 2     # batch size 2
+
+def test_writer_timestamps_strictly_increase():
+    async def scenario():
+        return [await memory.message_writer.add(message(i)) for i in range(50)]
+
+    stamps = [m["created_at"] for m in run(scenario())]
+    assert all(a < b for a, b in zip(stamps, stamps[1:]))
+    assert all(s.microsecond % 1000 == 0 for s in stamps)   # Mongo keeps milliseconds
+
+def test_writer_retry_does_not_duplicate():
+    class FlakyCollection:
+        """Writes the batch, then fails as if the acknowledgement got lost"""
+        def __init__(self, collection):
+            self.collection = collection
+            self.failures = 1
+
+        async def insert_many(self, documents, ordered=True):
+            await self.collection.insert_many(documents, ordered=ordered)
+            if self.failures:
+                self.failures -= 1
+                raise ConnectionError("connection reset")
+
+    async def scenario():
+        writer = memory.MessageWriter(FlakyCollection(db.chat_memory_collection), 10_000, 10)
+        await writer.add(message(0))
+        await writer.add(message(1))
+        with pytest.raises(ConnectionError):
+            await writer.flush()
+        assert len(writer.pending(USER)) == 2       # kept for the retry
+        await writer.flush()                        # duplicates count as written
+        return writer, await db.chat_memory_collection.count_documents({})
+
+    writer, count = run(scenario())
+    assert count == 2
+    assert writer.pending(USER) == []
+
+
+# ---- get_recent_messages ----
+
+def test_recent_messages_include_unflushed_ones():
+    async def scenario():
+        await seed(5)
+        await memory.save_message(USER, "c1", "assistant", "not flushed yet")
+        return await memory.get_recent_messages(USER, "c1", limit=3)
+
+    recent = run(scenario())
+    assert [m["content"] for m in recent] == ["m3", "m4", "not flushed yet"]
+
+def test_recent_messages_are_served_from_the_cache():
+    async def scenario():
+        await seed(5)
+        first = await memory.get_recent_messages(USER, "c1", limit=2)
+        await memory.save_message(USER, "c1", "user", "newest")
+        second = await memory.get_recent_messages(USER, "c1", limit=2)
+        return first, second
+
+    first, second = run(scenario())
+    assert [m["content"] for m in first] == ["m3", "m4"]
+    assert [m["content"] for m in second] == ["m4", "newest"]
+    assert memory.conversation_cache.hits["messages"] == 1
+
+def test_load_overlapping_a_write_is_not_cached():
+    cache = ConversationCache(max_messages=4)
+    load = cache.begin_load(USER, "c1")
+    stale = [message(0)]                    # what Mongo returned before the write landed
+    cache.add_message(USER, "c1", message(1))
+    cache.set_messages(USER, "c1", stale, load)
+    cache.end_load(load)
+    assert cache.get_messages(USER, "c1", 2) is None
+
+    load = cache.begin_load(USER, "c1")
+    cache.set_messages(USER, "c1", [message(0), message(1)], load)
+    cache.end_load(load)
+    assert [m["content"] for m in cache.get_messages(USER, "c1", 2)] == ["m0", "m1"]
+    assert cache._loads == {}
+
+
+# ---- keyset pagination ----
+
+def test_message_pages_cover_the_history_once():
+    async def scenario():
+        await seed(25)
+        await seed(3, conversation_id="other")
+        pages, cursor = [], None
+        while True:
+            page, after = await memory.list_messages(USER, "c1", limit=10, cursor=cursor)
+            pages.append([m["content"] for m in page])
+            if after is None:
+                return pages
+            # Through the wire format, as a client would send it back
+            cursor = decode_cursor(encode_cursor(after))
+
+    pages = run(scenario())
+    assert [len(p) for p in pages] == [10, 10, 5]
+    assert pages[0] == [f"m{i}" for i in range(15, 25)]    # newest page first, oldest first within it
+    assert sorted(sum(pages, []), key=lambda c: int(c[1:])) == [f"m{i}" for i in range(25)]
+
+def test_first_page_includes_unflushed_messages():
+    async def scenario():
+        await seed(4)
+        await memory.save_message(USER, "c1", "user", "pending")
+        first, after = await memory.list_messages(USER, "c1", limit=2)
+        second, _ = await memory.list_messages(USER, "c1", limit=2, cursor=(after["created_at"], after["_id"]))
+        return first, second
+
+    first, second = run(scenario())
+    assert [m["content"] for m in first] == ["m3", "pending"]
+    assert [m["content"] for m in second] == ["m1", "m2"]
+
+def test_iter_messages_streams_everything_oldest_first():
+    async def scenario():
+        await seed(1200)
+        await seed(3, conversation_id="other")
+        await memory.save_message(USER, "c1", "user", "pending")
+        batches = []
+        async for batch in memory.iter_messages(USER, "c1", batch_size=500):
+            batches.append(batch)
+            if len(batches) == 1:
+                await memory.message_writer.flush()     # lands mid-stream, must not show up twice
+        return batches
+
+    batches = run(scenario())
+    assert [len(b) for b in batches[:3]] == [500, 500, 200]
+    assert [m["content"] for b in batches for m in b] == [f"m{i}" for i in range(1200)] + ["pending"]
+
+def test_iter_messages_adds_unflushed_ones_at_the_end():
+    async def scenario():
+        await seed(3)
+        await memory.save_message(USER, "c1", "user", "pending")
+        return [m["content"] async for batch in memory.iter_messages(USER, "c1") for m in batch]
+
+    assert run(scenario()) == ["m0", "m1", "m2", "pending"]
+
+def test_iter_conversations_newest_first():
+    async def scenario():
+        for i in range(5):
+            await memory.create_conversation(USER, f"conv{i}", title=f"t{i}")
+            await asyncio.sleep(0.002)
+        return [[c["title"] for c in batch] async for batch in memory.iter_conversations(USER, batch_size=2)]
+
+    assert run(scenario()) == [["t4", "t3"], ["t2", "t1"], ["t0"]]
+
+def test_conversation_pages():
+    async def scenario():
+        for i in range(5):
+            await memory.create_conversation(USER, f"conv{i}", title=f"t{i}")
+            await asyncio.sleep(0.002)      # distinct created_at
+        first, after = await memory.list_conversations(USER, limit=3)
+        rest, end = await memory.list_conversations(USER, limit=3, cursor=(after["created_at"], after["_id"]))
+        return first, rest, end
+
+    first, rest, end = run(scenario())
+    assert [c["title"] for c in first] == ["t4", "t3", "t2"]
+    assert [c["title"] for c in rest] == ["t1", "t0"]
+    assert end is None
+
+def test_invalid_cursor():
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor")
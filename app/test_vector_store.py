@@ -0,0 +1,89 @@
+"""
+FAISS backend against a temporary directory (needs faiss-cpu and numpy):
+
+    python -m pytest -q test_vector_store.py
+"""
+import pytest
+
+faiss = pytest.importorskip("faiss")
+np = pytest.importorskip("numpy")
+
+from vector_store import FaissVectorStore, IVF_MIN_POINTS_PER_LIST
+
+DIMENSION = 8
+# nlist=2 so a trained IVF needs only 78 vectors
+IVF_PROFILE = {"name": "ivf_test", "index_type": "IVF_FLAT", "params": {"nlist": 2}, "search_params": {"nprobe": 2}}
+TRAINED_AT = 2 * IVF_MIN_POINTS_PER_LIST
+
+def rows(count, source="doc", seed=0):
+    vectors = np.random.default_rng(seed).standard_normal((count, DIMENSION)).astype("float32")
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return [
+        {"vector": vector.tolist(), "source": source, "content_hash": f"h{i}", "payload": {"text": f"chunk {i}"}}
+        for i, vector in enumerate(vectors)
+    ]
+
+def inner_index(store):
+    return faiss.downcast_index(store._index.index)
+
+def search_ids(store, vectors, k=5):
+    return {hit["id"] for hits in store.search(vectors, k) for hit in hits}
+
+
+def test_ivf_is_trained_once_there_are_enough_vectors(tmp_path):
+    store = FaissVectorStore(str(tmp_path), IVF_PROFILE)
+    store.insert(rows(TRAINED_AT - 1))
+    assert isinstance(inner_index(store), faiss.IndexFlat)
+    store.insert(rows(1, seed=1))
+    assert isinstance(inner_index(store), faiss.IndexIVF)
+    assert store._index.ntotal == TRAINED_AT
+
+def test_ivf_compaction_retrains_and_survives_a_reload(tmp_path):
+    store = FaissVectorStore(str(tmp_path), IVF_PROFILE)
+    data = rows(200)
+    ids = store.insert(data)
+    assert isinstance(inner_index(store), faiss.IndexIVF)
+
+    deleted = ids[:50]      # 25% - past FAISS_COMPACT_RATIO
+    store.delete(deleted)
+    assert store._tombstones == set()
+    assert isinstance(inner_index(store), faiss.IndexIVF) and inner_index(store).is_trained
+    assert store._index.ntotal == 150
+
+    # Still writable after the rebuild - this is where an untrained index used to fail
+    more = store.insert(rows(10, source="other", seed=2))
+    store.flush()
+    store.close()
+
+    store = FaissVectorStore(str(tmp_path), IVF_PROFILE)
+    assert store.count() == 160
+    assert store._index.ntotal == 160
+    assert store._db.execute("SELECT COUNT(*) FROM chunks").fetchone()[0] == 160
+    assert set(store.get_vectors(more)) == set(more)
+    found = search_ids(store, [row["vector"] for row in data])
+    assert found and not found & set(deleted)
+    store.close()
+
+def test_ivf_compaction_below_the_training_size_stages_flat_again(tmp_path):
+    store = FaissVectorStore(str(tmp_path), IVF_PROFILE)
+    ids = store.insert(rows(100))
+    store.delete(ids[:60])
+    assert isinstance(inner_index(store), faiss.IndexFlat)
+    assert store._index.ntotal == 40
+    store.flush()
+    store.close()
+
+    store = FaissVectorStore(str(tmp_path), IVF_PROFILE)
+    assert store.count() == 40 and store._tombstones == set()
+    store.insert(rows(TRAINED_AT, seed=3))
+    assert isinstance(inner_index(store), faiss.IndexIVF)
+    store.close()
+
+def test_tombstones_below_the_ratio_are_filtered_from_search(tmp_path):
+    store = FaissVectorStore(str(tmp_path), IVF_PROFILE)
+    data = rows(200)
+    ids = store.insert(data)
+    store.delete(ids[:10])
+    assert store._tombstones == set(ids[:10])
+    assert not search_ids(store, [row["vector"] for row in data[:10]]) & set(ids[:10])
+    store.close()
@@ -2,18 +2,16 @@ from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
 from utils import log_message
 
-def split_documents(docs):
-    if not docs:
-        log_message("No documents to split")
-        return []
-
-    splitter = RecursiveCharacterTextSplitter(
+def _make_splitter():
+    return RecursiveCharacterTextSplitter(
         chunk_size=1000,
         chunk_overlap=100,
         separators=["\n\n", "\n", " ", ""]
     )
 
-    final_docs = []
+def iter_split_documents(docs):
+    """Lazily split an iterable of documents, one page in memory at a time"""
+    splitter = _make_splitter()
 
     for doc in docs:
         text = doc.page_content.strip()
@@ -23,12 +21,17 @@ def split_documents(docs):
         chunks = splitter.split_text(text)
 
         for chunk in chunks:
-            final_docs.append(
-                Document(
-                    page_content=chunk,
-                    metadata=doc.metadata
-                )
+            yield Document(
+                page_content=chunk,
+                metadata=doc.metadata
             )
 
+def split_documents(docs):
+    if not docs:
+        log_message("No documents to split")
+        return []
+
+    final_docs = list(iter_split_documents(docs))
+
     log_message(f"Final chunks sent to Milvus: {len(final_docs)}")
-    return final_docs
\ No newline at end of file
+    return final_docs
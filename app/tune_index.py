@@ -0,0 +1,176 @@
+"""
+Recall / latency tuner for the vector index profiles.
+
+    python tune_index.py --profiles hnsw_fast,hnsw_balanced,ivf_flat --queries 200 --k 10
+
+Exports the vectors of the ingested collection, holds out a sample of them
+as queries and computes their exact top-k by brute force. Every profile is
+then built over the remaining vectors (a temporary Milvus collection that is
+dropped afterwards, or an in-process FAISS index) and searched once per value
+of its tunable search parameter (ef for HNSW, nprobe for IVF). Reports
+recall@k against the exact results and p50 / p99 search latency, so a
+profile and search parameters can be picked for the corpus at hand.
+"""
+from index_profiles import INDEX_PROFILES, SEARCH_PARAM_SWEEPS, get_profile
+from vector_store import (
+    MilvusVectorStore, build_faiss_index, faiss_search_parameters, create_vector_store
+)
+from config import VECTOR_STORE, MILVUS_URI, ZILLIZ_API_KEY
+from utils import log_message
+import argparse
+import json
+import time
+import uuid
+import numpy as np
+
+def export_vectors(store):
+    ids, vectors = [], []
+    for batch_ids, batch_vectors in store.iter_vectors():
+        ids.extend(batch_ids)
+        vectors.extend(batch_vectors)
+    return np.asarray(ids, dtype="int64"), np.asarray(vectors, dtype="float32")
+
+def exact_top_k(corpus, queries, k):
+    # Inner product on normalized vectors, same metric as the indexes
+    scores = queries @ corpus.T
+    top = np.argpartition(-scores, min(k, corpus.shape[0] - 1), axis=1)[:, :k]
+    order = np.take_along_axis(scores, top, axis=1).argsort(axis=1)[:, ::-1]
+    return np.take_along_axis(top, order, axis=1)
+
+def sweep_values(profile):
+    tunable = [name for name in SEARCH_PARAM_SWEEPS if name in profile.get("search_params", {})]
+    if not tunable:
+        return [{}]
+    name = tunable[0]
+    return [{name: value} for value in SEARCH_PARAM_SWEEPS[name]]
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+class FaissTarget:
+    """Profile built as an in-process FAISS index over row positions"""
+    def __init__(self, profile, corpus):
+        self.index = build_faiss_index(profile, corpus.shape[1], corpus.shape[0])
+        if not self.index.is_trained:
+            self.index.train(corpus)
+        self.index.add_with_ids(corpus, np.arange(corpus.shape[0], dtype="int64"))
+
+    def search(self, query, k, search_params):
+        _, ids = self.index.search(query[None, :], k, params=faiss_search_parameters(self.index, search_params))
+        return [int(i) for i in ids[0] if i != -1]
+
+    def close(self):
+        pass
+
+class MilvusTarget:
+    """Profile built as a temporary Milvus collection, dropped on close"""
+    def __init__(self, profile, corpus, batch_size=1000):
+        from pymilvus import MilvusClient
+
+        self.client = MilvusClient(uri=MILVUS_URI or "tcp://127.0.0.1:19530", token=ZILLIZ_API_KEY or "")
+        self.collection_name = f"tune_{profile['name']}_{uuid.uuid4().hex[:8]}"
+        MilvusVectorStore.create_collection(self.client, self.collection_name, corpus.shape[1], profile)
+
+        for start in range(0, corpus.shape[0], batch_size):
+            rows = [
+                {"vector": vector.tolist(), "position": start + offset}
+                for offset, vector in enumerate(corpus[start:start + batch_size])
+            ]
+            self.client.insert(collection_name=self.collection_name, data=rows)
+        self.client.flush(collection_name=self.collection_name)
+
+    def search(self, query, k, search_params):
+        results = self.client.search(
+            collection_name=self.collection_name,
+            data=[query.tolist()],
+            limit=k,
+            search_params={"metric_type": "IP", "params": search_params},
+            output_fields=["position"],
+            consistency_level="Strong"
+        )
+        return [hit["entity"]["position"] for hit in results[0]]
+
+    def close(self):
+        self.client.drop_collection(collection_name=self.collection_name)
+        self.client.close()
+
+def evaluate(target, queries, truth, k, search_params):
+    latencies, recalls = [], []
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        found = target.search(query, k, search_params)
+        latencies.append((time.perf_counter() - start) * 1000)
+        recalls.append(len(set(found) & set(expected.tolist())) / k)
+
+    return {
+        "recall": round(float(np.mean(recalls)), 4),
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p99_ms": round(percentile(latencies, 99), 3)
+    }
+
+def embedding_dimension(args) -> int:
+    # Only asked for if the collection doesn't exist yet - same source as the server's
+    if args.dim:
+        return args.dim
+    from embeddings import NomicEmbeddings
+    return NomicEmbeddings().dimension
+
+def main(args):
+    source = create_vector_store(args.collection, lambda: embedding_dimension(args))
+    _, vectors = export_vectors(source)
+    source.close()
+    if vectors.shape[0] <= args.queries:
+        raise SystemExit(f"Need more than {args.queries} stored vectors, found {vectors.shape[0]}")
+
+    rng = np.random.default_rng(args.seed)
+    held_out = rng.choice(vectors.shape[0], size=args.queries, replace=False)
+    mask = np.ones(vectors.shape[0], dtype=bool)
+    mask[held_out] = False
+    corpus, queries = vectors[mask], vectors[held_out]
+    truth = exact_top_k(corpus, queries, args.k)
+    log_message(f"Tuning over {corpus.shape[0]} vectors with {len(queries)} held-out queries (k={args.k})")
+
+    target_cls = MilvusTarget if args.backend == "milvus" else FaissTarget
+    results = []
+    for name in args.profiles:
+        profile = get_profile(name)
+        start = time.perf_counter()
+        target = target_cls(profile, corpus)
+        build_seconds = time.perf_counter() - start
+        try:
+            for search_params in sweep_values(profile):
+                result = evaluate(target, queries, truth, args.k, search_params)
+                result.update(profile=name, search_params=search_params, build_s=round(build_seconds, 2))
+                results.append(result)
+        finally:
+            target.close()
+
+    print(f"\n{args.backend}: {corpus.shape[0]} vectors, {len(queries)} queries, recall@{args.k}")
+    print(f"{'profile':>16} {'search params':>16} {'recall':>7} {'p50 ms':>8} {'p99 ms':>8} {'build s':>8}")
+    for r in results:
+        params = ",".join(f"{key}={value}" for key, value in r["search_params"].items()) or "-"
+        print(
+            f"{r['profile']:>16} {params:>16} {r['recall']:>7.4f} "
+            f"{r['p50_ms']:>8.3f} {r['p99_ms']:>8.3f} {r['build_s']:>8.2f}"
+        )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--collection", default="rag_demo_local")
+    parser.add_argument("--backend", choices=("milvus", "faiss"), default=VECTOR_STORE)
+    parser.add_argument(
+        "--profiles",
+        type=lambda s: s.split(","),
+        default=[name for name in INDEX_PROFILES if name != "autoindex"]
+    )
+    parser.add_argument("--queries", type=int, default=200, help="number of held-out query vectors")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dim", type=int, help="vector dimension if the collection must be created (default: from the embedding model)")
+    parser.add_argument("--json", help="also write the results to this file")
+    main(parser.parse_args())
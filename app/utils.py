@@ -1,9 +1,116 @@
-def log_message(message, streamlit_output=False):
-    print(message)
+"""
+Logging for the app.
+
+Records go through a QueueHandler and a background thread writes them to
+stdout, so request handlers never block on stdout. Formatting is lazy:
+pass printf-style args (log_message("found %d", n)) and the string is only
+built if the level is enabled.
+
+    LOG_LEVEL          DEBUG / INFO (default) / WARNING / ERROR
+    LOG_FORMAT         text (default) or json (one object per line)
+    LOG_SAMPLE_RATE    keep 1 in N of the per-chunk / per-result debug lines
+    LOG_DOCUMENT_TEXT  true to include document / prompt / query text in logs;
+                       by default only its length is logged
+"""
+from logging.handlers import QueueHandler, QueueListener
+import atexit
+import itertools
+import json
+import logging
+import queue
+import sys
+from config import LOG_LEVEL, LOG_FORMAT, LOG_SAMPLE_RATE, LOG_DOCUMENT_TEXT
+
+logger = logging.getLogger("rag")
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage()
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(message)s", "%H:%M:%S")
+
+    def format(self, record):
+        line = super().format(record)
+        fields = getattr(record, "fields", None)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+def _configure():
+    if logger.handlers:
+        return None
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else TextFormatter())
+
+    records = queue.SimpleQueue()
+    logger.addHandler(QueueHandler(records))
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
+
+    listener = QueueListener(records, stream, respect_handler_level=True)
+    listener.start()
+    # Drain what is still queued when the process exits
+    atexit.register(listener.stop)
+    return listener
+
+_listener = _configure()
+
+class preview:
+    """
+    Lazy stand-in for document / prompt / query text in log args: renders
+    the first `length` characters if LOG_DOCUMENT_TEXT is set, else only
+    the text length. Nothing is sliced unless the record is emitted.
+    """
+    __slots__ = ("text", "length")
+
+    def __init__(self, text, length=100):
+        self.text = text
+        self.length = length
+
+    def __str__(self):
+        if LOG_DOCUMENT_TEXT:
+            return repr(self.text[:self.length])
+        return f"<{len(self.text)} chars>"
+
+def log_message(message, *args, level=logging.INFO, streamlit_output=False, **fields):
+    """
+    Log `message` (printf-style `args` are formatted lazily). Keyword
+    `fields` are attached as structured data, e.g. log_message("done", job_id=...).
+    """
+    if logger.isEnabledFor(level):
+        logger.log(level, message, *args, extra={"fields": fields} if fields else None)
     if streamlit_output:
         try:
             import streamlit as st
-            st.write(f"`{message}`")
+            st.write(f"`{message % args if args else message}`")
         except Exception:
-            # Fallback: just print if Streamlit isn't available
-            print(f"[Streamlit skipped] {message}")
+            # Fallback: just log if Streamlit isn't available
+            logger.info("[Streamlit skipped] %s", message)
+
+def log_debug(message, *args, **fields):
+    # Checked here so hot paths pay for one level lookup when DEBUG is off
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(message, *args, extra={"fields": fields} if fields else None)
+
+_sample_counters = {}
+
+def log_sampled(key, message, *args, rate=None, **fields):
+    """Debug line that is only emitted for 1 in `rate` calls with the same key (LOG_SAMPLE_RATE)"""
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    counter = _sample_counters.get(key)
+    if counter is None:
+        counter = _sample_counters.setdefault(key, itertools.count())
+    if next(counter) % (rate or LOG_SAMPLE_RATE) == 0:
+        logger.debug(message, *args, extra={"fields": fields} if fields else None)
@@ -0,0 +1,624 @@
+"""
+Vector store backends behind CustomRAGChain.
+
+Rows are dicts with "vector", "payload" (text/source/type), "source" and
+"content_hash". Search hits are dicts with "id", "distance" (inner
+product, higher is better) and "payload", plus "vector" if asked for.
+
+    VECTOR_STORE=milvus   Milvus server (default, see milvus/docker-compose.yml)
+    VECTOR_STORE=faiss    In-process FAISS index persisted under FAISS_INDEX_DIR
+"""
+from typing import Callable, Dict, Iterator, List, Tuple
+from utils import log_message
+from index_profiles import get_profile, merge_search_params
+from config import VECTOR_STORE, MILVUS_URI, ZILLIZ_API_KEY, FAISS_INDEX_DIR, FAISS_MMAP, FAISS_COMPACT_RATIO
+import contextlib
+import json
+import os
+import sqlite3
+import threading
+
+# Milvus caps a single query at 16384 rows (offset + limit)
+MAX_CHUNKS_PER_SOURCE = 16384
+# FAISS k-means wants at least this many training points per IVF list
+IVF_MIN_POINTS_PER_LIST = 39
+
+class VectorStore:
+    def insert(self, rows: List[dict]) -> List[int]:
+        """Insert rows, returns their ids"""
+        raise NotImplementedError
+
+    def search(self, vectors: List[List[float]], k: int, search_params: dict = None,
+               with_vectors: bool = False) -> List[List[dict]]:
+        """
+        One list of hits per query vector, best first. `search_params`
+        (e.g. {"ef": 128} or {"nprobe": 32}) override the profile defaults.
+        """
+        raise NotImplementedError
+
+    def get_vectors(self, ids: List[int]) -> Dict[int, List[float]]:
+        """id -> stored vector, missing ids are left out"""
+        raise NotImplementedError
+
+    def iter_vectors(self, batch_size: int = 1000) -> Iterator[Tuple[List[int], List[List[float]]]]:
+        """Yield (ids, vectors) batches of everything stored, used by the index tuner"""
+        raise NotImplementedError
+
+    def iter_payloads(self, batch_size: int = 1000) -> Iterator[Tuple[List[int], List[dict]]]:
+        """Yield (ids, payloads) batches of everything stored, used to rebuild the lexical index"""
+        raise NotImplementedError
+
+    def hashes_for_source(self, source: str) -> Dict[str, List[int]]:
+        """content_hash -> [ids] of everything stored for a source"""
+        raise NotImplementedError
+
+    def delete(self, ids: List[int]) -> int:
+        raise NotImplementedError
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def flush(self):
+        """Persist pending state, called at the end of every ingestion"""
+
+    def close(self):
+        self.flush()
+
+class MilvusVectorStore(VectorStore):
+    def __init__(self, collection_name: str, dimension: Callable[[], int], uri: str = None,
+                 token: str = None, profile: dict = None):
+        from pymilvus import MilvusClient
+
+        self.collection_name = collection_name
+        self.profile = profile or get_profile()
+        log_message("Initializing Milvus client...")
+        self.client = MilvusClient(uri=uri or "tcp://127.0.0.1:19530", token=token or "")
+
+        if not self.client.has_collection(self.collection_name):
+            self.create_collection(self.client, self.collection_name, dimension(), self.profile)
+        else:
+            self._check_index()
+
+    @staticmethod
+    def create_collection(client, collection_name, dimension, profile):
+        from pymilvus import DataType, MilvusClient
+
+        log_message(f"Creating new collection with index profile '{profile['name']}'...")
+
+        schema = MilvusClient.create_schema(
+            auto_id=True,
+            enable_dynamic_field=True   # 🔑 THIS enables JSON payload
+        )
+        schema.add_field(field_name="id", datatype=DataType.INT64, is_primary=True)
+        schema.add_field(field_name="vector", datatype=DataType.FLOAT_VECTOR, dim=dimension)
+
+        index_params = client.prepare_index_params()
+        index_params.add_index(
+            field_name="vector",
+            index_type=profile["index_type"],
+            metric_type="IP",
+            params=profile["params"]
+        )
+
+        client.create_collection(
+            collection_name=collection_name,
+            schema=schema,
+            index_params=index_params,
+            consistency_level="Bounded"
+        )
+
+        log_message(f"Collection '{collection_name}' created ({profile['index_type']} {profile['params']})")
+
+    def _check_index(self):
+        # The index of an existing collection is not rebuilt - just warn if it differs from the profile
+        try:
+            info = self.client.describe_index(collection_name=self.collection_name, index_name="vector")
+            index_type = (info or {}).get("index_type")
+            if index_type and index_type != self.profile["index_type"]:
+                log_message(
+                    f"Collection '{self.collection_name}' has a {index_type} index, "
+                    f"not {self.profile['index_type']} from profile '{self.profile['name']}'"
+                )
+        except Exception as e:
+            log_message(f"Could not describe index of '{self.collection_name}': {e}")
+
+    def insert(self, rows):
+        result = self.client.insert(collection_name=self.collection_name, data=rows)
+        return list(result.get("ids", []))
+
+    def search(self, vectors, k, search_params=None, with_vectors=False):
+        results = self.client.search(
+            collection_name=self.collection_name,
+            data=vectors,
+            limit=k,
+            search_params={"metric_type": "IP", "params": merge_search_params(self.profile, search_params)},
+            output_fields=["payload", "vector"] if with_vectors else ["payload"]
+        )
+        return [
+            [
+                {
+                    "id": hit.get("id"),
+                    "distance": hit.get("distance", 0),
+                    "payload": hit["entity"]["payload"],
+                    **({"vector": hit["entity"]["vector"]} if with_vectors else {})
+                }
+                for hit in hits
+            ]
+            for hits in results
+        ]
+
+    def get_vectors(self, ids):
+        if not ids:
+            return {}
+        rows = self.client.get(collection_name=self.collection_name, ids=list(ids), output_fields=["vector"])
+        return {row["id"]: row["vector"] for row in rows}
+
+    def hashes_for_source(self, source):
+        rows = self.client.query(
+            collection_name=self.collection_name,
+            filter=f"source == {json.dumps(source)}",
+            output_fields=["content_hash"],
+            limit=MAX_CHUNKS_PER_SOURCE,
+            consistency_level="Strong"
+        )
+        index = {}
+        for row in rows:
+            index.setdefault(row.get("content_hash"), []).append(row["id"])
+        return index
+
+    def delete(self, ids):
+        result = self.client.delete(collection_name=self.collection_name, ids=list(ids))
+        return result.get("delete_count", len(ids)) if isinstance(result, dict) else len(ids)
+
+    def count(self):
+        stats = self.client.get_collection_stats(collection_name=self.collection_name)
+        return int(stats.get("row_count", 0))
+
+    def iter_vectors(self, batch_size=1000):
+        iterator = self.client.query_iterator(
+            collection_name=self.collection_name,
+            batch_size=batch_size,
+            filter="",
+            output_fields=["vector"]
+        )
+        try:
+            while True:
+                rows = iterator.next()
+                if not rows:
+                    break
+                yield [row["id"] for row in rows], [row["vector"] for row in rows]
+        finally:
+            iterator.close()
+
+    def iter_payloads(self, batch_size=1000):
+        iterator = self.client.query_iterator(
+            collection_name=self.collection_name,
+            batch_size=batch_size,
+            filter="",
+            output_fields=["payload"]
+        )
+        try:
+            while True:
+                rows = iterator.next()
+                if not rows:
+                    break
+                yield [row["id"] for row in rows], [row["payload"] for row in rows]
+        finally:
+            iterator.close()
+
+    def close(self):
+        self.client.close()
+
+class _ReadWriteLock:
+    """Any number of readers or one writer; a waiting writer holds off new readers. Not reentrant"""
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writing = False
+        self._writers_waiting = 0
+
+    @contextlib.contextmanager
+    def read(self):
+        with self._cond:
+            while self._writing or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def write(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writing or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writing = False
+                self._cond.notify_all()
+
+class FaissVectorStore(VectorStore):
+    """
+    In-process FAISS index (built from the index profile) with payloads in
+    a SQLite side table.
+
+    The index is memory-mapped at startup when FAISS_MMAP is set and only
+    read fully into memory on the first write. Where the index can't remove
+    vectors (HNSW, IVF with its direct map) deletes are tombstones filtered
+    out at search time, until they are FAISS_COMPACT_RATIO of the index and
+    it is rebuilt. IVF profiles are served from a flat index while there are
+    too few vectors to train all of their lists, then rebuilt as IVF.
+
+    Rows are committed at once but the index is only saved by flush(); at
+    startup rows whose vectors didn't make it into the saved index are
+    dropped, so re-ingesting their source embeds them again.
+
+    Searches run concurrently under a read lock, with per-request ef / nprobe
+    passed as FAISS search parameters; only writes take the lock exclusively.
+    """
+    def __init__(self, directory: str, profile: dict = None):
+        import faiss
+        import numpy as np
+
+        self._faiss = faiss
+        self._np = np
+        self.directory = directory
+        self.profile = profile or get_profile()
+        self.index_path = os.path.join(directory, "index.faiss")
+        self._lock = _ReadWriteLock()
+        self._dirty = False
+        self._mmapped = False
+        self._index = None
+        self._compacted = set()     # tombstones rebuilt out of the index, their rows go once it is saved
+
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(directory, "payloads.sqlite3"), check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, source TEXT, content_hash TEXT,"
+            " payload TEXT NOT NULL, deleted INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS chunks_source ON chunks (source)")
+        self._db.commit()
+        self._tombstones = {row[0] for row in self._db.execute("SELECT id FROM chunks WHERE deleted = 1")}
+
+        if os.path.exists(self.index_path):
+            flags = faiss.IO_FLAG_MMAP if FAISS_MMAP else 0
+            self._set_index(faiss.read_index(self.index_path, flags))
+            self._mmapped = bool(FAISS_MMAP)
+            log_message(
+                f"FAISS index loaded from {self.index_path} "
+                f"({self._index.ntotal} vectors{', memory-mapped' if self._mmapped else ''})"
+            )
+        else:
+            log_message(f"FAISS store at {directory}: no index yet, it is created on first insert")
+        self._reconcile()
+
+    def _reconcile(self):
+        """Make the table match the saved index after a crash between a write and the next flush"""
+        indexed = set()
+        if self._index is not None:
+            indexed = {int(i) for i in self._faiss.vector_to_array(self._index.id_map)}
+        rows = {row[0] for row in self._db.execute("SELECT id FROM chunks")}
+
+        lost = rows - indexed       # inserted (or compacted away) but the index wasn't saved since
+        if lost:
+            self._db.executemany("DELETE FROM chunks WHERE id = ?", [(i,) for i in lost])
+            live = lost - self._tombstones
+            self._tombstones -= lost
+            if live:
+                log_message(
+                    f"WARNING: {len(live)} chunks in {self.directory} have no vector in the saved index "
+                    "(unclean shutdown?), removed them - re-ingest their sources to restore them"
+                )
+        orphans = indexed - rows    # deleted, but the index wasn't saved since
+        if orphans:
+            self._remove_vectors(sorted(orphans), placeholder=True)
+            self._dirty = True
+            log_message(f"FAISS store: removed {len(orphans)} vectors without a chunk from the index")
+        self._db.commit()
+    def _set_index(self, index):
+        # IVF indexes need a direct map to look vectors up by id (reconstruct) - set it
+        # up here, under the write lock, not on the read path. An array, as IndexIDMap2 adds
+        # with sequential ids (a hashtable misses those); it can't remove, so deletes are tombstones
+        inner = self._faiss.downcast_index(index.index)
+        if isinstance(inner, self._faiss.IndexIVF) and inner.direct_map.type != self._faiss.DirectMap.Array:
+            inner.set_direct_map_type(self._faiss.DirectMap.Array)
+        self._index = index
+
+    def _writable_index(self):
+        if self._mmapped:
+            # mmapped indexes are read-only - load a private copy before the first write
+            self._set_index(self._faiss.read_index(self.index_path))
+            self._mmapped = False
+        return self._index
+
+    def insert(self, rows):
+        if not rows:
+            return []
+        vectors = self._np.asarray([row["vector"] for row in rows], dtype="float32")
+
+        with self._lock.write():
+            cursor = self._db.cursor()
+            ids = []
+            for row in rows:
+                cursor.execute(
+                    "INSERT INTO chunks (source, content_hash, payload) VALUES (?, ?, ?)",
+                    (row.get("source"), row.get("content_hash"), json.dumps(row["payload"]))
+                )
+                ids.append(cursor.lastrowid)
+
+            if self._index is None:
+                # IVF starts out flat - training on the first batch would fix nlist to its size
+                staging = ivf_nlist(self.profile) is not None
+                self._set_index(
+                    build_faiss_index({"index_type": "FLAT"} if staging else self.profile, vectors.shape[1])
+                )
+            index = self._writable_index()
+            index.add_with_ids(vectors, self._np.asarray(ids, dtype="int64"))
+            self._maybe_train_ivf()
+
+            self._db.commit()
+            self._dirty = True
+        return ids
+
+    def _maybe_train_ivf(self):
+        # Callers hold the lock. Rebuild the flat staging index as the profile's IVF
+        # once there are IVF_MIN_POINTS_PER_LIST training points for every list
+        nlist = ivf_nlist(self.profile)
+        inner = self._faiss.downcast_index(self._index.index)
+        if nlist is None or not isinstance(inner, self._faiss.IndexFlat):
+            return
+        if self._index.ntotal < nlist * IVF_MIN_POINTS_PER_LIST:
+            return
+
+        ids = self._faiss.vector_to_array(self._index.id_map)
+        self._rebuild(ids, inner.reconstruct_n(0, inner.ntotal))
+
+    def _rebuild(self, ids, vectors):
+        # Callers hold the lock. Replace the index by one of the profile holding just these
+        # vectors - IVF is trained on them, or staged flat again if they are too few for nlist
+        nlist = ivf_nlist(self.profile)
+        if nlist is not None and len(ids) < nlist * IVF_MIN_POINTS_PER_LIST:
+            index = build_faiss_index({"index_type": "FLAT"}, self._index.d)
+        else:
+            index = build_faiss_index(self.profile, self._index.d)
+            if nlist is not None:
+                log_message(f"FAISS: training {self.profile['index_type']} (nlist={nlist}) on {len(ids)} vectors...")
+                index.train(vectors)
+        if len(ids):
+            index.add_with_ids(vectors, ids)
+        self._set_index(index)
+        self._dirty = True
+
+    def search(self, vectors, k, search_params=None, with_vectors=False):
+        if self._index is None or not vectors:
+            return [[] for _ in vectors]
+        queries = self._np.asarray(vectors, dtype="float32")
+
+        with self._lock.read():
+            params = faiss_search_parameters(self._index, merge_search_params(self.profile, search_params))
+            # Over-fetch so tombstoned vectors don't eat into k
+            fetch = min(k + len(self._tombstones), max(self._index.ntotal, 1))
+            scores, ids = self._index.search(queries, fetch, params=params)
+
+            wanted = {int(i) for row in ids for i in row if i >= 0 and int(i) not in self._tombstones}
+            payloads = {}
+            if wanted:
+                placeholders = ",".join("?" * len(wanted))
+                for chunk_id, payload in self._db.execute(
+                    f"SELECT id, payload FROM chunks WHERE deleted = 0 AND id IN ({placeholders})", tuple(wanted)
+                ):
+                    payloads[chunk_id] = json.loads(payload)
+            stored = self._reconstruct(payloads) if with_vectors else {}
+
+        results = []
+        for row_scores, row_ids in zip(scores, ids):
+            hits = [
+                {
+                    "id": int(chunk_id),
+                    "distance": float(score),
+                    "payload": payloads[int(chunk_id)],
+                    **({"vector": stored[int(chunk_id)]} if with_vectors else {})
+                }
+                for score, chunk_id in zip(row_scores, row_ids)
+                if int(chunk_id) in payloads
+            ]
+            results.append(hits[:k])
+        return results
+
+    def get_vectors(self, ids):
+        with self._lock.read():
+            if self._index is None:
+                return {}
+            live = [int(i) for i in ids if int(i) not in self._tombstones]
+            return self._reconstruct(live)
+
+    def _reconstruct(self, ids):
+        # Callers hold the lock (IVF direct maps are set up by _set_index)
+        vectors = {}
+        for chunk_id in ids:
+            try:
+                vectors[chunk_id] = self._index.reconstruct(chunk_id)
+            except RuntimeError:
+                pass    # not in the index (deleted meanwhile)
+        return vectors
+
+    def hashes_for_source(self, source):
+        with self._lock.read():
+            rows = self._db.execute(
+                "SELECT id, content_hash FROM chunks WHERE deleted = 0 AND source = ?", (source,)
+            ).fetchall()
+        index = {}
+        for chunk_id, digest in rows:
+            index.setdefault(digest, []).append(chunk_id)
+        return index
+
+    def delete(self, ids):
+        ids = [int(i) for i in ids]
+        if not ids:
+            return 0
+        with self._lock.write():
+            if self._index is None:
+                self._db.executemany("DELETE FROM chunks WHERE id = ?", [(i,) for i in ids])
+            else:
+                self._remove_vectors(ids)
+                self._maybe_compact()
+            self._db.commit()
+            self._dirty = True
+        return len(ids)
+
+    def _remove_vectors(self, ids, placeholder=False):
+        # Callers hold the lock and commit. Removed from the index with their rows, or tombstoned
+        # where the index can't remove (HNSW, IVF) - `placeholder` adds a row for ids that have none
+        try:
+            self._writable_index().remove_ids(self._np.asarray(ids, dtype="int64"))
+            self._db.executemany("DELETE FROM chunks WHERE id = ?", [(i,) for i in ids])
+        except RuntimeError:
+            if placeholder:
+                self._db.executemany(
+                    "INSERT OR IGNORE INTO chunks (id, payload, deleted) VALUES (?, '{}', 1)", [(i,) for i in ids]
+                )
+            self._db.executemany("UPDATE chunks SET deleted = 1 WHERE id = ?", [(i,) for i in ids])
+            self._tombstones.update(ids)
+
+    def _maybe_compact(self):
+        # Callers hold the lock. Tombstones cost every search an over-fetch of
+        # their number - past FAISS_COMPACT_RATIO of the index, rebuild without them
+        if not self._tombstones or len(self._tombstones) < FAISS_COMPACT_RATIO * self._index.ntotal:
+            return
+        inner = self._faiss.downcast_index(self._index.index)
+        ids = self._faiss.vector_to_array(self._index.id_map)
+        keep = self._np.asarray([int(i) not in self._tombstones for i in ids], dtype=bool)
+        vectors = inner.reconstruct_n(0, inner.ntotal)[keep]
+
+        log_message(f"FAISS: compacting index, dropping {len(self._tombstones)} deleted of {len(ids)} vectors...")
+        self._rebuild(ids[keep], vectors)
+        # The rows stay tombstoned until the compacted index is saved - a crash before that keeps the old one
+        self._compacted |= self._tombstones
+        self._tombstones = set()
+
+    def count(self):
+        with self._lock.read():
+            return self._db.execute("SELECT COUNT(*) FROM chunks WHERE deleted = 0").fetchone()[0]
+
+    def iter_vectors(self, batch_size=1000):
+        if self._index is None:
+            return
+        with self._lock.read():
+            ids = self._faiss.vector_to_array(self._index.id_map)
+        live = [int(i) for i in ids if int(i) not in self._tombstones]
+        for start in range(0, len(live), batch_size):
+            with self._lock.read():
+                stored = self._reconstruct(live[start:start + batch_size])
+            yield list(stored), list(stored.values())
+
+    def iter_payloads(self, batch_size=1000):
+        last_id = -1
+        while True:
+            with self._lock.read():
+                rows = self._db.execute(
+                    "SELECT id, payload FROM chunks WHERE deleted = 0 AND id > ? ORDER BY id LIMIT ?",
+                    (last_id, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield [row[0] for row in rows], [json.loads(row[1]) for row in rows]
+
+    def flush(self):
+        with self._lock.write():
+            if not self._dirty or self._index is None:
+                return
+            tmp_path = f"{self.index_path}.tmp"
+            self._faiss.write_index(self._index, tmp_path)
+            os.replace(tmp_path, self.index_path)
+            self._dirty = False
+            if self._compacted:
+                self._db.executemany("DELETE FROM chunks WHERE id = ?", [(i,) for i in self._compacted])
+                self._db.commit()
+                self._compacted = set()
+        log_message(f"FAISS index saved ({self._index.ntotal} vectors)")
+
+    def close(self):
+        self.flush()
+        self._db.close()
+
+def ivf_nlist(profile: dict):
+    """Number of IVF lists of a profile, None if it isn't an IVF one"""
+    if profile["index_type"].upper() not in ("IVF_FLAT", "IVF_SQ8"):
+        return None
+    return profile.get("params", {}).get("nlist", 1024)
+
+def build_faiss_index(profile: dict, dimension: int, n_training: int = None):
+    """
+    Empty FAISS index (wrapped in an IndexIDMap2) for an index profile.
+    IVF indexes still need training - if `n_training` points are too few for
+    the profile's nlist, the index gets fewer lists.
+    """
+    import faiss
+
+    index_type = profile["index_type"].upper()
+    params = profile.get("params", {})
+    if index_type in ("HNSW", "AUTOINDEX"):
+        inner = faiss.IndexHNSWFlat(dimension, params.get("M", 32), faiss.METRIC_INNER_PRODUCT)
+        inner.hnsw.efConstruction = params.get("efConstruction", 200)
+    elif index_type in ("IVF_FLAT", "IVF_SQ8"):
+        nlist = ivf_nlist(profile)
+        if n_training is not None and n_training < nlist * IVF_MIN_POINTS_PER_LIST:
+            requested, nlist = nlist, max(1, n_training // IVF_MIN_POINTS_PER_LIST)
+            log_message(
+                f"WARNING: {n_training} training points are too few for nlist={requested}, "
+                f"building the {index_type} index with nlist={nlist}"
+            )
+        quantizer = faiss.IndexFlatIP(dimension)
+        if index_type == "IVF_SQ8":
+            inner = faiss.IndexIVFScalarQuantizer(
+                quantizer, dimension, nlist, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT
+            )
+        else:
+            inner = faiss.IndexIVFFlat(quantizer, dimension, nlist, faiss.METRIC_INNER_PRODUCT)
+        inner.own_fields = True     # the IVF index now owns (and keeps alive) its quantizer
+        quantizer.this.disown()
+    elif index_type == "FLAT":
+        inner = faiss.IndexFlatIP(dimension)
+    else:
+        raise ValueError(f"Index type {index_type} is not supported by the FAISS backend")
+
+    log_message(f"Created FAISS {index_type} index (dimension={dimension}, params={params})")
+    return faiss.IndexIDMap2(inner)
+
+def faiss_search_parameters(index, search_params: dict):
+    """
+    Per-call FAISS SearchParameters for ef / nprobe (None if neither applies),
+    passed to index.search(..., params=) instead of changing the shared index
+    """
+    import faiss
+
+    inner = faiss.downcast_index(index.index)
+    if isinstance(inner, faiss.IndexHNSW) and "ef" in search_params:
+        params = faiss.SearchParametersHNSW()
+        params.efSearch = int(search_params["ef"])
+        return params
+    if isinstance(inner, faiss.IndexIVF) and "nprobe" in search_params:
+        params = faiss.SearchParametersIVF()
+        params.nprobe = int(search_params["nprobe"])
+        return params
+    return None
+
+def create_vector_store(collection_name: str, dimension: Callable[[], int]) -> VectorStore:
+    """Build the backend selected by VECTOR_STORE; `dimension` is only called if a collection must be created"""
+    if VECTOR_STORE == "faiss":
+        return FaissVectorStore(os.path.join(FAISS_INDEX_DIR, collection_name))
+    if VECTOR_STORE == "milvus":
+        return MilvusVectorStore(collection_name, dimension, uri=MILVUS_URI, token=ZILLIZ_API_KEY)
+    raise ValueError(f"Unknown VECTOR_STORE '{VECTOR_STORE}', expected 'milvus' or 'faiss'")